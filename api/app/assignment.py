@@ -0,0 +1,78 @@
+import math
+from typing import List, Sequence, Tuple
+
+# Optimal one-to-one assignment (Hungarian algorithm with potentials,
+# O(n^2 * m) for n <= m). Used by the batch matcher to pair passengers with
+# rides so the total detour is minimal across the whole batch rather than
+# first come, first served.
+
+INFEASIBLE = math.inf
+
+
+def solve_assignment(cost: Sequence[Sequence[float]]) -> List[Tuple[int, int]]:
+    """Min-cost matching of rows to columns.
+
+    `cost[i][j]` is the cost of pairing row i with column j, INFEASIBLE where
+    the pair is not allowed. Returns (row, col) pairs; as many feasible pairs
+    as possible are made, and among those the total cost is minimal.
+    """
+    rows = len(cost)
+    cols = len(cost[0]) if rows else 0
+    if not rows or not cols:
+        return []
+
+    transposed = rows > cols
+    matrix = [list(r) for r in (zip(*cost) if transposed else cost)]
+    n, m = len(matrix), len(matrix[0])
+
+    # Infeasible pairs get a penalty larger than any all-feasible total, so
+    # the solver only uses them when a row cannot be matched otherwise
+    finite = [c for r in matrix for c in r if c != INFEASIBLE]
+    penalty = (max(finite, default=0.0) + 1.0) * (n + 1)
+    a = [[penalty if c == INFEASIBLE else c for c in r] for r in matrix]
+
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)  # p[j] = row (1-based) matched to column j
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [math.inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = math.inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                cur = a[i0 - 1][j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    pairs = []
+    for j in range(1, m + 1):
+        if p[j] and matrix[p[j] - 1][j - 1] != INFEASIBLE:
+            row, col = p[j] - 1, j - 1
+            pairs.append((col, row) if transposed else (row, col))
+    pairs.sort()
+    return pairs
@@ -9,7 +9,9 @@ from fastapi_users.authentication import (
     JWTStrategy,
 )
 from motor.motor_asyncio import AsyncIOMotorClient
+from jose import jwt
 from app.config import settings
+from app.identity import TokenCache, invalidate_user
 from beanie import Document
 
 client = AsyncIOMotorClient(settings.MONGODB_URL, uuidRepresentation="standard")
@@ -22,8 +24,20 @@ class User(BeanieBaseUser[uuid.UUID]):
     class Settings:
         name = "users"
 
+class CachingBeanieUserDatabase(BeanieUserDatabase):
+    """Drops cached tokens for a user whenever the user document changes"""
+
+    async def update(self, user, update_dict):
+        user = await super().update(user, update_dict)
+        invalidate_user(user.id)
+        return user
+
+    async def delete(self, user):
+        await super().delete(user)
+        invalidate_user(user.id)
+
 async def get_user_db():
-    yield BeanieUserDatabase(User)
+    yield CachingBeanieUserDatabase(User)
 
 class UserRead(schemas.BaseUser[uuid.UUID]):
     is_driver: bool
@@ -38,8 +52,24 @@ class UserUpdate(schemas.BaseUserUpdate):
 
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
+# Verified token -> loaded User, so current_user skips the JWT check and the
+# Beanie lookup on repeat requests
+_user_cache = TokenCache()
+
+class CachingJWTStrategy(JWTStrategy):
+    async def read_token(self, token, user_manager):
+        if token is None:
+            return None
+        user = _user_cache.get(token)
+        if user is not None:
+            return user
+        user = await super().read_token(token, user_manager)
+        if user is not None:
+            _user_cache.put(token, user.id, user, jwt.get_unverified_claims(token).get("exp"))
+        return user
+
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=settings.SECRET_KEY, lifetime_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    return CachingJWTStrategy(secret=settings.SECRET_KEY, lifetime_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 auth_backend = AuthenticationBackend(
     name="jwt",
@@ -0,0 +1,192 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.assignment import INFEASIBLE, solve_assignment
+from app.config import settings
+from app.database import match_requests_collection, rides_collection
+from app.ride_index import request_window, ride_match_index
+from app.routing import route_estimator
+from app.ride_states import transition
+from app.schemas import RideRequest
+
+# Server-side batch matching. Passengers queue ride requests instead of racing
+# to accept the same few rides from /rides/find; every
+# MATCH_BATCH_WINDOW_SECONDS the matcher takes the oldest
+# MATCH_BATCH_MAX_REQUESTS pending requests, builds a passenger x ride detour
+# cost matrix from the match index candidates and solves it optimally on the
+# default executor, off the event loop. Detours are road times from the shared
+# route estimator, the same ones /rides/find uses. Winners are claimed with the same
+# conditional transition as accept_passenger (so concurrent workers/endpoints
+# can't double-book a ride) and both sides are notified. Unmatched requests
+# stay queued until they expire.
+#
+# Requests live in the match_requests collection, so any API worker can
+# cancel them and they survive restarts. Every worker runs the matcher; before
+# booking, a request is leased with a conditional write (claimed_until), so
+# two workers solving the same batch can't both match it and a cancel can't
+# slip in while it is being booked.
+
+
+def plan(requests: List[RideRequest], candidates: List[Dict[object, dict]],
+         detours: Dict[Tuple[int, object], float]) -> Tuple[List, List[List[float]], List[Tuple[int, int]]]:
+    """Detour cost matrix and optimal assignment; CPU-bound, run in an executor"""
+    rides: Dict[object, dict] = {}
+    for options in candidates:
+        rides.update(options)
+    ride_ids = list(rides)
+    cost = []
+    for row, req in enumerate(requests):
+        limit = req.max_detour_minutes * 60
+        cost.append([
+            detours[row, ride_id] if detours.get((row, ride_id), INFEASIBLE) <= limit else INFEASIBLE
+            for ride_id in ride_ids
+        ])
+    return ride_ids, cost, solve_assignment(cost) if ride_ids else []
+
+
+# claimed_until of a request nobody holds; well before any "now" even at the
+# millisecond precision Mongo stores datetimes with
+UNCLAIMED = datetime(1970, 1, 1)
+
+
+class BatchMatcher:
+    CLAIM_SECONDS = 30  # lease on a request while it is being booked
+
+    def __init__(self, window_seconds: float = settings.MATCH_BATCH_WINDOW_SECONDS,
+                 request_ttl_seconds: int = settings.MATCH_REQUEST_TTL_SECONDS,
+                 max_requests: int = settings.MATCH_BATCH_MAX_REQUESTS):
+        self.window_seconds = window_seconds
+        self.request_ttl_seconds = request_ttl_seconds
+        self.max_requests = max_requests
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, user_id, request: RideRequest) -> str:
+        """Queue a RideRequest for the next tick; replaces the user's earlier request"""
+        now = datetime.utcnow()
+        await match_requests_collection.delete_many({"user_id": user_id, "claimed_until": {"$lt": now}})
+        request_id = uuid.uuid4().hex
+        await match_requests_collection.insert_one({
+            "_id": request_id,
+            "user_id": user_id,
+            "request": request.model_dump(),
+            "created_at": now,
+            "claimed_until": UNCLAIMED,
+            "expires_at": now + timedelta(seconds=self.request_ttl_seconds),
+        })
+        return request_id
+
+    async def cancel(self, request_id: str, user_id) -> bool:
+        """Withdraw a queued request; False if unknown or already being booked"""
+        result = await match_requests_collection.delete_one(
+            {"_id": request_id, "user_id": user_id, "claimed_until": {"$lt": datetime.utcnow()}}
+        )
+        return result.deleted_count == 1
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.window_seconds)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Batch matcher tick failed: {e}")
+
+    async def expire(self, now: datetime) -> int:
+        """Drop expired requests and tell their passengers; returns how many"""
+        from app.routes.notifications import create_notification
+
+        expired = 0
+        async for entry in match_requests_collection.find(
+            {"expires_at": {"$lte": now}, "claimed_until": {"$lt": now}}, {"user_id": 1}
+        ):
+            # Only the worker whose delete wins sends the notification
+            result = await match_requests_collection.delete_one({"_id": entry["_id"], "claimed_until": {"$lt": now}})
+            if result.deleted_count:
+                expired += 1
+                await create_notification(
+                    entry["user_id"], "ride_rejected", "No ride found",
+                    "We couldn't match you with a ride. Please try again.",
+                )
+        return expired
+
+    async def tick(self) -> int:
+        """Match the oldest pending requests once; returns the number of assignments"""
+        from app.routes.notifications import create_notification
+
+        now = datetime.utcnow()
+        await self.expire(now)
+        entries = await match_requests_collection.find(
+            {"claimed_until": {"$lt": now}, "expires_at": {"$gt": now}}
+        ).sort("created_at", 1).limit(self.max_requests).to_list(length=None)
+        if not entries:
+            return 0
+
+        await ride_match_index.ensure_fresh(rides_collection)
+        requests = [RideRequest(**entry["request"]) for entry in entries]
+        candidates = []
+        for req in requests:
+            window = request_window(req.departure_time, req.time_window_minutes)
+            found = ride_match_index.candidates(req.pickup_coords, req.dropoff_coords, req.radius_km, window)
+            candidates.append({ride["_id"]: ride for ride in found[:settings.MATCH_MAX_CANDIDATES]})
+        if not any(candidates):
+            return 0
+
+        # Same road-time detours as /rides/find (route estimator: cached OSRM
+        # legs, its calibrated haversine fallback past the latency budget)
+        pairs = [(row, ride_id) for row, options in enumerate(candidates) for ride_id in options]
+        trips = [
+            (candidates[row][ride_id]["pickup_coords"], candidates[row][ride_id]["dropoff_coords"],
+             requests[row].pickup_coords, requests[row].dropoff_coords)
+            for row, ride_id in pairs
+        ]
+        detours = {pair: seconds for pair, (seconds, _) in zip(pairs, await route_estimator.detours(trips))}
+
+        loop = asyncio.get_running_loop()
+        ride_ids, cost, assignment = await loop.run_in_executor(None, plan, requests, candidates, detours)
+
+        assigned = 0
+        for row, col in assignment:
+            entry, ride = entries[row], candidates[row][ride_ids[col]]
+            leased = await match_requests_collection.find_one_and_update(
+                {"_id": entry["_id"], "claimed_until": {"$lt": now}},
+                {"$set": {"claimed_until": datetime.utcnow() + timedelta(seconds=self.CLAIM_SECONDS)}},
+            )
+            if leased is None:
+                continue  # Cancelled, replaced or booked by another worker since this tick started
+            claimed = await transition(
+                rides_collection, ride["_id"], "pending_driver_acceptance",
+                scope={"passenger_id": None}, expected=["active"],
+                set_fields={"passenger_id": entry["user_id"], "detour_time_seconds": int(cost[row][col])},
+                actor_id=entry["user_id"],
+            )
+            if not claimed:
+                ride_match_index.remove(ride["_id"])
+                # Taken elsewhere since the index was built; release and retry next tick
+                await match_requests_collection.update_one({"_id": entry["_id"]}, {"$set": {"claimed_until": UNCLAIMED}})
+                continue
+            await match_requests_collection.delete_one({"_id": entry["_id"]})
+            assigned += 1
+            await create_notification(
+                entry["user_id"], "ride_matched", "Ride found",
+                "You've been matched with a ride. Waiting for the driver to confirm.",
+                priority="high", ride_id=ride["_id"], from_user_id=ride.get("driver_id"),
+            )
+            await create_notification(
+                ride.get("driver_id"), "ride_request", "New passenger",
+                "A passenger has been matched to your ride.",
+                priority="high", ride_id=ride["_id"], from_user_id=entry["user_id"],
+            )
+        return assigned
+
+
+batch_matcher = BatchMatcher()
@@ -2,12 +2,13 @@ from datetime import datetime, timedelta
 
 from flask import Blueprint, request, jsonify
 from jose import jwt
-from passlib.hash import bcrypt
 from pymongo.errors import DuplicateKeyError
 from bson import ObjectId
 
 from app.config import settings
 from app.db_sync import users_collection
+from app.identity import bearer_token, get_principal
+from app.passwords import PasswordHasherBusy, hash_password, verify_password
 from app.utils import serialize_with_renamed_id
 
 
@@ -21,6 +22,12 @@ except Exception:
 bp = Blueprint("auth", __name__, url_prefix="/auth")
 
 
+@bp.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    """Shed load instead of queueing more bcrypt work than the pool can take"""
+    return jsonify({"detail": "Authentication is busy, please retry"}), 503, {"Retry-After": "1"}
+
+
 def _generate_access_token(user_id: ObjectId, email: str) -> str:
     expire_minutes = int(getattr(settings, "ACCESS_TOKEN_EXPIRE_MINUTES", 30))
     expire = datetime.utcnow() + timedelta(minutes=expire_minutes)
@@ -49,7 +56,7 @@ def register():
         "is_driver": False,
         "is_verified": False,
         "preferences": {},
-        "hashed_password": bcrypt.hash(password),
+        "hashed_password": hash_password(password),
         "created_at": now,
         "updated_at": now,
     }
@@ -83,7 +90,7 @@ def login():
         return jsonify({"detail": "email and password are required"}), 400
 
     user = users_collection.find_one({"email": email})
-    if not user or not user.get("hashed_password") or not bcrypt.verify(password, user["hashed_password"]):
+    if not user or not user.get("hashed_password") or not verify_password(password, user["hashed_password"]):
         return jsonify({"detail": "Invalid credentials"}), 401
 
     token = _generate_access_token(user["_id"], user["email"])
@@ -99,25 +106,17 @@ def login():
 @bp.get("/validate")
 def validate_token():
     """Validate the current user's token"""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
+    token = bearer_token(request.headers.get("Authorization"))
+    if not token:
         return jsonify({"valid": False, "detail": "No valid authorization header"}), 401
     
-    token = auth_header.split(" ")[1]
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        email = payload.get("email")
-        
-        if not user_id or not email:
-            return jsonify({"valid": False, "detail": "Invalid token payload"}), 401
-        
-        # Check if user still exists in database
-        user = users_collection.find_one({"_id": ObjectId(user_id), "email": email})
-        if not user:
+        # Cached principal: signature check and user lookup only on a miss
+        principal = get_principal(token)
+        if not principal:
             return jsonify({"valid": False, "detail": "User not found"}), 401
         
-        return jsonify({"valid": True, "user_id": user_id, "email": email})
+        return jsonify({"valid": True, "user_id": str(principal.user_id), "email": principal.email})
     except jwt.ExpiredSignatureError:
         return jsonify({"valid": False, "detail": "Token expired"}), 401
     except jwt.JWTError:
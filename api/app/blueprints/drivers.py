@@ -2,8 +2,10 @@ from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from datetime import datetime
 from pymongo import ReturnDocument
-from app.db_sync import drivers_collection, rides_collection
+from app.db_sync import client, drivers_collection, outbox_collection, rides_collection
 from app.utils import serialize_doc, serialize_with_renamed_id
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page_sync
+from app.ride_states import transition_sync
 
 bp = Blueprint("drivers", __name__, url_prefix="/driver")
 
@@ -21,8 +23,13 @@ def create_driver_route():
 def get_driver_routes():
     user_id = request.args.get("user_id")
     query = {"driver_id": ObjectId(user_id)} if user_id and ObjectId.is_valid(user_id) else {}
-    routes = [serialize_with_renamed_id(d) for d in drivers_collection.find(query).limit(100)]
-    return jsonify({"routes": routes})
+    try:
+        docs, next_cursor = fetch_page_sync(
+            drivers_collection, query, clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    return jsonify({"routes": [serialize_with_renamed_id(d) for d in docs], "next_cursor": next_cursor})
 
 
 @bp.post("/rides/<ride_id>/accept")
@@ -33,11 +40,12 @@ def accept_ride(ride_id: str):
     driver_id = body.get("driver_id")
     if not driver_id or not ObjectId.is_valid(driver_id):
         return jsonify({"detail": "driver_id required"}), 400
-    result = rides_collection.update_one(
-        {"_id": ObjectId(ride_id), "status": {"$in": ["active", "pending_driver_acceptance"]}},
-        {"$set": {"driver_id": ObjectId(driver_id), "status": "accepted", "updated_at": datetime.utcnow()}}
+    event = transition_sync(
+        client, rides_collection, outbox_collection, ObjectId(ride_id), "accepted",
+        expected=["active", "pending_driver_acceptance"], set_fields={"driver_id": ObjectId(driver_id)},
+        actor_id=ObjectId(driver_id),
     )
-    if result.modified_count == 0:
+    if event is None:
         return jsonify({"detail": "Ride not found or cannot accept"}), 404
     return jsonify({"message": "Ride accepted"})
 
@@ -50,12 +58,13 @@ def update_ride_status(ride_id: str):
     status = body.get("status")
     if status not in ["picked_up", "dropped_off", "completed", "cancelled", "in_progress"]:
         return jsonify({"detail": "Invalid status"}), 400
-    result = rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": status, "updated_at": datetime.utcnow()}}
-    )
-    if result.modified_count == 0:
-        return jsonify({"detail": "Ride not found"}), 404
+    # Same state machine as the API; the outbox event is written with the change
+    event = transition_sync(client, rides_collection, outbox_collection, ObjectId(ride_id), status)
+    if event is None:
+        ride = rides_collection.find_one({"_id": ObjectId(ride_id)}, {"status": 1})
+        if not ride:
+            return jsonify({"detail": "Ride not found"}), 404
+        return jsonify({"detail": f"Cannot change ride status from {ride.get('status')} to {status}"}), 409
     return jsonify({"message": "Status updated"})
 
 
@@ -81,9 +90,14 @@ def list_drivers():
     user_id = request.args.get("user_id")
     if user_id and ObjectId.is_valid(user_id):
         query["user_id"] = ObjectId(user_id)
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [serialize_with_renamed_id(d) for d in drivers_collection.find(query).limit(limit)]
-    return jsonify(docs)
+    try:
+        docs, next_cursor = fetch_page_sync(
+            drivers_collection, query, clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serialize_with_renamed_id(d) for d in docs]), 200, headers
 
 
 @bp.get("/<driver_id>")
@@ -4,26 +4,15 @@ from bson import ObjectId
 from pymongo import GEOSPHERE
 from app.db_sync import locations_collection, rides_collection, drivers_collection
 from app.utils import serialize_with_renamed_id
-from app.config import settings
-from jose import jwt
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page_sync
+from app.identity import current_principal
 
 bp = Blueprint("location", __name__, url_prefix="/location")
 
 def _get_current_user():
     """Extract current user from JWT token"""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return None
-    
-    token = auth_header.split(" ")[1]
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        if user_id and ObjectId.is_valid(user_id):
-            return ObjectId(user_id)
-    except:
-        pass
-    return None
+    principal = current_principal()
+    return principal.user_id if principal else None
 
 def _ensure_location_indexes():
     """Create required indexes if they don't exist"""
@@ -118,13 +107,16 @@ def get_user_recent_locations(user_id: str):
         if not user_ride:
             return jsonify({"detail": "Not authorized to view this user's location"}), 403
     
-    limit = min(int(request.args.get("limit", 10)), 50)
-    locations = list(locations_collection.find(
-        {"user_id": ObjectId(user_id)},
-        sort=[("timestamp", -1)]
-    ).limit(limit))
-    
-    return jsonify([serialize_with_renamed_id(loc) for loc in locations])
+    try:
+        locations, next_cursor = fetch_page_sync(
+            locations_collection, {"user_id": ObjectId(user_id)},
+            clamp_limit(request.args.get("limit"), default=10, maximum=50), request.args.get("cursor"),
+            field="timestamp",
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serialize_with_renamed_id(loc) for loc in locations]), 200, headers
 
 @bp.get("/ride/<ride_id>/participants")
 def get_ride_participants_locations(ride_id: str):
@@ -2,10 +2,13 @@ from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from datetime import datetime
 from pymongo import ReturnDocument
-from app.db_sync import rides_collection
+from app.db_sync import client, outbox_collection, rides_collection, user_profiles_collection
+from app.communities import doc_mask
 from app.utils import serialize_with_renamed_id
-from jose import jwt
-from app.config import settings
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page_sync
+from app.ride_queries import RIDE_USER_INDEXES, find_rides_for_user_sync
+from app.identity import current_principal
+from app.ride_states import transition_sync
 
 bp = Blueprint("rides", __name__, url_prefix="/rides")
 
@@ -45,6 +48,8 @@ def _ensure_indexes_once():
         rides_collection.create_index([("dropoff_location", "2dsphere")])
         rides_collection.create_index("status")
         rides_collection.create_index("created_at")
+        for keys in RIDE_USER_INDEXES:
+            rides_collection.create_index(keys)
     except Exception:
         # Index creation is best-effort; ignore errors to avoid blocking requests
         pass
@@ -55,18 +60,8 @@ _ensure_indexes_once()
 
 def _get_current_user_id():
     """Extract current user ObjectId from JWT Authorization header."""
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        return None
-    token = auth_header.split(" ", 1)[1]
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        if user_id and ObjectId.is_valid(user_id):
-            return ObjectId(user_id)
-    except Exception:
-        return None
-    return None
+    principal = current_principal()
+    return principal.user_id if principal else None
 
 @bp.post("/")
 @bp.post("")
@@ -101,6 +96,11 @@ def create_ride():
         if current_user_id is None:
             return jsonify({"detail": "Authentication required"}), 401
         payload["driver_id"] = current_user_id
+    # Denormalized so community matching can pre-filter rides in the geo query
+    profile = user_profiles_collection.find_one({"user_id": payload["driver_id"]}, {"community_mask": 1, "communities": 1})
+    payload["driver_community_mask"] = doc_mask(profile, "communities")
+    if not payload.get("scheduled_time"):
+        payload["scheduled_time"] = payload.get("pickup_time") or payload["created_at"]
     print(f"Final payload before insert: {payload}")
     res = rides_collection.insert_one(payload)
     doc = rides_collection.find_one({"_id": res.inserted_id})
@@ -149,9 +149,14 @@ def list_rides():
         query["driver_id"] = ObjectId(driver_id)
     if status:
         query["status"] = status
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [serialize_with_renamed_id(d) for d in rides_collection.find(query).limit(limit)]
-    return jsonify(docs)
+    try:
+        docs, next_cursor = fetch_page_sync(
+            rides_collection, query, clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serialize_with_renamed_id(d) for d in docs]), 200, headers
 
 
 @bp.get("/<ride_id>")
@@ -206,12 +211,13 @@ def search_rides():
         query["driver_id"] = ObjectId(driver_id)
     if status:
         query["status"] = status
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [
-        serialize_with_renamed_id(d)
-        for d in rides_collection.find(query).limit(limit)
-    ]
-    return jsonify({"rides": docs})
+    try:
+        docs, next_cursor = fetch_page_sync(
+            rides_collection, query, clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    return jsonify({"rides": [serialize_with_renamed_id(d) for d in docs], "next_cursor": next_cursor})
 
 
 @bp.post("/find")
@@ -436,20 +442,26 @@ def get_user_rides():
     user_id = request.args.get("user_id")
     if not user_id or not ObjectId.is_valid(user_id):
         return jsonify({"detail": "user_id query param required"}), 400
-    query = {"$or": [{"passenger_id": ObjectId(user_id)}, {"driver_id": ObjectId(user_id)}]}
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [serialize_with_renamed_id(d) for d in rides_collection.find(query).limit(limit)]
-    return jsonify({"rides": docs})
+    try:
+        docs, next_cursor = find_rides_for_user_sync(
+            rides_collection, ObjectId(user_id), clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    return jsonify({"rides": [serialize_with_renamed_id(d) for d in docs], "next_cursor": next_cursor})
 
 @bp.get("/user/<user_id>")
 def get_user_rides_by_id(user_id: str):
     """Get rides for a specific user by ID in the URL path"""
     if not ObjectId.is_valid(user_id):
         return jsonify({"detail": "Invalid user ID"}), 400
-    query = {"$or": [{"passenger_id": ObjectId(user_id)}, {"driver_id": ObjectId(user_id)}]}
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [serialize_with_renamed_id(d) for d in rides_collection.find(query).limit(limit)]
-    return jsonify({"rides": docs})
+    try:
+        docs, next_cursor = find_rides_for_user_sync(
+            rides_collection, ObjectId(user_id), clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    return jsonify({"rides": [serialize_with_renamed_id(d) for d in docs], "next_cursor": next_cursor})
 
 
 @bp.post("/<ride_id>/request")
@@ -469,19 +481,13 @@ def request_ride_route(ride_id: str):
     if not ride:
         return jsonify({"detail": "Ride not found or not available"}), 404
     
-    # Update ride to pending status with passenger_id
-    update = {
-        "passenger_id": ObjectId(passenger_id),
-        "status": "pending",
-        "updated_at": datetime.utcnow()
-    }
-    
-    result = rides_collection.update_one(
-        {"_id": ObjectId(ride_id), "status": "active"},
-        {"$set": update}
+    # Move the ride to pending with passenger_id
+    event = transition_sync(
+        client, rides_collection, outbox_collection, ObjectId(ride_id), "pending",
+        expected=["active"], set_fields={"passenger_id": ObjectId(passenger_id)}, actor_id=ObjectId(passenger_id),
     )
     
-    if result.modified_count == 0:
+    if event is None:
         return jsonify({"detail": "Ride not found or already has a passenger"}), 404
     
     return jsonify({"success": True, "message": "Ride request sent successfully"})
@@ -509,18 +515,13 @@ def accept_passenger_request_route(ride_id: str):
     if not ride:
         return jsonify({"detail": "Ride request not found or already processed"}), 404
     
-    # Update ride to accepted status
-    update = {
-        "status": "accepted",
-        "updated_at": datetime.utcnow()
-    }
-    
-    result = rides_collection.update_one(
-        {"_id": ObjectId(ride_id), "status": "pending", "passenger_id": ObjectId(passenger_id)},
-        {"$set": update}
+    # Move the ride to accepted
+    event = transition_sync(
+        client, rides_collection, outbox_collection, ObjectId(ride_id), "accepted",
+        scope={"passenger_id": ObjectId(passenger_id)}, expected=["pending"],
     )
     
-    if result.modified_count == 0:
+    if event is None:
         return jsonify({"detail": "Failed to accept passenger request"}), 404
     
     return jsonify({"success": True, "message": "Passenger request accepted successfully"})
@@ -532,14 +533,16 @@ def accept_ride_route(ride_id: str):
         return jsonify({"detail": "Invalid ride ID"}), 400
     body = request.get_json(silent=True) or {}
     driver_id = body.get("driver_id") or request.args.get("driver_id")
-    update = {"status": "accepted", "updated_at": datetime.utcnow()}
-    query = {"_id": ObjectId(ride_id), "status": {"$in": ["active", "pending_driver_acceptance", "pending", "in_progress"]}}
+    set_fields = {}
     if driver_id and ObjectId.is_valid(driver_id):
-        update["driver_id"] = ObjectId(driver_id)
-    result = rides_collection.update_one(query, {"$set": update})
-    if result.modified_count == 0:
+        set_fields["driver_id"] = ObjectId(driver_id)
+    event = transition_sync(
+        client, rides_collection, outbox_collection, ObjectId(ride_id), "accepted",
+        expected=["active", "pending_driver_acceptance", "pending"], set_fields=set_fields,
+        actor_id=set_fields.get("driver_id"),
+    )
+    if event is None:
         return jsonify({"detail": "Ride not found or cannot accept"}), 404
-    doc = rides_collection.find_one({"_id": ObjectId(ride_id)})
     return jsonify({"message": "Ride accepted successfully"})
 
 
@@ -551,13 +554,12 @@ def update_ride_status_route(ride_id: str):
     status = body.get("status")
     if status not in ["picked_up", "dropped_off", "completed", "cancelled", "in_progress", "accepted", "pending"]:
         return jsonify({"detail": "Invalid status"}), 400
-    result = rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": status, "updated_at": datetime.utcnow()}},
-    )
-    if result.modified_count == 0:
-        return jsonify({"detail": "Ride not found or no change"}), 404
-    doc = rides_collection.find_one({"_id": ObjectId(ride_id)})
+    event = transition_sync(client, rides_collection, outbox_collection, ObjectId(ride_id), status)
+    if event is None:
+        ride = rides_collection.find_one({"_id": ObjectId(ride_id)}, {"status": 1})
+        if not ride:
+            return jsonify({"detail": "Ride not found"}), 404
+        return jsonify({"detail": f"Cannot change ride status from {ride.get('status')} to {status}"}), 409
     return jsonify({"message": "Ride status updated successfully"})
 
 
@@ -572,9 +574,13 @@ def get_my_rides():
             return jsonify({"detail": "Authentication required or user_id param missing"}), 401
         current_user_id = ObjectId(user_id_param)
 
-    query = {"$or": [{"passenger_id": current_user_id}, {"driver_id": current_user_id}]}
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [serialize_with_renamed_id(d) for d in rides_collection.find(query).limit(limit)]
-    return jsonify(docs)
+    try:
+        docs, next_cursor = find_rides_for_user_sync(
+            rides_collection, current_user_id, clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serialize_with_renamed_id(d) for d in docs]), 200, headers
 
 
@@ -3,6 +3,7 @@ from bson import ObjectId
 from datetime import datetime
 from app.db_sync import emergency_alerts_collection, rides_collection
 from app.utils import serialize_doc
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page_sync
 
 bp = Blueprint("safety", __name__, url_prefix="/safety")
 
@@ -43,7 +44,14 @@ def resolve_emergency(alert_id: str):
 
 @bp.get("/emergency/active")
 def active_emergencies():
-    alerts = [serialize_doc(d) for d in emergency_alerts_collection.find({"status": "active"}).limit(100)]
-    return jsonify(alerts)
+    try:
+        docs, next_cursor = fetch_page_sync(
+            emergency_alerts_collection, {"status": "active"},
+            clamp_limit(request.args.get("limit")), request.args.get("cursor"), field="timestamp",
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serialize_doc(d) for d in docs]), 200, headers
 
 
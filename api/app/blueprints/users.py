@@ -4,7 +4,9 @@ from datetime import datetime
 from pymongo import ReturnDocument
 
 from app.db_sync import users_collection
+from app.identity import invalidate_user
 from app.utils import serialize_with_renamed_id
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page_sync
 
 
 bp = Blueprint("users", __name__, url_prefix="/users")
@@ -24,9 +26,14 @@ def create_user():
 
 @bp.get("/")
 def list_users():
-    limit = min(int(request.args.get("limit", 50)), 200)
-    docs = [serialize_with_renamed_id(d) for d in users_collection.find().limit(limit)]
-    return jsonify(docs)
+    try:
+        docs, next_cursor = fetch_page_sync(
+            users_collection, {}, clamp_limit(request.args.get("limit")), request.args.get("cursor")
+        )
+    except InvalidCursor:
+        return jsonify({"detail": "Invalid cursor"}), 400
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serialize_with_renamed_id(d) for d in docs]), 200, headers
 
 
 @bp.get("/<user_id>")
@@ -52,6 +59,7 @@ def update_user(user_id: str):
     )
     if not doc:
         return jsonify({"detail": "User not found"}), 404
+    invalidate_user(doc["_id"])
     return jsonify(serialize_with_renamed_id(doc))
 
 
@@ -78,6 +86,7 @@ def update_profile():
     )
     if not doc:
         return jsonify({"detail": "User not found"}), 404
+    invalidate_user(doc["_id"])
     return jsonify(serialize_with_renamed_id(doc))
 
 
@@ -88,6 +97,7 @@ def delete_user(user_id: str):
     result = users_collection.delete_one({"_id": ObjectId(user_id)})
     if result.deleted_count == 0:
         return jsonify({"detail": "User not found"}), 404
+    invalidate_user(user_id)
     return jsonify({"deleted": True})
 
 
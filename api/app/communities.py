@@ -0,0 +1,49 @@
+from typing import Iterable, List, Optional
+
+# Community vocabulary and its bitmask encoding. Membership is stored as an
+# integer `community_mask` next to the name lists on user_profiles
+# (`communities`) and community_filters (`preferred_communities`), and
+# denormalized onto rides as `driver_community_mask` so the geo query can
+# pre-filter with $bitsAnySet. Bit i is COMMUNITIES[i]: only ever append.
+
+COMMUNITIES = [
+    "university",
+    "workplace",
+    "neighborhood",
+    "gym",
+    "shopping_center",
+    "hospital",
+    "airport",
+    "train_station",
+    "school",
+    "church",
+]
+
+COMMUNITY_BITS = {name: 1 << i for i, name in enumerate(COMMUNITIES)}
+
+
+def community_mask(names: Optional[Iterable[str]]) -> int:
+    """Encode community names as a bitmask; unknown names are ignored"""
+    mask = 0
+    for name in names or ():
+        mask |= COMMUNITY_BITS.get(name, 0)
+    return mask
+
+
+def mask_communities(mask: int) -> List[str]:
+    return [name for name, bit in COMMUNITY_BITS.items() if mask & bit]
+
+
+def doc_mask(doc: Optional[dict], names_field: str) -> int:
+    """Stored mask of a profile/filter doc, computed from names for legacy docs"""
+    if not doc:
+        return 0
+    mask = doc.get("community_mask")
+    if mask is None:
+        return community_mask(doc.get(names_field))
+    return mask
+
+
+def shared_community_counts(mask: int, masks: Iterable[int]) -> List[int]:
+    """Popcount of mask & m for every candidate mask"""
+    return [(mask & m).bit_count() for m in masks]
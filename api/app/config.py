@@ -11,6 +11,15 @@ class Settings(BaseSettings):
     # JWT Configuration
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    AUTH_CACHE_TTL_SECONDS: int = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))  # 0 disables the token cache
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Password Hashing Configuration
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # processes per gunicorn worker
+    PASSWORD_HASH_QUEUE_DEPTH: int = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "2"))
+    GUNICORN_THREADS: int = int(os.getenv("GUNICORN_THREADS", "8"))  # request threads per gunicorn worker
+    PASSWORD_HASH_TIMEOUT: float = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))  # seconds
     
     # OSRM Configuration
     OSRM_URL: str = os.getenv("OSRM_URL", "http://router.project-osrm.org")
@@ -55,9 +64,65 @@ class Settings(BaseSettings):
     MAX_ROUTE_OPTIMIZATION_STOPS: int = int(os.getenv("MAX_ROUTE_OPTIMIZATION_STOPS", "20"))
     OPTIMIZATION_TIMEOUT: int = int(os.getenv("OPTIMIZATION_TIMEOUT", "30"))  # seconds
     
+    # Ride Matching Configuration
+    MATCH_CELL_DEG: float = float(os.getenv("MATCH_CELL_DEG", "0.05"))  # grid cell size (~5.5 km)
+    MATCH_SLOT_MINUTES: int = int(os.getenv("MATCH_SLOT_MINUTES", "30"))  # departure time slot width
+    MATCH_INDEX_REFRESH_SECONDS: int = int(os.getenv("MATCH_INDEX_REFRESH_SECONDS", "30"))
+    MATCH_MAX_CANDIDATES: int = int(os.getenv("MATCH_MAX_CANDIDATES", "20"))  # rides scored for detour
+    MATCH_BATCH_WINDOW_SECONDS: float = float(os.getenv("MATCH_BATCH_WINDOW_SECONDS", "2"))  # batch matcher tick
+    MATCH_REQUEST_TTL_SECONDS: int = int(os.getenv("MATCH_REQUEST_TTL_SECONDS", "120"))  # queued request lifetime
+    MATCH_BATCH_MAX_REQUESTS: int = int(os.getenv("MATCH_BATCH_MAX_REQUESTS", "200"))  # oldest requests solved per tick
+    SEAT_HOLD_SECONDS: int = int(os.getenv("SEAT_HOLD_SECONDS", "120"))  # max seat hold before confirm
+    
+    # Surge Pricing Configuration
+    SURGE_CELL_DEG: float = float(os.getenv("SURGE_CELL_DEG", "0.02"))  # grid cell size (~2 km)
+    SURGE_WINDOW_SECONDS: int = int(os.getenv("SURGE_WINDOW_SECONDS", "600"))  # demand/supply sliding window
+    SURGE_TICK_SECONDS: float = float(os.getenv("SURGE_TICK_SECONDS", "15"))  # multiplier recompute interval
+    SURGE_SMOOTHING: float = float(os.getenv("SURGE_SMOOTHING", "0.3"))  # weight of the newest tick (0-1)
+    SURGE_SENSITIVITY: float = float(os.getenv("SURGE_SENSITIVITY", "0.5"))  # multiplier gain per unit of excess demand
+    SURGE_MAX_MULTIPLIER: float = float(os.getenv("SURGE_MAX_MULTIPLIER", "2.5"))
+    
+    # Price Quote Configuration
+    QUOTE_TTL_SECONDS: int = int(os.getenv("QUOTE_TTL_SECONDS", "300"))  # how long a quoted price can be booked
+    ESTIMATE_SAMPLE_RATE: float = float(os.getenv("ESTIMATE_SAMPLE_RATE", "0.05"))  # share of estimates kept for analytics
+    ESTIMATE_FLUSH_SECONDS: float = float(os.getenv("ESTIMATE_FLUSH_SECONDS", "10"))
+    ESTIMATE_FLUSH_BATCH: int = int(os.getenv("ESTIMATE_FLUSH_BATCH", "500"))  # max sampled estimates buffered
+    
+    # Route Distance Configuration
+    ROUTE_LATENCY_BUDGET_MS: float = float(os.getenv("ROUTE_LATENCY_BUDGET_MS", "150"))  # OSRM wait before falling back
+    ROUTE_OSRM_TIMEOUT_SECONDS: float = float(os.getenv("ROUTE_OSRM_TIMEOUT_SECONDS", "5"))  # background fetch limit
+    ROUTE_CACHE_CELL_DEG: float = float(os.getenv("ROUTE_CACHE_CELL_DEG", "0.005"))  # corridor endpoint cell (~500 m)
+    ROUTE_CACHE_TTL_SECONDS: int = int(os.getenv("ROUTE_CACHE_TTL_SECONDS", "3600"))
+    ROUTE_CACHE_MAX_ENTRIES: int = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "50000"))
+    ROUTE_DETOUR_FACTOR: float = float(os.getenv("ROUTE_DETOUR_FACTOR", "1.3"))  # initial road/straight-line ratio
+    ROUTE_FALLBACK_SPEED_KMH: float = float(os.getenv("ROUTE_FALLBACK_SPEED_KMH", "30"))  # initial average speed
+    
+    # Earnings Configuration
+    EARNINGS_SUMMARY_FROM_ROLLUP: bool = os.getenv("EARNINGS_SUMMARY_FROM_ROLLUP", "false").lower() == "true"  # serve /earnings/summary from driver_earnings_daily
+    
     # Notification Configuration
     NOTIFICATION_RETENTION_DAYS: int = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
     MAX_NOTIFICATIONS_PER_USER: int = int(os.getenv("MAX_NOTIFICATIONS_PER_USER", "1000"))
+    NOTIFICATION_UNREAD_CACHE_SECONDS: float = float(os.getenv("NOTIFICATION_UNREAD_CACHE_SECONDS", "5"))  # per-process count cache
+    NOTIFICATION_RECONCILE_SECONDS: float = float(os.getenv("NOTIFICATION_RECONCILE_SECONDS", "3600"))  # unread counter recount
+    NOTIFICATION_TRIM_SECONDS: float = float(os.getenv("NOTIFICATION_TRIM_SECONDS", "300"))  # cap check for recent recipients
+    NOTIFICATION_TRIM_SWEEP_SECONDS: float = float(os.getenv("NOTIFICATION_TRIM_SWEEP_SECONDS", "86400"))  # cap check for all users
+    NOTIFICATION_COALESCE_SECONDS: float = float(os.getenv("NOTIFICATION_COALESCE_SECONDS", "60"))  # same-ride merge window
+    NOTIFICATION_DIGEST_TYPES: str = os.getenv("NOTIFICATION_DIGEST_TYPES", "promotion,system_update")  # comma-separated
+    NOTIFICATION_DIGEST_SECONDS: float = float(os.getenv("NOTIFICATION_DIGEST_SECONDS", "3600"))
+    NOTIFICATION_PUSH_TRANSPORT: str = os.getenv("NOTIFICATION_PUSH_TRANSPORT", "websocket")  # websocket or stub
+    
+    # Feedback Configuration
+    FEEDBACK_ANALYTICS_CACHE_SECONDS: int = int(os.getenv("FEEDBACK_ANALYTICS_CACHE_SECONDS", "60"))  # platform report TTL
+    
+    # Outbox Configuration (async side effects)
+    OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "2"))  # worker tasks per API process, 0 disables
+    OUTBOX_POLL_SECONDS: float = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))  # idle poll interval
+    OUTBOX_LEASE_SECONDS: int = int(os.getenv("OUTBOX_LEASE_SECONDS", "60"))  # claim lifetime before retry
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    OUTBOX_BACKOFF_BASE_SECONDS: float = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "2"))
+    OUTBOX_BACKOFF_MAX_SECONDS: float = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "300"))
+    OUTBOX_RETENTION_DAYS: int = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))  # processed events kept
     
     class Config:
         env_file = ".env"
@@ -1,5 +1,7 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
 from app.config import settings
+from app.ride_queries import RIDE_USER_INDEXES
 
 client = AsyncIOMotorClient(settings.MONGODB_URL)
 database = client[settings.MONGODB_DB]
@@ -16,12 +18,48 @@ environmental_metrics_collection = database.environmental_metrics
 community_filters_collection = database.community_filters
 feedback_collection = database.feedback
 notifications_collection = database.notifications
+notification_state_collection = database.notification_state
+notification_digest_queue_collection = database.notification_digest_queue
 scheduled_rides_collection = database.scheduled_rides
 ride_preferences_collection = database.ride_preferences
 pricing_estimates_collection = database.pricing_estimates
 driver_earnings_collection = database.driver_earnings
+driver_payouts_collection = database.driver_payouts
+driver_earnings_daily_collection = database.driver_earnings_daily
 ride_cancellations_collection = database.ride_cancellations
 ride_analytics_collection = database.ride_analytics
+outbox_collection = database.outbox
+match_requests_collection = database.match_requests
+
+async def ensure_ttl_index(collection, field: str, expire_after_seconds: int):
+    """Make the single-field index on `field` a TTL index with the given expiry
+
+    An existing plain or differently-timed index on the field is replaced,
+    since create_index refuses to change the options of an existing index.
+    """
+    name = f"{field}_1"
+    existing = (await collection.index_information()).get(name)
+    if existing and existing.get("expireAfterSeconds") != expire_after_seconds:
+        await collection.drop_index(name)
+    await collection.create_index(field, expireAfterSeconds=expire_after_seconds)
+
+async def ensure_unique_index(collection, field: str):
+    """Make the single-field index on `field` unique, replacing a plain one
+
+    If existing documents already collide, a plain index is put back and the
+    duplicates are reported; deduplicate them and restart.
+    """
+    name = f"{field}_1"
+    existing = (await collection.index_information()).get(name)
+    if existing and existing.get("unique"):
+        return
+    if existing:
+        await collection.drop_index(name)
+    try:
+        await collection.create_index(field, unique=True)
+    except DuplicateKeyError as e:
+        print(f"Cannot make {collection.name}.{field} unique, duplicates exist: {e}")
+        await collection.create_index(field)
 
 async def create_indexes():
     """Create database indexes for optimal performance"""
@@ -36,8 +74,13 @@ async def create_indexes():
     await rides_collection.create_index("passenger_id")
     await rides_collection.create_index("status")
     await rides_collection.create_index("created_at")
+    await rides_collection.create_index([("created_at", -1), ("_id", -1)])
+    for keys in RIDE_USER_INDEXES:
+        await rides_collection.create_index(keys)
     await rides_collection.create_index("pickup_coords", "2dsphere")
     await rides_collection.create_index("dropoff_coords", "2dsphere")
+    await rides_collection.create_index([("pickup_coords", "2dsphere"), ("driver_community_mask", 1)])
+    await rides_collection.create_index([("status", 1), ("scheduled_time", 1), ("pickup_coords", "2dsphere")])
     await rides_collection.create_index("pickup_time")
     await rides_collection.create_index("dropoff_time")
     await rides_collection.create_index("rating")
@@ -64,6 +107,7 @@ async def create_indexes():
     await locations_collection.create_index("coordinates", "2dsphere")
     await locations_collection.create_index("timestamp")
     await locations_collection.create_index("ride_id")
+    await locations_collection.create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)])
     
     # Emergency alerts collection indexes
     await emergency_alerts_collection.create_index("user_id")
@@ -78,10 +122,11 @@ async def create_indexes():
     await user_profiles_collection.create_index("rating")
     await user_profiles_collection.create_index("is_verified")
     await user_profiles_collection.create_index("communities")
+    await user_profiles_collection.create_index("community_mask")
     await user_profiles_collection.create_index("current_location", "2dsphere")
     
     # Environmental metrics collection indexes
-    await environmental_metrics_collection.create_index("ride_id")
+    await ensure_unique_index(environmental_metrics_collection, "ride_id")
     await environmental_metrics_collection.create_index("user_id")
     await environmental_metrics_collection.create_index("created_at")
     await environmental_metrics_collection.create_index("co2_saved_kg")
@@ -89,6 +134,7 @@ async def create_indexes():
     # Community filters collection indexes
     await community_filters_collection.create_index("user_id", unique=True)
     await community_filters_collection.create_index("preferred_communities")
+    await community_filters_collection.create_index("community_mask")
     await community_filters_collection.create_index("trust_score_threshold")
     await community_filters_collection.create_index("max_distance_km")
     await community_filters_collection.create_index("pickup_coords", "2dsphere")
@@ -100,15 +146,25 @@ async def create_indexes():
     await feedback_collection.create_index("rating")
     await feedback_collection.create_index("created_at")
     await feedback_collection.create_index("updated_at")
+    await feedback_collection.create_index([("to_user_id", 1), ("created_at", -1), ("_id", -1)])
+    await feedback_collection.create_index([("ride_id", 1), ("created_at", -1), ("_id", -1)])
     
     # Notifications collection indexes
     await notifications_collection.create_index("to_user_id")
     await notifications_collection.create_index("from_user_id")
     await notifications_collection.create_index("notification_type")
     await notifications_collection.create_index("is_read")
-    await notifications_collection.create_index("created_at")
+    await ensure_ttl_index(notifications_collection, "created_at", settings.NOTIFICATION_RETENTION_DAYS * 86400)
     await notifications_collection.create_index("priority")
     await notifications_collection.create_index("ride_id")
+    await notifications_collection.create_index([("to_user_id", 1), ("created_at", -1), ("_id", -1)])
+    await notifications_collection.create_index("dedupe_key", unique=True, sparse=True)
+    await notifications_collection.create_index(
+        "coalesce_key", unique=True,
+        partialFilterExpression={"coalesce_key": {"$exists": True}, "is_read": False}
+    )
+    await notification_state_collection.create_index("user_id", unique=True)
+    await notification_digest_queue_collection.create_index("queued_at")
     
     # Scheduled rides collection indexes
     await scheduled_rides_collection.create_index("driver_id")
@@ -129,13 +185,23 @@ async def create_indexes():
     await pricing_estimates_collection.create_index("ride_id")
     await pricing_estimates_collection.create_index("estimated_at")
     await pricing_estimates_collection.create_index("surge_multiplier")
+    await pricing_estimates_collection.create_index("quote_id", unique=True, sparse=True)
     
     # Driver earnings collection indexes
     await driver_earnings_collection.create_index("driver_id")
-    await driver_earnings_collection.create_index("ride_id")
+    await ensure_unique_index(driver_earnings_collection, "ride_id")
     await driver_earnings_collection.create_index("payment_status")
     await driver_earnings_collection.create_index("payout_date")
     await driver_earnings_collection.create_index("created_at")
+    await driver_earnings_collection.create_index([("driver_id", 1), ("created_at", -1), ("_id", -1)])
+    await driver_earnings_collection.create_index([("payment_status", 1), ("driver_id", 1), ("created_at", 1)])
+    
+    # Driver earnings daily rollup indexes
+    await driver_earnings_daily_collection.create_index([("driver_id", 1), ("day", 1)], unique=True)
+    
+    # Driver payouts collection indexes
+    await driver_payouts_collection.create_index([("run_id", 1), ("driver_id", 1)], unique=True)
+    await driver_payouts_collection.create_index([("driver_id", 1), ("created_at", -1)])
     
     # Ride cancellations collection indexes
     await ride_cancellations_collection.create_index("ride_id")
@@ -149,4 +215,16 @@ async def create_indexes():
     await ride_analytics_collection.create_index("period_end")
     await ride_analytics_collection.create_index("created_at")
     
+    # Match requests collection indexes
+    await match_requests_collection.create_index("user_id")
+    await match_requests_collection.create_index([("claimed_until", 1), ("created_at", 1)])
+    await match_requests_collection.create_index("expires_at")
+    
+    # Outbox collection indexes
+    await outbox_collection.create_index([("status", 1), ("available_at", 1)])
+    await outbox_collection.create_index(
+        [("parent_id", 1), ("handler", 1)], unique=True, partialFilterExpression={"parent_id": {"$exists": True}}
+    )
+    await outbox_collection.create_index("processed_at", expireAfterSeconds=settings.OUTBOX_RETENTION_DAYS * 86400)
+    
     print("Database indexes created successfully")
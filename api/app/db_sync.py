@@ -1,5 +1,6 @@
 from pymongo import MongoClient
 from app.config import settings
+from app.ride_queries import RIDE_USER_INDEXES
 
 client = MongoClient(settings.MONGODB_URL)
 db = client[settings.MONGODB_DB]
@@ -15,6 +16,7 @@ environmental_metrics_collection = db.environmental_metrics
 community_filters_collection = db.community_filters
 feedback_collection = db.feedback
 notifications_collection = db.notifications
+outbox_collection = db.outbox
 
 def create_indexes():
     """Create database indexes for optimal performance"""
@@ -25,6 +27,9 @@ def create_indexes():
     rides_collection.create_index("passenger_id")
     rides_collection.create_index("status")
     rides_collection.create_index("created_at")
+    rides_collection.create_index([("created_at", -1), ("_id", -1)])
+    for keys in RIDE_USER_INDEXES:
+        rides_collection.create_index(keys)
     rides_collection.create_index([("pickup_location", "2dsphere")])
     rides_collection.create_index([("dropoff_location", "2dsphere")])
     rides_collection.create_index("pickup_time")
@@ -35,6 +40,7 @@ def create_indexes():
     locations_collection.create_index([("coordinates", "2dsphere")])
     locations_collection.create_index("timestamp")
     locations_collection.create_index("ride_id")
+    locations_collection.create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)])
     
     # Drivers collection indexes
     drivers_collection.create_index("driver_id")
@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+# Driver earnings summaries, computed server side.
+#
+# Live: one aggregation over driver_earnings on the (driver_id, created_at)
+# index, with the driver's completed-ride count unioned in from rides (same
+# index there) and folded into the single result row.
+#
+# Rollup: every earnings record is also added to a per-driver, per-UTC-day
+# document in `driver_earnings_daily` when it is booked, so a summary reads at
+# most one document per day of the period. Rollup summaries start at midnight
+# of the first day and count rides as booked earnings.
+# `scripts/rebuild_earnings_rollup.py` rebuilds the rollup from scratch.
+
+DAY_FORMAT = "%Y-%m-%d"
+
+TOTALS = {
+    "gross_earnings": {"$sum": "$gross_earnings"},
+    "platform_fees": {"$sum": "$platform_fees"},
+    "net_earnings": {"$sum": "$net_earnings"},
+    "rides": {"$sum": "$rides"},
+}
+
+
+def day_key(moment: datetime) -> str:
+    return moment.strftime(DAY_FORMAT)
+
+
+def rollup_increment(earnings: dict) -> Tuple[dict, dict]:
+    """(filter, update) adding one earnings record to its driver's day"""
+    return (
+        {"driver_id": earnings["driver_id"], "day": day_key(earnings["created_at"])},
+        {"$inc": {
+            "gross_earnings": earnings["gross_earnings"],
+            "platform_fees": earnings["platform_fee"],
+            "net_earnings": earnings["net_earnings"],
+            "rides": 1,
+        }},
+    )
+
+
+def summary_pipeline(driver_id, start_date: datetime) -> list:
+    """Earnings totals and completed-ride count since `start_date` as one row"""
+    return [
+        {"$match": {"driver_id": driver_id, "created_at": {"$gte": start_date}}},
+        {"$group": {
+            "_id": None,
+            "gross_earnings": {"$sum": "$gross_earnings"},
+            "platform_fees": {"$sum": "$platform_fee"},
+            "net_earnings": {"$sum": "$net_earnings"},
+        }},
+        {"$unionWith": {"coll": "rides", "pipeline": [
+            {"$match": {"driver_id": driver_id, "created_at": {"$gte": start_date}, "status": "completed"}},
+            {"$count": "rides"},
+        ]}},
+        {"$group": {"_id": None, **TOTALS}},
+    ]
+
+
+def rollup_summary_pipeline(driver_id, start_date: datetime) -> list:
+    """Same totals read from the daily rollup"""
+    return [
+        {"$match": {"driver_id": driver_id, "day": {"$gte": day_key(start_date)}}},
+        {"$group": {"_id": None, **TOTALS}},
+    ]
+
+
+def rebuild_rollup_pipeline() -> list:
+    """Recompute every driver/day bucket from driver_earnings into the rollup"""
+    return [
+        {"$group": {
+            "_id": {
+                "driver_id": "$driver_id",
+                "day": {"$dateToString": {"format": DAY_FORMAT, "date": "$created_at"}},
+            },
+            "gross_earnings": {"$sum": "$gross_earnings"},
+            "platform_fees": {"$sum": "$platform_fee"},
+            "net_earnings": {"$sum": "$net_earnings"},
+            "rides": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "driver_id": "$_id.driver_id",
+            "day": "$_id.day",
+            "gross_earnings": 1,
+            "platform_fees": 1,
+            "net_earnings": 1,
+            "rides": 1,
+        }},
+        {"$merge": {
+            "into": "driver_earnings_daily",
+            "on": ["driver_id", "day"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def summary_totals(row: Optional[dict]) -> dict:
+    row = row or {}
+    return {field: row.get(field, 0) for field in TOTALS}
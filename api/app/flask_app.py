@@ -1,6 +1,9 @@
 from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from datetime import datetime
+from app.pagination import NEXT_CURSOR_HEADER
+from app import serialization
 try:
     # Reuse existing settings for env variables
     from app.config import settings
@@ -8,13 +11,30 @@ try:
 except Exception:
     cors_origins = ["*"]
 
+
+class MongoJSONProvider(DefaultJSONProvider):
+    """jsonify() backed by orjson, encoding ObjectId/datetime natively"""
+
+    def dumps(self, obj, **kwargs):
+        return serialization.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return serialization.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumps(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = MongoJSONProvider(app)
 
 # CORS setup
 CORS(
     app,
     resources={r"/*": {"origins": cors_origins}},
-    supports_credentials=True
+    supports_credentials=True,
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from bson import ObjectId
+from jose import jwt
+
+from app.config import settings
+
+# Shared auth layer: a bounded TTL cache of verified bearer token -> principal
+# so hot endpoints skip the JWT signature check and the user lookup on repeat
+# calls. Entries never outlive the token's own `exp`, and user writes call
+# `invalidate_user`. Caches are per process; other gunicorn workers fall back
+# to AUTH_CACHE_TTL_SECONDS for staleness.
+
+_caches = []
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: ObjectId
+    email: Optional[str] = None
+    is_driver: bool = False
+    is_verified_driver: bool = False
+
+
+class TokenCache:
+    """Thread-safe LRU of token -> value with per-entry expiry"""
+
+    def __init__(self, max_entries: int = settings.AUTH_CACHE_MAX_ENTRIES,
+                 ttl_seconds: int = settings.AUTH_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # token -> (expires_at, user_key, value)
+        self._by_user = {}  # user_key -> {token, ...}
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    def get(self, token: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry[2]
+
+    def put(self, token: str, user_id, value: Any, expires_at: Optional[float] = None) -> None:
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        deadline = time.time() + self.ttl_seconds
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        user_key = str(user_id)
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (deadline, user_key, value)
+            self._by_user.setdefault(user_key, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id) -> None:
+        with self._lock:
+            for token in list(self._by_user.get(str(user_id), ())):
+                self._remove(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user.get(entry[1])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[entry[1]]
+
+
+principal_cache = TokenCache()
+
+
+def invalidate_user(user_id) -> None:
+    """Drop every cached identity for `user_id` (call after user writes)"""
+    for cache in _caches:
+        cache.invalidate_user(user_id)
+
+
+def bearer_token(auth_header: Optional[str]) -> Optional[str]:
+    if not auth_header or not auth_header.startswith("Bearer "):
+        return None
+    return auth_header.split(" ", 1)[1] or None
+
+
+def get_principal(token: str) -> Optional[Principal]:
+    """Resolve a bearer token to its Principal, verifying it on a cache miss.
+
+    Raises jose's ExpiredSignatureError/JWTError for bad tokens and returns
+    None when the token's user no longer exists.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    user_id = payload.get("sub")
+    if not user_id or not ObjectId.is_valid(user_id):
+        raise jwt.JWTError("Invalid token payload")
+
+    from app.db_sync import users_collection
+    user = users_collection.find_one(
+        {"_id": ObjectId(user_id)},
+        {"email": 1, "is_driver": 1, "is_verified_driver": 1},
+    )
+    email = payload.get("email")
+    if not user or (email and user.get("email") != email):
+        return None
+
+    principal = Principal(
+        user_id=user["_id"],
+        email=user.get("email"),
+        is_driver=bool(user.get("is_driver")),
+        is_verified_driver=bool(user.get("is_verified_driver")),
+    )
+    principal_cache.put(token, principal.user_id, principal, payload.get("exp"))
+    return principal
+
+
+def current_principal() -> Optional[Principal]:
+    """Principal for the current Flask request, resolved at most once per request"""
+    from flask import g, request
+
+    if "principal" not in g:
+        token = bearer_token(request.headers.get("Authorization"))
+        try:
+            g.principal = get_principal(token) if token else None
+        except Exception:
+            g.principal = None
+    return g.principal
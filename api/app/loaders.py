@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List
+
+from app.database import rides_collection, user_profiles_collection
+
+# Request-scoped batching loaders (DataLoader style). Every `load()` issued in
+# the same event-loop tick is coalesced into one batch call, so a route that
+# needs N profiles makes one `$in` query instead of N sequential find_one()s.
+# Results are memoized for the life of the loader, which is a single request
+# when obtained through the `get_loaders` dependency.
+
+
+class DataLoader:
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]):
+        self._batch_fn = batch_fn
+        self._futures: Dict[Hashable, asyncio.Future] = {}
+        self._pending: List[Hashable] = []
+
+    async def load(self, key: Hashable) -> Any:
+        """Value for `key`, or None if the batch function did not return it"""
+        if key is None:
+            return None
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._futures[key] = future
+            self._pending.append(key)
+            if len(self._pending) == 1:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return await future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    async def _dispatch(self) -> None:
+        keys, self._pending = self._pending, []
+        try:
+            results = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                self._futures.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._futures[key].set_result(results.get(key))
+
+
+async def _load_user_profiles(user_ids):
+    docs = await user_profiles_collection.find({"user_id": {"$in": user_ids}}).to_list(None)
+    return {doc["user_id"]: doc for doc in docs}
+
+
+async def _load_shared_rides(pairs):
+    """Keys are (user_a, user_b); value is True if either drove the other"""
+    clauses = []
+    for a, b in pairs:
+        clauses.append({"driver_id": a, "passenger_id": b})
+        clauses.append({"driver_id": b, "passenger_id": a})
+    rides = await rides_collection.find(
+        {"$or": clauses}, {"driver_id": 1, "passenger_id": 1}
+    ).to_list(None)
+    shared = {frozenset((r.get("driver_id"), r.get("passenger_id"))) for r in rides}
+    return {(a, b): frozenset((a, b)) in shared for a, b in pairs}
+
+
+class Loaders:
+    """The set of loaders available to one request"""
+
+    def __init__(self):
+        self.user_profiles = DataLoader(_load_user_profiles)
+        self.shared_ride = DataLoader(_load_shared_rides)
+
+
+async def get_loaders() -> Loaders:
+    """FastAPI dependency: fresh loaders per request"""
+    return Loaders()
@@ -3,6 +3,15 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from beanie import init_beanie
 from app import database
+from app.pagination import NEXT_CURSOR_HEADER
+from app.ride_index import ride_match_index
+from app.batch_matcher import batch_matcher
+from app.outbox import outbox_worker
+from app.surge import surge_engine
+from app.quotes import estimate_sampler
+from app.unread import unread_counter
+from app.notification_trim import notification_trimmer
+from app.notification_digest import notification_digester
 from app.routes import rides, driver, payments, location, safety, environmental, feedback, scheduled_rides, notifications, pricing, preferences, analytics
 from app.auth import auth_backend, User, UserCreate, UserRead, UserUpdate, get_user_db
 from fastapi_users import FastAPIUsers
@@ -21,6 +30,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 fastapi_users = FastAPIUsers[User, uuid.UUID](
@@ -39,6 +49,25 @@ async def startup_db_client():
     # Initialize Beanie ODM for FastAPI-Users models
     from app.auth import User  # local import to avoid circular
     await init_beanie(database.database, document_models=[User])
+    # Warm the in-memory ride matching index
+    await ride_match_index.rebuild(database.rides_collection)
+    batch_matcher.start()
+    outbox_worker.start()
+    surge_engine.start()
+    estimate_sampler.start()
+    unread_counter.start()
+    notification_trimmer.start()
+    notification_digester.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await batch_matcher.stop()
+    await outbox_worker.stop()
+    await surge_engine.stop()
+    await estimate_sampler.stop()
+    await unread_counter.stop()
+    await notification_trimmer.stop()
+    await notification_digester.stop()
 
 # Include all API routers
 app.include_router(rides.router, prefix="/rides", tags=["Rides"])
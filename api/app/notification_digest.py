@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from app.config import settings
+from app.database import notification_digest_queue_collection
+
+# Periodic digests for low-priority notification types
+# (NOTIFICATION_DIGEST_TYPES, e.g. promotions and system updates). Instead of
+# a notification each, they are queued per recipient and every
+# NOTIFICATION_DIGEST_SECONDS each user with queued items gets a single
+# "digest" notification listing them.
+#
+# A digest's dedupe key is derived from the newest queue item it covers, so
+# if the process dies between storing digests and clearing the queue, the
+# retry doesn't notify twice.
+
+DIGEST_TYPES = {t.strip() for t in settings.NOTIFICATION_DIGEST_TYPES.split(",") if t.strip()}
+MAX_DIGEST_ITEMS = 20  # items listed in one digest; the count covers all of them
+USER_BATCH_SIZE = 500
+
+
+class NotificationDigester:
+    def __init__(self, interval_seconds: float = settings.NOTIFICATION_DIGEST_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def enqueue(self, to_user_ids: Iterable, item: dict) -> int:
+        """Queue `item` (type, title, message, ...) for each recipient's next digest"""
+        now = datetime.utcnow()
+        queued = [{**item, "to_user_id": user_id, "queued_at": now} for user_id in to_user_ids]
+        if queued:
+            await notification_digest_queue_collection.insert_many(queued, ordered=False)
+        return len(queued)
+
+    @staticmethod
+    def digest(user_id, items: List[dict], last_id) -> dict:
+        count = len(items)
+        shown = items[-MAX_DIGEST_ITEMS:]
+        titles = ", ".join(item["title"] for item in shown[-3:])
+        return {
+            "to_user_id": user_id,
+            "notification_type": "digest",
+            "title": f"{count} new update{'s' if count != 1 else ''}",
+            "message": titles if count <= 3 else f"{titles} and {count - 3} more",
+            "priority": "low",
+            "is_read": False,
+            "data": {"count": count, "items": shown},
+            "dedupe_key": f"digest:{last_id}",
+            "created_at": datetime.utcnow(),
+        }
+
+    async def flush(self) -> int:
+        """Turn everything queued so far into one digest per user; returns digests sent"""
+        cutoff = datetime.utcnow()
+        groups = notification_digest_queue_collection.aggregate([
+            {"$match": {"queued_at": {"$lte": cutoff}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": "$to_user_id",
+                "ids": {"$push": "$_id"},
+                "last_id": {"$last": "$_id"},
+                "items": {"$push": {
+                    "notification_type": "$notification_type",
+                    "title": "$title",
+                    "message": "$message",
+                    "data": "$data",
+                    "from_user_id": "$from_user_id",
+                    "queued_at": "$queued_at",
+                }},
+            }},
+        ], allowDiskUse=True)
+
+        sent, batch = 0, []
+        async for group in groups:
+            batch.append(group)
+            if len(batch) >= USER_BATCH_SIZE:
+                sent += await self._send(batch)
+                batch = []
+        if batch:
+            sent += await self._send(batch)
+        return sent
+
+    async def _send(self, groups: List[dict]) -> int:
+        from app.routes.notifications import store_notifications
+
+        digests = [self.digest(group["_id"], group["items"], group["last_id"]) for group in groups]
+        stored = await store_notifications(digests)
+        await notification_digest_queue_collection.delete_many(
+            {"_id": {"$in": [item_id for group in groups for item_id in group["ids"]]}}
+        )
+        return len(stored)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Notification digest failed: {e}")
+
+
+notification_digester = NotificationDigester()
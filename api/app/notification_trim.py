@@ -0,0 +1,105 @@
+import asyncio
+import time
+from typing import Iterable, List, Optional, Set
+
+from pymongo import DeleteMany
+
+from app.config import settings
+from app.database import notifications_collection
+from app.unread import unread_counter
+
+# Per-user cap on stored notifications (MAX_NOTIFICATIONS_PER_USER). Age-based
+# retention is the TTL index on created_at (see database.create_indexes);
+# this trims users who pile up more than the cap inside the retention window.
+#
+# Users who just received notifications in this process are checked every
+# NOTIFICATION_TRIM_SECONDS; a full sweep over all users runs at startup and
+# every NOTIFICATION_TRIM_SWEEP_SECONDS to catch notifications created by
+# other processes. Trimming finds each user's oldest kept notification
+# through the (to_user_id, created_at, _id) index and deletes everything
+# older in one bulk_write per batch of users.
+
+BATCH_SIZE = 200  # users per bulk_write
+
+
+class NotificationTrimmer:
+    def __init__(self, cap: int = settings.MAX_NOTIFICATIONS_PER_USER,
+                 interval_seconds: float = settings.NOTIFICATION_TRIM_SECONDS,
+                 sweep_seconds: float = settings.NOTIFICATION_TRIM_SWEEP_SECONDS):
+        self.cap = cap
+        self.interval_seconds = interval_seconds
+        self.sweep_seconds = sweep_seconds
+        self._touched: Set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_ids: Iterable) -> None:
+        """Note users that just received notifications"""
+        self._touched.update(user_ids)
+
+    async def _trim_filter(self, user_id) -> Optional[dict]:
+        """Filter for the user's notifications beyond the cap, or None if within it"""
+        oldest_kept = await notifications_collection.find(
+            {"to_user_id": user_id}, {"created_at": 1}
+        ).sort([("created_at", -1), ("_id", -1)]).skip(self.cap - 1).limit(1).to_list(1)
+        if not oldest_kept:
+            return None
+        boundary = oldest_kept[0]
+        return {"to_user_id": user_id, "$or": [
+            {"created_at": {"$lt": boundary["created_at"]}},
+            {"created_at": boundary["created_at"], "_id": {"$lt": boundary["_id"]}},
+        ]}
+
+    async def trim(self, user_ids: Iterable) -> int:
+        """Cap each user's notifications; returns how many were deleted"""
+        user_ids = list(user_ids)
+        deleted = 0
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            batch = user_ids[start:start + BATCH_SIZE]
+            filters = await asyncio.gather(*(self._trim_filter(user_id) for user_id in batch))
+            ops = [DeleteMany(f) for f in filters if f is not None]
+            if not ops:
+                continue
+            result = await notifications_collection.bulk_write(ops, ordered=False)
+            deleted += result.deleted_count
+            if result.deleted_count:
+                await unread_counter.recount([f["to_user_id"] for f in filters if f is not None])
+        return deleted
+
+    async def over_cap_users(self) -> List:
+        """Every user holding more than `cap` notifications"""
+        return [
+            row["_id"]
+            async for row in notifications_collection.aggregate([
+                {"$group": {"_id": "$to_user_id", "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": self.cap}}},
+            ], allowDiskUse=True)
+        ]
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        next_sweep = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + self.sweep_seconds
+                    self._touched.clear()
+                    users = await self.over_cap_users()
+                else:
+                    users, self._touched = list(self._touched), set()
+                deleted = await self.trim(users)
+                if deleted:
+                    print(f"Notification trimmer removed {deleted} notifications")
+            except Exception as e:
+                print(f"Notification trim failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+notification_trimmer = NotificationTrimmer()
@@ -0,0 +1,179 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from app.config import settings
+from app.database import client, outbox_collection
+from app.ride_states import supports_transactions
+
+# Transactional outbox for side effects of ride transitions and feedback
+# (notifications, earnings, environmental impact, ratings). The request writes
+# one outbox document per registered handler in the same transaction as the
+# state change, so a side effect is recorded if and only if the change
+# commits. OutboxWorker tasks in any number of processes claim due documents
+# with a conditional update, run the handler and mark them done; failures are
+# retried with exponential backoff until OUTBOX_MAX_ATTEMPTS, then parked as
+# "failed". A claim is a lease: if a worker dies mid-handler the document
+# becomes due again, so delivery is at-least-once and handlers must be
+# idempotent, keyed on the `key` they are given.
+#
+# Transactions need a replica set or sharded cluster. Against a standalone
+# mongod, `transaction()` yields no session and the state change and its
+# outbox documents are written one after the other, so a crash in between can
+# lose that side effect.
+#
+# Writers that don't register handlers (the Flask app) enqueue an unrouted
+# event, a document with no `handler`; the worker that claims it fans it out
+# into one document per registered handler before marking it done.
+
+Handler = Callable[[dict, str], Awaitable[None]]
+
+# event type -> handler name -> handler
+_handlers: Dict[str, Dict[str, Handler]] = {}
+_transactions_supported: Optional[bool] = None
+
+
+def outbox_handler(*event_types: str):
+    """Register an idempotent async handler(payload, key) for the given event types"""
+    def register(fn: Handler) -> Handler:
+        for event_type in event_types:
+            _handlers.setdefault(event_type, {})[f"{fn.__module__}.{fn.__name__}"] = fn
+        return fn
+    return register
+
+
+async def transactions_supported() -> bool:
+    global _transactions_supported
+    if _transactions_supported is None:
+        _transactions_supported = supports_transactions(await client.admin.command("hello"))
+        if not _transactions_supported:
+            print("MongoDB is a standalone server: outbox writes are not transactional")
+    return _transactions_supported
+
+
+@asynccontextmanager
+async def transaction():
+    """Session with an open transaction (commits on exit, aborts on error), or None on a standalone server"""
+    if not await transactions_supported():
+        yield None
+        return
+    async with await client.start_session() as session:
+        async with session.start_transaction():
+            yield session
+
+
+async def enqueue(event_type: str, payload: dict, session=None) -> int:
+    """Record `event_type` for every handler registered for it; returns how many"""
+    handlers = _handlers.get(event_type)
+    if not handlers:
+        return 0
+    now = datetime.utcnow()
+    docs = [{
+        "event_type": event_type,
+        "handler": name,
+        "payload": payload,
+        "status": "pending",
+        "attempts": 0,
+        "available_at": now,
+        "created_at": now,
+    } for name in handlers]
+    await outbox_collection.insert_many(docs, session=session)
+    return len(docs)
+
+
+async def route(doc: dict) -> int:
+    """Fan an unrouted event out to its handlers; safe to replay"""
+    handlers = _handlers.get(doc["event_type"], {})
+    now = datetime.utcnow()
+    for name in handlers:
+        await outbox_collection.update_one(
+            {"parent_id": doc["_id"], "handler": name},
+            {"$setOnInsert": {
+                "event_type": doc["event_type"],
+                "payload": doc["payload"],
+                "status": "pending",
+                "attempts": 0,
+                "available_at": now,
+                "created_at": now,
+            }},
+            upsert=True,
+        )
+    return len(handlers)
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with jitter after the `attempts`-th failure"""
+    delay = min(settings.OUTBOX_BACKOFF_MAX_SECONDS, settings.OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def process_one() -> bool:
+    """Claim and run one due outbox document; False when none is due"""
+    now = datetime.utcnow()
+    doc = await outbox_collection.find_one_and_update(
+        {"status": {"$in": ["pending", "processing"]}, "available_at": {"$lte": now}},
+        {
+            "$set": {"status": "processing", "available_at": now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        return False
+
+    # Only the holder of this attempt may settle it
+    claim = {"_id": doc["_id"], "status": "processing", "attempts": doc["attempts"]}
+    handler = _handlers.get(doc["event_type"], {}).get(doc.get("handler"))
+    try:
+        if doc.get("handler") is None:
+            await route(doc)
+        elif handler is None:
+            raise LookupError(f"No handler {doc['handler']} for {doc['event_type']}")
+        else:
+            await handler(doc["payload"], str(doc["_id"]))
+    except Exception as e:
+        print(f"Outbox {doc['event_type']} -> {doc.get('handler')} failed (attempt {doc['attempts']}): {e}")
+        if doc["attempts"] >= settings.OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "failed", "last_error": str(e)}
+        else:
+            retry_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(doc["attempts"]))
+            update = {"status": "pending", "available_at": retry_at, "last_error": str(e)}
+        await outbox_collection.update_one(claim, {"$set": update})
+        return True
+
+    await outbox_collection.update_one(claim, {"$set": {"status": "done", "processed_at": datetime.utcnow()}})
+    return True
+
+
+class OutboxWorker:
+    def __init__(self, concurrency: int = settings.OUTBOX_WORKERS,
+                 poll_seconds: float = settings.OUTBOX_POLL_SECONDS):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await process_one():
+                    continue
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,99 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+
+# Shared keyset (cursor) pagination for list endpoints in both the FastAPI
+# routes and the Flask blueprints. Pages are ordered newest first on
+# (<field>, _id) so every page is a bounded index range scan, no skip().
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client supplies a cursor we did not issue"""
+
+
+def clamp_limit(limit, default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    """Coerce a user supplied page size into 1..maximum"""
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(doc: dict, field: str = "created_at") -> str:
+    """Build an opaque cursor pointing just after `doc`"""
+    value = doc.get(field)
+    payload = {
+        "t": value.isoformat() if isinstance(value, datetime) else None,
+        "i": str(doc["_id"]),
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], ObjectId]:
+    """Decode a cursor produced by `encode_cursor`"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["t"]) if payload.get("t") else None
+        last_id = payload["i"]
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    if not ObjectId.is_valid(last_id):
+        raise InvalidCursor("Invalid cursor")
+    return value, ObjectId(last_id)
+
+
+def keyset_sort(field: str = "created_at") -> List[tuple]:
+    return [(field, -1), ("_id", -1)]
+
+
+def keyset_filter(query: dict, cursor: Optional[str] = None, field: str = "created_at") -> dict:
+    """Restrict `query` to documents that sort after `cursor`"""
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    if value is None:
+        # Missing/null sort keys come last in a descending sort
+        after = {field: None, "_id": {"$lt": last_id}}
+    else:
+        after = {"$or": [
+            {field: {"$lt": value}},
+            {field: value, "_id": {"$lt": last_id}},
+            {field: None},
+        ]}
+    if not query:
+        return after
+    return {"$and": [query, after]}
+
+
+def split_page(docs: list, limit: int, field: str = "created_at") -> Tuple[list, Optional[str]]:
+    """Trim a limit + 1 fetch to `limit` docs and compute the next cursor"""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], field)
+
+
+async def fetch_page(collection, query: dict, limit: int, cursor: Optional[str] = None,
+                     field: str = "created_at", projection: Optional[dict] = None):
+    """Fetch one page from a Motor collection. Returns (docs, next_cursor)."""
+    docs = await collection.find(keyset_filter(query, cursor, field), projection) \
+        .sort(keyset_sort(field)).limit(limit + 1).to_list(limit + 1)
+    return split_page(docs, limit, field)
+
+
+def fetch_page_sync(collection, query: dict, limit: int, cursor: Optional[str] = None,
+                    field: str = "created_at", projection: Optional[dict] = None):
+    """Fetch one page from a PyMongo collection. Returns (docs, next_cursor)."""
+    docs = list(collection.find(keyset_filter(query, cursor, field), projection)
+                .sort(keyset_sort(field)).limit(limit + 1))
+    return split_page(docs, limit, field)
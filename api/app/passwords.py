@@ -0,0 +1,90 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.hash import bcrypt
+
+from app.config import settings
+
+# bcrypt runs on a small dedicated process pool so a login burst cannot tie up
+# every gunicorn request thread. At most PASSWORD_HASH_WORKERS hashes run at
+# once with PASSWORD_HASH_QUEUE_DEPTH more waiting; beyond that callers get
+# PasswordHasherBusy immediately and the endpoint answers 503.
+#
+# A request waiting on a hash still holds its gunicorn thread, so admission is
+# also capped at half of GUNICORN_THREADS: the other half always stays free
+# for location updates and everything else.
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated or too slow to answer"""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+MAX_ADMITTED = max(1, min(
+    settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH,
+    settings.GUNICORN_THREADS // 2,
+))
+_slots = threading.BoundedSemaphore(MAX_ADMITTED)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.using(rounds=rounds).hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.verify(password, hashed)
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Created lazily so each gunicorn worker gets its own pool after fork;
+    # spawn avoids forking a process that already runs request threads.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy("Password hashing queue is full")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _reset_executor()
+        raise PasswordHasherBusy("Password hashing pool restarted")
+    except Exception:
+        _slots.release()
+        raise
+    # The slot is held until the worker actually finishes, even if we stop waiting
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=settings.PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        raise PasswordHasherBusy("Password hashing timed out")
+    except BrokenProcessPool:
+        _reset_executor()
+        raise PasswordHasherBusy("Password hashing pool restarted")
+
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password, settings.BCRYPT_ROUNDS)
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    return _run(_verify, password, hashed)
@@ -0,0 +1,112 @@
+import abc
+import asyncio
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from jose import JWTError, jwt
+
+from app.config import settings
+from app.serialization import dumps
+
+# Push delivery for notifications. The notification pipeline hands every
+# newly stored notification to the active transport, selected by
+# NOTIFICATION_PUSH_TRANSPORT:
+#
+#   websocket  users connected to /notifications/ws get the notification as
+#              a {"type": "notification", ...} frame (default)
+#   stub       pushes are only recorded in `sent`; for local runs and tests
+#
+# Connections are per process: a notification stored by another process
+# (e.g. a standalone outbox worker) is only pushed by that process's
+# transport, and clients still catch up through GET /notifications/.
+
+JWT_AUDIENCE = ["fastapi-users:auth"]
+
+
+def token_user_id(token: Optional[str]) -> Optional[str]:
+    """User id from an API access token, or None if it doesn't verify"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"], audience=JWT_AUDIENCE)
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+class PushTransport(abc.ABC):
+    """Delivers messages to users; subclasses implement `deliver`"""
+
+    @abc.abstractmethod
+    async def deliver(self, user_ids: Iterable, message: dict) -> int:
+        """Send `message` to each user; returns how many users were reached"""
+
+    async def push_notifications(self, notifications: List[dict]) -> int:
+        reached = 0
+        for notification in notifications:
+            reached += await self.deliver([notification["to_user_id"]], {"type": "notification", "notification": notification})
+        return reached
+
+
+class WebSocketPush(PushTransport):
+    def __init__(self):
+        self._sockets: Dict[str, Set] = {}  # user id -> open websockets
+
+    def connect(self, user_id, websocket) -> None:
+        self._sockets.setdefault(str(user_id), set()).add(websocket)
+
+    def disconnect(self, user_id, websocket) -> None:
+        sockets = self._sockets.get(str(user_id))
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self._sockets[str(user_id)]
+
+    def connected(self, user_id) -> bool:
+        return str(user_id) in self._sockets
+
+    async def deliver(self, user_ids: Iterable, message: dict) -> int:
+        targets: List[Tuple[str, object]] = [
+            (str(user_id), websocket)
+            for user_id in set(map(str, user_ids))
+            for websocket in self._sockets.get(user_id, ())
+        ]
+        if not targets:
+            return 0
+        text = dumps(message).decode()
+        results = await asyncio.gather(
+            *(websocket.send_text(text) for _, websocket in targets), return_exceptions=True
+        )
+        reached = set()
+        for (user_id, websocket), result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.disconnect(user_id, websocket)
+            else:
+                reached.add(user_id)
+        return len(reached)
+
+
+class StubPush(PushTransport):
+    def __init__(self):
+        self.sent: List[Tuple[str, dict]] = []
+
+    async def deliver(self, user_ids: Iterable, message: dict) -> int:
+        user_ids = set(map(str, user_ids))
+        self.sent.extend((user_id, message) for user_id in user_ids)
+        return len(user_ids)
+
+
+TRANSPORTS = {"websocket": WebSocketPush, "stub": StubPush}
+
+_transport: PushTransport = TRANSPORTS[settings.NOTIFICATION_PUSH_TRANSPORT]()
+
+
+def get_push_transport() -> PushTransport:
+    return _transport
+
+
+def set_push_transport(transport: PushTransport) -> PushTransport:
+    """Swap the active transport (e.g. a StubPush in tests); returns the previous one"""
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
@@ -0,0 +1,122 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from jose import JWTError, jwt
+from pymongo.errors import DuplicateKeyError
+
+from app.config import settings
+from app.database import pricing_estimates_collection
+
+# Stateless price quotes. /pricing/estimate returns a quote token (a JWT
+# signed with SECRET_KEY, audience "quote", bound to the requesting user)
+# that carries the priced estimate and its expiry, instead of writing every
+# estimate to MongoDB. The estimate is persisted only when the quote is
+# redeemed by a booking. A small random sample of quotes still goes to
+# pricing_estimates for analytics, through a batched background writer.
+
+QUOTE_AUDIENCE = "quote"
+
+# Estimate fields carried in the token
+QUOTE_FIELDS = [
+    "base_price", "distance_km", "estimated_duration_minutes", "surge_multiplier",
+    "time_multiplier", "demand_multiplier", "final_price", "breakdown",
+]
+
+
+class InvalidQuote(Exception):
+    pass
+
+
+def issue_quote(user_id, estimate: dict) -> Tuple[str, datetime]:
+    """Sign `estimate` for `user_id`; returns (token, expires_at)"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=settings.QUOTE_TTL_SECONDS)
+    claims = {
+        "aud": QUOTE_AUDIENCE,
+        "sub": str(user_id),
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": expires_at,
+        "est": {field: estimate[field] for field in QUOTE_FIELDS if field in estimate},
+    }
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm="HS256"), expires_at
+
+
+def read_quote(token: str, user_id) -> dict:
+    """Verified claims of an unexpired quote issued to `user_id`"""
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"], audience=QUOTE_AUDIENCE)
+    except JWTError as e:
+        raise InvalidQuote(f"Invalid or expired quote: {e}")
+    if claims.get("sub") != str(user_id):
+        raise InvalidQuote("Quote was issued to another user")
+    return claims
+
+
+async def persist_quote(claims: dict, ride_id) -> None:
+    """Store a redeemed quote against the booked ride (once per quote)"""
+    estimate = {
+        **claims["est"],
+        "ride_id": ride_id,
+        "quote_id": claims["jti"],
+        "estimated_at": datetime.utcfromtimestamp(claims["iat"]),
+        "booked_at": datetime.utcnow(),
+    }
+    try:
+        await pricing_estimates_collection.insert_one(estimate)
+    except DuplicateKeyError:
+        pass  # Already redeemed
+
+
+class EstimateSampler:
+    """Buffers a sample of estimates and writes them with insert_many"""
+
+    def __init__(self, rate: float = settings.ESTIMATE_SAMPLE_RATE,
+                 flush_seconds: float = settings.ESTIMATE_FLUSH_SECONDS,
+                 max_buffer: int = settings.ESTIMATE_FLUSH_BATCH):
+        self.rate = rate
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def offer(self, estimate: dict) -> None:
+        """Keep `estimate` with probability `rate`; never blocks the request"""
+        if self.rate <= 0 or random.random() >= self.rate:
+            return
+        if len(self._buffer) >= self.max_buffer:
+            return  # Writer is behind; sampling can afford to drop
+        self._buffer.append({**estimate, "sampled": True})
+
+    async def flush(self) -> int:
+        batch, self._buffer = self._buffer, []
+        if batch:
+            await pricing_estimates_collection.insert_many(batch, ordered=False)
+        return len(batch)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Estimate sample flush failed: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Estimate sample flush failed: {e}")
+
+
+estimate_sampler = EstimateSampler()
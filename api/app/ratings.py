@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Running rating aggregates kept on each user profile under `rating_stats`:
+#
+#   {"count": n, "sum": s, "stars": {"1": n1, ..., "5": n5},
+#    "categories": {"safety": {"count": n, "sum": s}, ...}}
+#
+# Feedback create/edit/delete applies the difference as increments in the
+# same transaction as the feedback write, so reads and writes are O(1) no
+# matter how much feedback a user has. The increments are written as $add in
+# an update pipeline rather than $inc so the cached average (`rating`) is
+# refreshed in that same single write.
+
+Rating = Tuple[int, str]  # (stars, category)
+
+
+def category_key(category: Optional[str]) -> str:
+    """Category name usable as a field name"""
+    return (category or "general").replace(".", "_").replace("$", "_")
+
+
+def _deltas(added: Optional[Rating], removed: Optional[Rating]) -> Dict[str, int]:
+    deltas: Dict[str, int] = {}
+    for rating, sign in ((added, 1), (removed, -1)):
+        if rating is None:
+            continue
+        stars, category = rating
+        category = category_key(category)
+        for path, amount in (
+            ("rating_stats.count", 1),
+            ("rating_stats.sum", stars),
+            (f"rating_stats.stars.{stars}", 1),
+            (f"rating_stats.categories.{category}.count", 1),
+            (f"rating_stats.categories.{category}.sum", stars),
+        ):
+            deltas[path] = deltas.get(path, 0) + sign * amount
+    return {path: delta for path, delta in deltas.items() if delta}
+
+
+def rating_update(added: Optional[Rating] = None, removed: Optional[Rating] = None) -> list:
+    """Update pipeline that adds/removes one rating and refreshes the average"""
+    increments = {
+        path: {"$add": [{"$ifNull": [f"${path}", 0]}, delta]}
+        for path, delta in _deltas(added, removed).items()
+    }
+    count = {"$ifNull": ["$rating_stats.count", 0]}
+    average = {"$cond": [
+        {"$gt": [count, 0]},
+        {"$round": [{"$divide": ["$rating_stats.sum", count]}, 2]},
+        0.0,
+    ]}
+    pipeline = [{"$set": increments}] if increments else []
+    pipeline.append({"$set": {"rating": average, "total_rides": count, "updated_at": datetime.utcnow()}})
+    return pipeline
+
+
+async def apply_rating_change(profiles, user_id, added: Optional[Rating] = None,
+                              removed: Optional[Rating] = None, session=None) -> None:
+    """Fold one feedback change into the user's aggregates
+
+    Users without a profile are skipped rather than given a rating-only one;
+    backfill_rating_stats seeds their aggregates once the profile exists.
+    """
+    await profiles.update_one({"user_id": user_id}, rating_update(added, removed), session=session)
+
+
+def rating_summary(stats: Optional[dict]) -> dict:
+    """Total, average, star distribution and per-category averages from `rating_stats`"""
+    stats = stats or {}
+    count = stats.get("count", 0)
+    stars = stats.get("stars", {})
+    categories = {
+        name: {"count": c["count"], "average_rating": c["sum"] / c["count"]}
+        for name, c in stats.get("categories", {}).items()
+        if c.get("count", 0) > 0
+    }
+    return {
+        "total_feedback": count,
+        "average_rating": round(stats.get("sum", 0) / count, 2) if count else 0.0,
+        "rating_distribution": {rating: stars.get(str(rating), 0) for rating in range(1, 6)} if count else {},
+        "category_breakdown": categories,
+    }
@@ -0,0 +1,55 @@
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from fastapi.responses import JSONResponse
+
+from app.serialization import dumps
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSONResponse that encodes raw Motor documents with the orjson encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# model -> (output key, field name) for each declared field
+_fields: Dict[type, List[Tuple[str, str]]] = {}
+
+
+def _model_fields(model: Type[BaseModel]) -> List[Tuple[str, str]]:
+    fields = _fields.get(model)
+    if fields is None:
+        fields = _fields[model] = [(field.alias or name, name) for name, field in model.model_fields.items()]
+    return fields
+
+
+def project(doc: dict, model: Type[BaseModel]) -> dict:
+    """Just `model`'s fields of a raw document, keyed as response_model would.
+
+    Only keys the document has are emitted: a field missing here may simply
+    have been projected out by the query, and filling in the model default
+    (e.g. passengers: []) would report wrong data rather than none.
+    """
+    out = {}
+    for key, name in _model_fields(model):
+        if key in doc:
+            out[key] = doc[key]
+        elif name in doc:
+            out[key] = doc[name]
+    return out
+
+
+def mongo_json_response(content: Any, headers: Optional[Dict[str, str]] = None,
+                        model: Optional[Type[BaseModel]] = None) -> MongoJSONResponse:
+    """Return raw documents directly, skipping response_model validation.
+
+    Use on hot list endpoints; the route's response_model still documents the
+    shape in OpenAPI. Pass that model as `model` so documents are projected to
+    its fields (internal fields such as seat_holds stay out) without a full
+    validation pass.
+    """
+    if model is not None:
+        content = [project(doc, model) for doc in content] if isinstance(content, list) else project(content, model)
+    return MongoJSONResponse(content=content, headers={k: v for k, v in (headers or {}).items() if v})
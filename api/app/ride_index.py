@@ -0,0 +1,245 @@
+import asyncio
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.ride_states import TransitionEvent, on_transition
+from app.seats import live_passenger_count
+
+# In-memory matching index of open rides (status "active", no passenger yet),
+# bucketed by (pickup cell, dropoff cell) and then departure time slot. Cells
+# are a fixed lat/lng grid of MATCH_CELL_DEG degrees, i.e. geohash-style
+# buckets addressed as integer (row, col) pairs so neighbours are arithmetic.
+#
+# Candidate generation is a dict lookup per neighbouring cell pair instead of
+# a distance-ordered $near cursor, so rides whose dropoff fits are not cut off
+# by a pickup-distance cap. Routes add rides on create and every status
+# transition drops them (see `_drop_closed_ride`), and seat reservations
+# re-index the ride so full ones drop out; writes from other processes (e.g.
+# the Flask app) are picked up by a full rebuild every
+# MATCH_INDEX_REFRESH_SECONDS.
+#
+# A search radius covers more columns than rows away from the equator (a
+# degree of longitude is cos(lat) as long as one of latitude). Once it spans
+# more than MAX_RING cells either way, probing every neighbouring cell pair
+# costs more than walking the buckets, so candidates scans them instead.
+#
+# Adds and removes that land while a rebuild is awaiting the database are
+# journalled and replayed onto the fresh index before it is swapped in, so a
+# rebuild never resurrects a ride that was just claimed or loses one just
+# created.
+
+KM_PER_DEGREE = 111.32
+MAX_RING = 5
+
+Cell = Tuple[int, int]
+
+
+def haversine_km(a: List[float], b: List[float]) -> float:
+    """Great-circle distance between two [lat, lng] pairs"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def as_naive_utc(value) -> Optional[datetime]:
+    """`value` as a naive UTC datetime like the stored ones; ISO strings are parsed, anything else is None"""
+    if isinstance(value, str):
+        # The Flask app stores pickup_time as the client sent it
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        # Comparing an aware datetime with the stored naive ones raises TypeError
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def departure_time(ride: dict) -> Optional[datetime]:
+    """When the ride leaves; unscheduled rides leave when they were offered"""
+    for field in ("scheduled_time", "pickup_time", "created_at"):
+        when = as_naive_utc(ride.get(field))
+        if when is not None:
+            return when
+    return None
+
+
+def request_window(departure: Optional[datetime], window_minutes: int) -> Optional[Tuple[datetime, datetime]]:
+    """Departure window for a ride request, or None when time is not constrained"""
+    departure = as_naive_utc(departure)
+    if departure is None:
+        return None
+    half = timedelta(minutes=window_minutes)
+    return departure - half, departure + half
+
+
+def is_open(ride: dict) -> bool:
+    """Active, unclaimed and with a seat left (seat reservations fill rides without a transition)
+
+    Seats are counted from live holds: a stored current_passengers can still
+    include holds that have since expired.
+    """
+    return (
+        ride.get("status") == "active"
+        and ride.get("passenger_id") is None
+        and live_passenger_count(ride) < ride.get("max_passengers", 1)
+    )
+
+
+class RideMatchIndex:
+    def __init__(self, cell_deg: float = settings.MATCH_CELL_DEG,
+                 slot_minutes: int = settings.MATCH_SLOT_MINUTES,
+                 refresh_seconds: int = settings.MATCH_INDEX_REFRESH_SECONDS):
+        self.cell_deg = cell_deg
+        self.slot_seconds = slot_minutes * 60
+        self.refresh_seconds = refresh_seconds
+        # (pickup cell, dropoff cell) -> slot -> ride_id -> ride
+        self._buckets: Dict[Tuple[Cell, Cell], Dict[Optional[int], dict]] = {}
+        self._keys: Dict[object, Tuple[Tuple[Cell, Cell], Optional[int]]] = {}
+        self._built_at = 0.0
+        # ride_id -> ride to add, or None to remove, while a rebuild is running
+        self._changes: Optional[Dict[object, Optional[dict]]] = None
+        self._rebuild_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def cell(self, coords: List[float]) -> Cell:
+        return (math.floor(coords[0] / self.cell_deg), math.floor(coords[1] / self.cell_deg))
+
+    def slot(self, when: Optional[datetime]) -> Optional[int]:
+        """Departure slot number; None when the ride has no known departure"""
+        if when is None:
+            return None
+        return int(when.timestamp() // self.slot_seconds)
+
+    def reach(self, coords: List[float], radius_km: float) -> Cell:
+        """How many cells `radius_km` spans around `coords`, as (rows, cols)"""
+        cell_km = self.cell_deg * KM_PER_DEGREE
+        # Clamped so a pole doesn't divide by zero; the reach is a scan there anyway
+        lng_cell_km = cell_km * max(math.cos(math.radians(coords[0])), 0.01)
+        return max(1, math.ceil(radius_km / cell_km)), max(1, math.ceil(radius_km / lng_cell_km))
+
+    def ring(self, center: Cell, reach: Cell) -> List[Cell]:
+        rows, cols = reach
+        return [(center[0] + dx, center[1] + dy) for dx in range(-rows, rows + 1) for dy in range(-cols, cols + 1)]
+
+    @staticmethod
+    def within(cell: Cell, center: Cell, reach: Cell) -> bool:
+        return abs(cell[0] - center[0]) <= reach[0] and abs(cell[1] - center[1]) <= reach[1]
+
+    def add(self, ride: dict) -> None:
+        """Index `ride` if it is open for matching, otherwise drop it"""
+        self.remove(ride.get("_id"))
+        if self._changes is not None:
+            self._changes[ride.get("_id")] = ride
+        if not is_open(ride) or not ride.get("pickup_coords") or not ride.get("dropoff_coords"):
+            return
+        cells = (self.cell(ride["pickup_coords"]), self.cell(ride["dropoff_coords"]))
+        slot = self.slot(departure_time(ride))
+        self._buckets.setdefault(cells, {}).setdefault(slot, {})[ride["_id"]] = ride
+        self._keys[ride["_id"]] = (cells, slot)
+
+    def remove(self, ride_id) -> None:
+        if self._changes is not None:
+            self._changes[ride_id] = None
+        key = self._keys.pop(ride_id, None)
+        if key is None:
+            return
+        cells, slot = key
+        slots = self._buckets[cells]
+        slots[slot].pop(ride_id, None)
+        if not slots[slot]:
+            del slots[slot]
+        if not slots:
+            del self._buckets[cells]
+
+    def candidates(self, pickup: List[float], dropoff: List[float], radius_km: float,
+                   window: Optional[Tuple[datetime, datetime]] = None) -> List[dict]:
+        """Open rides whose pickup and dropoff cells neighbour the request's.
+
+        With a departure `window` only the overlapping time slots are visited
+        and rides are pruned to the exact window. Results are then exact
+        pickup distance filtered and ordered by pickup + dropoff distance.
+        """
+        wanted = None
+        if window is not None:
+            wanted = set(range(self.slot(window[0]), self.slot(window[1]) + 1))
+        pickup_cell, dropoff_cell = self.cell(pickup), self.cell(dropoff)
+        pickup_reach, dropoff_reach = self.reach(pickup, radius_km), self.reach(dropoff, radius_km)
+        if max(pickup_reach + dropoff_reach) > MAX_RING:
+            matching = [
+                by_slot for (pc, dc), by_slot in self._buckets.items()
+                if self.within(pc, pickup_cell, pickup_reach) and self.within(dc, dropoff_cell, dropoff_reach)
+            ]
+        else:
+            dropoff_ring = self.ring(dropoff_cell, dropoff_reach)
+            matching = [
+                self._buckets[pc, dc]
+                for pc in self.ring(pickup_cell, pickup_reach) for dc in dropoff_ring
+                if (pc, dc) in self._buckets
+            ]
+        found = []
+        for by_slot in matching:
+            for slot, rides in by_slot.items():
+                if wanted is None or slot in wanted:
+                    found.extend(rides.values())
+
+        scored = []
+        for ride in found:
+            if window is not None:
+                departs = departure_time(ride)
+                if departs is None or not window[0] <= departs <= window[1]:
+                    continue
+            pickup_km = haversine_km(pickup, ride["pickup_coords"])
+            if pickup_km > radius_km:
+                continue
+            scored.append((pickup_km + haversine_km(dropoff, ride["dropoff_coords"]), ride))
+        scored.sort(key=lambda item: item[0])
+        return [ride for _, ride in scored]
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._built_at > self.refresh_seconds
+
+    async def rebuild(self, collection) -> None:
+        """Reload every open ride from the rides collection"""
+        # Mark fresh up front so concurrent requests don't all rebuild at once
+        self._built_at = time.monotonic()
+        async with self._rebuild_lock:
+            self._changes = {}
+            try:
+                rides = await collection.find({"status": "active", "passenger_id": None}).to_list(None)
+                # Swap in whole so lookups never see a half-built index; the
+                # changes made while the query ran are newer than its results
+                fresh = RideMatchIndex(self.cell_deg, self.slot_seconds // 60, self.refresh_seconds)
+                for ride in rides:
+                    fresh.add(ride)
+                for ride_id, ride in self._changes.items():
+                    if ride is None:
+                        fresh.remove(ride_id)
+                    else:
+                        fresh.add(ride)
+            except Exception:
+                self._built_at = 0.0
+                raise
+            finally:
+                self._changes = None
+            self._buckets, self._keys = fresh._buckets, fresh._keys
+
+    async def ensure_fresh(self, collection) -> None:
+        if self.is_stale():
+            await self.rebuild(collection)
+
+
+ride_match_index = RideMatchIndex()
+
+
+@on_transition
+async def _drop_closed_ride(event: TransitionEvent) -> None:
+    """A ride leaving "active" no longer takes new passengers"""
+    ride_match_index.remove(event.ride_id)
@@ -0,0 +1,64 @@
+from typing import Iterable, Optional
+
+from app.pagination import fetch_page, fetch_page_sync
+from app.schemas import Ride
+
+# "Rides for user" queries shared by the FastAPI routes and Flask blueprints.
+# A user's rides are one $or over the (driver_id, created_at) and
+# (passenger_id, created_at) compound indexes, sorted and paged server side.
+
+# Fields the ride list views render: everything the Ride response model
+# declares, plus the extra ones the Flutter Ride model reads and the Flask
+# views show. Built from the model so the two cannot drift; live tracking
+# state and cancellation details are left out.
+LIST_EXTRA_FIELDS = (
+    "pickup_location",
+    "dropoff_location",
+    "pickup_address",
+    "dropoff_address",
+    "seats_available",
+    "price",
+    "distance",
+    "metadata",
+    "completion_time",
+    "actual_pickup_time",
+)
+
+RIDE_LIST_PROJECTION = {
+    **{field.alias or name: 1 for name, field in Ride.model_fields.items()},
+    **{field: 1 for field in LIST_EXTRA_FIELDS},
+}
+
+RIDE_USER_INDEXES = [
+    [("driver_id", 1), ("created_at", -1), ("_id", -1)],
+    [("passenger_id", 1), ("created_at", -1), ("_id", -1)],
+]
+
+
+def rides_for_user_query(
+    user_id,
+    driver_statuses: Optional[Iterable[str]] = None,
+    passenger_statuses: Optional[Iterable[str]] = None,
+) -> dict:
+    """Build the $or filter matching rides the user drives or rides in"""
+    as_driver = {"driver_id": user_id}
+    as_passenger = {"passenger_id": user_id}
+    if driver_statuses is not None:
+        as_driver["status"] = {"$in": list(driver_statuses)}
+    if passenger_statuses is not None:
+        as_passenger["status"] = {"$in": list(passenger_statuses)}
+    return {"$or": [as_driver, as_passenger]}
+
+
+async def find_rides_for_user(collection, user_id, limit: int, cursor: Optional[str] = None,
+                              driver_statuses=None, passenger_statuses=None):
+    """Page through a user's rides on a Motor collection. Returns (rides, next_cursor)."""
+    query = rides_for_user_query(user_id, driver_statuses, passenger_statuses)
+    return await fetch_page(collection, query, limit, cursor, projection=RIDE_LIST_PROJECTION)
+
+
+def find_rides_for_user_sync(collection, user_id, limit: int, cursor: Optional[str] = None,
+                             driver_statuses=None, passenger_statuses=None):
+    """Page through a user's rides on a PyMongo collection. Returns (rides, next_cursor)."""
+    query = rides_for_user_query(user_id, driver_statuses, passenger_statuses)
+    return fetch_page_sync(collection, query, limit, cursor, projection=RIDE_LIST_PROJECTION)
@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+# Ride lifecycle. Every status change goes through `transition`, which applies
+# it as one conditional find_one_and_update: the filter holds the allowed
+# source states (and any ownership scope), so there is no read-then-write race
+# and no second round trip. Durable side effects (notifications, earnings...)
+# are written to the outbox as a "ride.<status>" event in the same
+# transaction; in-process hooks such as the match index subscribe with
+# `on_transition` and run after commit.
+
+# "pending" is the passenger-request state of the Flask app's ride flow
+TRANSITIONS: Dict[str, Set[str]] = {
+    "active": {"pending_driver_acceptance", "pending", "accepted", "cancelled"},
+    "pending": {"accepted", "active", "cancelled"},
+    "pending_driver_acceptance": {"confirmed", "accepted", "cancelled"},
+    "accepted": {"confirmed", "in_progress", "picked_up", "cancelled"},
+    "confirmed": {"in_progress", "picked_up", "cancelled"},
+    "in_progress": {"picked_up", "dropped_off", "completed", "cancelled"},
+    "picked_up": {"in_progress", "dropped_off", "completed", "cancelled"},
+    "dropped_off": {"completed"},
+    "completed": set(),
+    "cancelled": set(),
+}
+
+STATUSES = list(TRANSITIONS)
+
+
+@dataclass
+class TransitionEvent:
+    ride_id: object
+    from_status: str
+    to_status: str
+    ride: dict  # document as it was before the transition
+    actor_id: Optional[object]
+    at: datetime
+
+
+_listeners: List[Callable[[TransitionEvent], Awaitable[None]]] = []
+
+
+def on_transition(listener: Callable[[TransitionEvent], Awaitable[None]]):
+    """Register an async listener for every successful transition (usable as a decorator)"""
+    _listeners.append(listener)
+    return listener
+
+
+def sources(target: str) -> List[str]:
+    """States a ride may move to `target` from"""
+    return [state for state, targets in TRANSITIONS.items() if target in targets]
+
+
+def event_payload(event: TransitionEvent) -> dict:
+    """Outbox payload for a transition: who was on the ride and what changed"""
+    ride = event.ride
+    return {
+        "ride_id": event.ride_id,
+        "from_status": event.from_status,
+        "to_status": event.to_status,
+        "actor_id": event.actor_id,
+        "driver_id": ride.get("driver_id"),
+        "passenger_id": ride.get("passenger_id"),
+        "passengers": ride.get("passengers", []),
+        "at": event.at,
+    }
+
+
+def _allowed(target: str, expected: Optional[Iterable[str]]) -> List[str]:
+    if target not in TRANSITIONS:
+        raise ValueError(f"Unknown ride status: {target}")
+    allowed = sources(target)
+    if expected is not None:
+        allowed = [state for state in allowed if state in set(expected)]
+    return allowed
+
+
+def supports_transactions(hello: dict) -> bool:
+    """Whether a server's hello reply allows transactions (replica set member or mongos)"""
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+async def transition(collection, ride_id, target: str, scope: Optional[dict] = None,
+                     expected: Optional[Iterable[str]] = None, set_fields: Optional[dict] = None,
+                     actor_id=None) -> Optional[TransitionEvent]:
+    """Move a ride to `target` in one conditional write.
+
+    `expected` narrows the allowed source states; `scope` adds filter terms
+    (ownership, passenger_id None, ...); `set_fields` are written alongside.
+    Returns the event, or None if the ride was not in an allowed state/scope.
+    The write and its outbox event commit together in one transaction.
+    """
+    allowed = _allowed(target, expected)
+
+    from app.outbox import enqueue, transaction
+
+    now = datetime.utcnow()
+    async with transaction() as session:
+        before = await collection.find_one_and_update(
+            {**(scope or {}), "_id": ride_id, "status": {"$in": allowed}},
+            {"$set": {**(set_fields or {}), "status": target, "updated_at": now}},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+        if before is None:
+            return None
+        event = TransitionEvent(ride_id, before.get("status"), target, before, actor_id, now)
+        await enqueue(f"ride.{target}", event_payload(event), session=session)
+
+    for listener in _listeners:
+        try:
+            await listener(event)
+        except Exception as e:
+            print(f"Ride transition listener {getattr(listener, '__name__', listener)} failed: {e}")
+    return event
+
+
+_sync_transactions: Optional[bool] = None
+
+
+def transition_sync(client, collection, outbox, ride_id, target: str, scope: Optional[dict] = None,
+                    expected: Optional[Iterable[str]] = None, set_fields: Optional[dict] = None,
+                    actor_id=None) -> Optional[TransitionEvent]:
+    """`transition` for the synchronous Flask app.
+
+    Outbox handlers are registered in the API process, so the event is written
+    unrouted and the outbox worker fans it out. In-process listeners don't run
+    here; the API's match index picks the change up on its next refresh.
+    """
+    global _sync_transactions
+    allowed = _allowed(target, expected)
+    if _sync_transactions is None:
+        _sync_transactions = supports_transactions(client.admin.command("hello"))
+    now = datetime.utcnow()
+
+    def write(session):
+        before = collection.find_one_and_update(
+            {**(scope or {}), "_id": ride_id, "status": {"$in": allowed}},
+            {"$set": {**(set_fields or {}), "status": target, "updated_at": now}},
+            return_document=ReturnDocument.BEFORE,
+            session=session,
+        )
+        if before is None:
+            return None
+        event = TransitionEvent(ride_id, before.get("status"), target, before, actor_id, now)
+        outbox.insert_one({
+            "event_type": f"ride.{target}",
+            "handler": None,
+            "payload": event_payload(event),
+            "status": "pending",
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+        }, session=session)
+        return event
+
+    if not _sync_transactions:
+        return write(None)
+    with client.start_session() as session:
+        return session.with_transaction(write)
+
+
+async def explain_failure(collection, ride_id, target: str, scope: Optional[dict] = None) -> Tuple[int, str]:
+    """(status code, detail) for a refused transition; only runs on the failure path"""
+    ride = await collection.find_one({"_id": ride_id}, {"status": 1})
+    if not ride:
+        return 404, "Ride not found"
+    if scope and not await collection.count_documents({**scope, "_id": ride_id}, limit=1):
+        return 403, "Not authorized to update this ride"
+    return 409, f"Cannot change ride status from {ride.get('status')} to {target}"
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from app.schemas import RideAnalytics, PyObjectId
 from app.database import ride_analytics_collection, rides_collection, locations_collection, environmental_metrics_collection
 from app.auth import User, fastapi_users
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid
 
@@ -305,9 +306,21 @@ async def generate_analytics_report(
     }
 
 @router.get("/reports", response_model=List[dict])
-async def get_analytics_reports(user: User = Depends(fastapi_users.current_user)):
-    """Get all generated analytics reports"""
-    reports = await ride_analytics_collection.find({"user_id": user.id}).sort("generated_at", -1).to_list(50)
+async def get_analytics_reports(
+    response: Response,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
+    """Get generated analytics reports, newest first"""
+    try:
+        reports, next_cursor = await fetch_page(
+            ride_analytics_collection, {"user_id": user.id}, clamp_limit(limit), cursor, field="generated_at"
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     # Return simplified report list
     report_list = []
@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.schemas import CommunityFilter, Ride, RideRequest
 from app.database import community_filters_collection, rides_collection, user_profiles_collection
+from app.communities import COMMUNITIES, community_mask, doc_mask, mask_communities, shared_community_counts
 from app.auth import User, fastapi_users
+from app.loaders import Loaders, get_loaders
+from app.ride_index import request_window, ride_match_index
+from app.config import settings
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
 import math
 
@@ -32,6 +36,7 @@ async def create_community_filter(
     """Create or update community filter preferences for a user"""
     filter_data.user_id = user.id
     filter_data.created_at = datetime.utcnow()
+    filter_data.community_mask = community_mask(filter_data.preferred_communities)
     
     # Check if filter already exists for this user
     existing_filter = await community_filters_collection.find_one({"user_id": user.id})
@@ -78,7 +83,8 @@ async def get_community_filter(
 @router.post("/match", response_model=List[Ride])
 async def find_community_rides(
     request: RideRequest,
-    user: User = Depends(fastapi_users.current_user)
+    user: User = Depends(fastapi_users.current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Find rides with community-based matching"""
     # Get user's community filter
@@ -88,8 +94,12 @@ async def find_community_rides(
         # Fall back to regular ride finding if no community filter
         return await find_regular_rides(request)
     
+    user_mask = doc_mask(user_filter, "preferred_communities")
+    
+    threshold = user_filter.get("trust_score_threshold", 3.0)
+    
     # Find rides within radius
-    rides = await rides_collection.find({
+    query = {
         "status": "active",
         "passenger_id": None,
         "pickup_coords": {
@@ -101,22 +111,33 @@ async def find_community_rides(
                 "$maxDistance": request.radius_km * 1000
             }
         }
-    }).to_list(20)
+    }
+    # Only when no driver could reach the threshold without a shared community
+    # is it safe to require one in the query
+    if user_mask and threshold > max_score_without_shared(user_filter):
+        query["driver_community_mask"] = {"$bitsAnySet": user_mask}
+    # Prune by departure window in the query, before any detour scoring
+    window = request_window(request.departure_time, request.time_window_minutes)
+    if window:
+        query["scheduled_time"] = {"$gte": window[0], "$lte": window[1]}
+    rides = await rides_collection.find(query).to_list(20)
+    
+    # Get all driver profiles for community matching in one query
+    driver_profiles = await loaders.user_profiles.load_many(r.get("driver_id") for r in rides)
+    shared_counts = shared_community_counts(user_mask, (doc_mask(p, "communities") for p in driver_profiles))
     
     # Apply community filtering
     community_matched_rides = []
-    for ride_data in rides:
+    for ride_data, driver_profile, shared in zip(rides, driver_profiles, shared_counts):
         ride = Ride(**ride_data)
         
-        # Get driver profile for community matching
-        driver_profile = await user_profiles_collection.find_one({"user_id": ride.driver_id})
         if not driver_profile:
             continue
         
         # Check community compatibility
-        community_score = calculate_community_score(user_filter, driver_profile, ride)
+        community_score = calculate_community_score(user_filter, driver_profile, ride, shared)
         
-        if community_score >= user_filter.get("trust_score_threshold", 3.0):
+        if community_score >= threshold:
             # Calculate detour
             driver_route = [ride.pickup_coords, ride.dropoff_coords]
             detour = await calculate_detour(driver_route, request.pickup_coords, request.dropoff_coords)
@@ -133,19 +154,11 @@ async def find_community_rides(
 
 async def find_regular_rides(request: RideRequest) -> List[Ride]:
     """Fallback to regular ride finding without community filtering"""
-    rides = await rides_collection.find({
-        "status": "active",
-        "passenger_id": None,
-        "pickup_coords": {
-            "$near": {
-                "$geometry": {
-                    "type": "Point",
-                    "coordinates": request.pickup_coords
-                },
-                "$maxDistance": request.radius_km * 1000
-            }
-        }
-    }).to_list(10)
+    await ride_match_index.ensure_fresh(rides_collection)
+    window = request_window(request.departure_time, request.time_window_minutes)
+    rides = ride_match_index.candidates(
+        request.pickup_coords, request.dropoff_coords, request.radius_km, window
+    )[:settings.MATCH_MAX_CANDIDATES]
     
     matched_rides = []
     for ride_data in rides:
@@ -159,17 +172,23 @@ async def find_regular_rides(request: RideRequest) -> List[Ride]:
     
     return matched_rides
 
-def calculate_community_score(user_filter: dict, driver_profile: dict, ride: Ride) -> float:
+def max_score_without_shared(user_filter: dict) -> float:
+    """Best score calculate_community_score can give a driver sharing no community"""
+    score = 5.0 + 2.0  # Full rating and verification
+    if user_filter.get("pickup_coords"):
+        score += 10.0 / 2.0  # Distance bonus for a pickup right at the user's
+    return min(10.0, score)
+
+def calculate_community_score(user_filter: dict, driver_profile: dict, ride: Ride,
+                              shared_communities: Optional[int] = None) -> float:
     """Calculate community compatibility score between user and driver"""
     score = 0.0
     
-    # Check for common communities
-    user_communities = set(user_filter.get("preferred_communities", []))
-    driver_communities = set(driver_profile.get("communities", []))
-    
-    common_communities = user_communities.intersection(driver_communities)
-    if common_communities:
-        score += len(common_communities) * 2.0
+    # Check for common communities (popcount of the membership bitmasks)
+    if shared_communities is None:
+        shared_communities = (doc_mask(user_filter, "preferred_communities") &
+                              doc_mask(driver_profile, "communities")).bit_count()
+    score += shared_communities * 2.0
     
     # Factor in driver rating
     driver_rating = driver_profile.get("rating", 0)
@@ -219,20 +238,32 @@ async def calculate_detour(driver_route, passenger_pickup, passenger_dropoff) ->
 @router.get("/communities", response_model=List[str])
 async def get_available_communities():
     """Get list of available communities in the system"""
-    # This would typically come from a configuration or be dynamically generated
-    # For now, returning a predefined list
-    return [
-        "university",
-        "workplace",
-        "neighborhood",
-        "gym",
-        "shopping_center",
-        "hospital",
-        "airport",
-        "train_station",
-        "school",
-        "church"
-    ]
+    return list(COMMUNITIES)
+
+@router.put("/memberships", response_model=List[str])
+async def update_community_memberships(
+    communities: List[str],
+    user: User = Depends(fastapi_users.current_user)
+):
+    """Set the communities the current user belongs to"""
+    unknown = [c for c in communities if c not in COMMUNITIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown communities: {', '.join(unknown)}")
+    
+    mask = community_mask(communities)
+    result = await user_profiles_collection.update_one(
+        {"user_id": user.id},
+        {"$set": {"communities": mask_communities(mask), "community_mask": mask, "updated_at": datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="User profile not found")
+    
+    # Keep the denormalized mask on the driver's open rides in sync
+    await rides_collection.update_many(
+        {"driver_id": user.id, "status": {"$in": ["active", "scheduled"]}},
+        {"$set": {"driver_community_mask": mask}}
+    )
+    return mask_communities(mask)
 
 @router.get("/stats/{community_name}", response_model=dict)
 async def get_community_stats(
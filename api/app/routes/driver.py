@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.schemas import DriverRoute
 from app.database import drivers_collection, rides_collection
+from app.responses import mongo_json_response
+from app.ride_states import explain_failure, transition
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 from app.auth import User
 from fastapi_users import FastAPIUsers
 from app.auth import auth_backend, get_user_db
@@ -32,11 +35,18 @@ async def create_driver_route(route: DriverRoute, user: User = Depends(fastapi_u
     return created_route
 
 @router.get("/routes", response_model=List[DriverRoute])
-async def get_driver_routes(user: User = Depends(fastapi_users.current_user)):
+async def get_driver_routes(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
     if not user.is_driver:
         raise HTTPException(status_code=403, detail="Only drivers can view their routes")
-    routes = await drivers_collection.find({"driver_id": user.id}).to_list(100)
-    return routes
+    try:
+        routes, next_cursor = await fetch_page(drivers_collection, {"driver_id": user.id}, clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(routes, headers={NEXT_CURSOR_HEADER: next_cursor}, model=DriverRoute)
 
 @router.post("/rides/{ride_id}/accept", response_model=dict)
 async def accept_ride(ride_id: str, user: User = Depends(fastapi_users.current_user)):
@@ -46,17 +56,13 @@ async def accept_ride(ride_id: str, user: User = Depends(fastapi_users.current_u
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "status": "active", "passenger_id": None})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or already accepted")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"driver_id": user.id, "status": "accepted"}}
+    event = await transition(
+        rides_collection, ObjectId(ride_id), "accepted",
+        scope={"passenger_id": None}, expected=["active"],
+        set_fields={"driver_id": user.id}, actor_id=user.id
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to accept ride")
+    if not event:
+        raise HTTPException(status_code=404, detail="Ride not found or already accepted")
     
     return {"message": "Ride accepted successfully"}
 
@@ -72,16 +78,12 @@ async def update_ride_status(ride_id: str, status: str, user: User = Depends(fas
     if status not in valid_statuses:
         raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "driver_id": user.id})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or not assigned to this driver")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": status}}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to update ride status")
+    scope = {"driver_id": user.id}
+    event = await transition(rides_collection, ObjectId(ride_id), status, scope=scope, actor_id=user.id)
+    if not event:
+        status_code, detail = await explain_failure(rides_collection, ObjectId(ride_id), status, scope)
+        if status_code == 403:
+            detail = "Ride not found or not assigned to this driver"
+        raise HTTPException(status_code=status_code, detail=detail)
     
     return {"message": "Ride status updated successfully"}
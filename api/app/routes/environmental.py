@@ -7,8 +7,10 @@ from app.auth import auth_backend, get_user_db
 import uuid
 from typing import List, Dict, Any
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime, timedelta
 import math
+from app.outbox import outbox_handler
 
 router = APIRouter()
 
@@ -57,7 +59,35 @@ async def calculate_ride_environmental_impact(
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not found or user not authorized")
     
-    # Calculate environmental impact
+    # Save to database
+    metrics_dict = ride_environmental_metrics(ride)
+    await store_environmental_metrics(metrics_dict)
+    
+    # Update ride with environmental data
+    await rides_collection.update_one(
+        {"_id": ObjectId(ride_id)},
+        {
+            "$set": {
+                "co2_saved": metrics_dict["co2_saved_kg"],
+                "total_distance_km": metrics_dict["distance_km"]
+            }
+        }
+    )
+    
+    # One record per ride: a repeat call returns the metrics stored first
+    return await environmental_metrics_collection.find_one({"ride_id": ObjectId(ride_id)})
+
+async def store_environmental_metrics(metrics_dict: dict) -> None:
+    """Insert the ride's metrics unless it already has some (ride_id is unique)"""
+    try:
+        await environmental_metrics_collection.update_one(
+            {"ride_id": metrics_dict["ride_id"]}, {"$setOnInsert": metrics_dict}, upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # A concurrent writer stored them first
+
+def ride_environmental_metrics(ride: dict) -> dict:
+    """Environmental metrics document for a ride"""
     distance_km = ride.get("total_distance_km", 0)
     if distance_km == 0:
         # Calculate distance if not provided
@@ -69,36 +99,28 @@ async def calculate_ride_environmental_impact(
     
     # Calculate CO2 saved by sharing the ride
     co2_saved_kg = calculate_co2_savings(distance_km)
-    fuel_saved_liters = calculate_fuel_savings(distance_km)
-    trees_equivalent = calculate_trees_equivalent(co2_saved_kg)
-    
-    # Create environmental metrics
     environmental_metrics = EnvironmentalMetrics(
-        ride_id=ObjectId(ride_id),
+        ride_id=ride["_id"],
         distance_km=distance_km,
         co2_saved_kg=co2_saved_kg,
-        fuel_saved_liters=fuel_saved_liters,
-        trees_equivalent=trees_equivalent,
+        fuel_saved_liters=calculate_fuel_savings(distance_km),
+        trees_equivalent=calculate_trees_equivalent(co2_saved_kg),
         timestamp=datetime.utcnow()
     )
-    
-    # Save to database
-    metrics_dict = environmental_metrics.dict(by_alias=True, exclude_unset=True)
-    result = await environmental_metrics_collection.insert_one(metrics_dict)
-    
-    # Update ride with environmental data
+    return environmental_metrics.dict(by_alias=True, exclude_unset=True)
+
+@outbox_handler("ride.completed")
+async def record_ride_environmental_impact(event: dict, key: str):
+    """Store a completed ride's environmental impact (once per ride)"""
+    ride = await rides_collection.find_one({"_id": event["ride_id"]})
+    if not ride:
+        return
+    metrics_dict = ride_environmental_metrics(ride)
+    await store_environmental_metrics(metrics_dict)
     await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {
-            "$set": {
-                "co2_saved": co2_saved_kg,
-                "total_distance_km": distance_km
-            }
-        }
+        {"_id": ride["_id"]},
+        {"$set": {"co2_saved": metrics_dict["co2_saved_kg"], "total_distance_km": metrics_dict["distance_km"]}}
     )
-    
-    created_metrics = await environmental_metrics_collection.find_one({"_id": result.inserted_id})
-    return created_metrics
 
 @router.get("/ride/{ride_id}/impact", response_model=EnvironmentalMetrics)
 async def get_ride_environmental_impact(
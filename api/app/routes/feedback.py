@@ -1,14 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends
-from app.schemas import Feedback, PyObjectId
+from app.schemas import Feedback
 from app.database import feedback_collection, rides_collection, user_profiles_collection
 from app.auth import User
+from app.loaders import Loaders, get_loaders
+from app.outbox import transaction
+from app.ratings import apply_rating_change, rating_summary
+from app.config import settings
+from app.responses import mongo_json_response
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
 from fastapi_users import FastAPIUsers
 from app.auth import auth_backend, get_user_db
+import asyncio
+import time
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from bson import ObjectId
 from datetime import datetime
-import statistics
 from datetime import timedelta
 
 router = APIRouter()
@@ -61,10 +68,14 @@ async def create_feedback(
         raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
     feedback_dict = feedback.dict(by_alias=True, exclude_unset=True)
-    result = await feedback_collection.insert_one(feedback_dict)
-    
-    # Update user's average rating
-    await update_user_rating(feedback.to_user_id)
+    async with transaction() as session:
+        result = await feedback_collection.insert_one(feedback_dict, session=session)
+        # Update user's rating aggregates
+        await apply_rating_change(
+            user_profiles_collection, feedback.to_user_id,
+            added=(feedback.rating, feedback.category), session=session
+        )
+    invalidate_platform_analytics()
     
     created_feedback = await feedback_collection.find_one({"_id": result.inserted_id})
     return created_feedback
@@ -72,6 +83,8 @@ async def create_feedback(
 @router.get("/ride/{ride_id}", response_model=List[Feedback])
 async def get_ride_feedback(
     ride_id: str,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
     user: User = Depends(fastapi_users.current_user)
 ):
     """Get all feedback for a specific ride"""
@@ -90,17 +103,21 @@ async def get_ride_feedback(
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not found or user not authorized")
     
-    feedback_list = await feedback_collection.find({
-        "ride_id": ObjectId(ride_id)
-    }).to_list(100)
-    
-    return feedback_list
+    try:
+        feedback_list, next_cursor = await fetch_page(
+            feedback_collection, {"ride_id": ObjectId(ride_id)}, clamp_limit(limit), cursor
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(feedback_list, headers={NEXT_CURSOR_HEADER: next_cursor}, model=Feedback)
 
 @router.get("/user/{user_id}", response_model=List[Feedback])
 async def get_user_feedback(
     user_id: str,
-    limit: int = 50,
-    user: User = Depends(fastapi_users.current_user)
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get feedback for a specific user"""
     if not ObjectId.is_valid(user_id):
@@ -109,26 +126,24 @@ async def get_user_feedback(
     # Users can see feedback for themselves or for users they've ridden with
     if str(user.id) != user_id:
         # Check if they've ridden together
-        shared_rides = await rides_collection.find({
-            "$or": [
-                {"driver_id": user.id, "passenger_id": ObjectId(user_id)},
-                {"driver_id": ObjectId(user_id), "passenger_id": user.id}
-            ]
-        }).to_list(10)
+        shared_ride = await loaders.shared_ride.load((user.id, ObjectId(user_id)))
         
-        if not shared_rides:
+        if not shared_ride:
             raise HTTPException(status_code=403, detail="Not authorized to view this user's feedback")
     
-    feedback_list = await feedback_collection.find({
-        "to_user_id": ObjectId(user_id)
-    }).sort([("created_at", -1)]).limit(limit).to_list(limit)
-    
-    return feedback_list
+    try:
+        feedback_list, next_cursor = await fetch_page(
+            feedback_collection, {"to_user_id": ObjectId(user_id)}, clamp_limit(limit), cursor
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(feedback_list, headers={NEXT_CURSOR_HEADER: next_cursor}, model=Feedback)
 
 @router.get("/user/{user_id}/summary", response_model=Dict[str, Any])
 async def get_user_feedback_summary(
     user_id: str,
-    user: User = Depends(fastapi_users.current_user)
+    user: User = Depends(fastapi_users.current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Get a summary of feedback for a specific user"""
     if not ObjectId.is_valid(user_id):
@@ -137,67 +152,25 @@ async def get_user_feedback_summary(
     # Users can see feedback summary for themselves or for users they've ridden with
     if str(user.id) != user_id:
         # Check if they've ridden together
-        shared_rides = await rides_collection.find({
-            "$or": [
-                {"driver_id": user.id, "passenger_id": ObjectId(user_id)},
-                {"driver_id": ObjectId(user_id), "passenger_id": user.id}
-            ]
-        }).to_list(10)
+        shared_ride = await loaders.shared_ride.load((user.id, ObjectId(user_id)))
         
-        if not shared_rides:
+        if not shared_ride:
             raise HTTPException(status_code=403, detail="Not authorized to view this user's feedback summary")
     
-    # Get all feedback for the user
-    feedback_list = await feedback_collection.find({
-        "to_user_id": ObjectId(user_id)
-    }).to_list(1000)
-    
-    if not feedback_list:
-        return {
-            "user_id": user_id,
-            "total_feedback": 0,
-            "average_rating": 0.0,
-            "rating_distribution": {},
-            "category_breakdown": {},
-            "recent_feedback": []
-        }
-    
-    # Calculate statistics
-    ratings = [f.get("rating", 0) for f in feedback_list]
-    average_rating = statistics.mean(ratings) if ratings else 0.0
-    
-    # Rating distribution
-    rating_distribution = {}
-    for rating in range(1, 6):
-        rating_distribution[rating] = ratings.count(rating)
-    
-    # Category breakdown
-    category_breakdown = {}
-    for feedback in feedback_list:
-        category = feedback.get("category", "general")
-        if category not in category_breakdown:
-            category_breakdown[category] = {"count": 0, "average_rating": 0.0}
-        
-        category_breakdown[category]["count"] += 1
-        category_breakdown[category]["average_rating"] += feedback.get("rating", 0)
-    
-    # Calculate average rating per category
-    for category in category_breakdown:
-        count = category_breakdown[category]["count"]
-        if count > 0:
-            category_breakdown[category]["average_rating"] /= count
+    # Statistics come from the running aggregates on the user's profile
+    profile = await loaders.user_profiles.load(ObjectId(user_id))
+    summary = rating_summary(profile.get("rating_stats") if profile else None)
     
     # Get recent feedback (last 5)
-    recent_feedback = await feedback_collection.find({
-        "to_user_id": ObjectId(user_id)
-    }).sort([("created_at", -1)]).limit(5).to_list(5)
+    recent_feedback = []
+    if summary["total_feedback"]:
+        recent_feedback = await feedback_collection.find({
+            "to_user_id": ObjectId(user_id)
+        }).sort([("created_at", -1)]).limit(5).to_list(5)
     
     return {
         "user_id": user_id,
-        "total_feedback": len(feedback_list),
-        "average_rating": round(average_rating, 2),
-        "rating_distribution": rating_distribution,
-        "category_breakdown": category_breakdown,
+        **summary,
         "recent_feedback": recent_feedback
     }
 
@@ -227,23 +200,29 @@ async def update_feedback(
         raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
     # Update the feedback
-    result = await feedback_collection.update_one(
-        {"_id": ObjectId(feedback_id)},
-        {
-            "$set": {
-                "rating": rating,
-                "comment": comment,
-                "category": category,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to update feedback")
-    
-    # Update user's average rating
-    await update_user_rating(feedback["to_user_id"])
+    async with transaction() as session:
+        result = await feedback_collection.update_one(
+            {"_id": ObjectId(feedback_id)},
+            {
+                "$set": {
+                    "rating": rating,
+                    "comment": comment,
+                    "category": category,
+                    "updated_at": datetime.utcnow()
+                }
+            },
+            session=session
+        )
+        
+        if result.modified_count == 0:
+            raise HTTPException(status_code=400, detail="Failed to update feedback")
+        
+        await apply_rating_change(
+            user_profiles_collection, feedback["to_user_id"],
+            added=(rating, category), removed=(feedback["rating"], feedback.get("category")),
+            session=session
+        )
+    invalidate_platform_analytics()
     
     updated_feedback = await feedback_collection.find_one({"_id": ObjectId(feedback_id)})
     return updated_feedback
@@ -267,16 +246,32 @@ async def delete_feedback(
         raise HTTPException(status_code=403, detail="Not authorized to delete this feedback")
     
     # Delete the feedback
-    result = await feedback_collection.delete_one({"_id": ObjectId(feedback_id)})
-    
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to delete feedback")
-    
-    # Update user's average rating
-    await update_user_rating(feedback["to_user_id"])
+    async with transaction() as session:
+        result = await feedback_collection.delete_one({"_id": ObjectId(feedback_id)}, session=session)
+        
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=400, detail="Failed to delete feedback")
+        
+        await apply_rating_change(
+            user_profiles_collection, feedback["to_user_id"],
+            removed=(feedback["rating"], feedback.get("category")), session=session
+        )
+    invalidate_platform_analytics()
     
     return {"message": "Feedback deleted successfully"}
 
+# Platform analytics results per period_days: period_days -> (expires_at, report).
+# Dropped whenever feedback changes in this process; other processes' writes
+# show up within FEEDBACK_ANALYTICS_CACHE_SECONDS.
+_platform_analytics_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+_platform_analytics_generation = 0
+_platform_analytics_lock = asyncio.Lock()
+
+def invalidate_platform_analytics():
+    global _platform_analytics_generation
+    _platform_analytics_generation += 1
+    _platform_analytics_cache.clear()
+
 @router.get("/analytics/platform", response_model=Dict[str, Any])
 async def get_platform_feedback_analytics(
     period_days: int = 30,
@@ -287,15 +282,61 @@ async def get_platform_feedback_analytics(
     if not user.is_verified_driver:
         raise HTTPException(status_code=403, detail="Only verified users can access analytics")
     
-    # Calculate period
+    cached = _platform_analytics_cache.get(period_days)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    
+    # One report build at a time; callers that waited reuse its result
+    async with _platform_analytics_lock:
+        cached = _platform_analytics_cache.get(period_days)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        generation = _platform_analytics_generation
+        report = await build_platform_feedback_analytics(period_days)
+        if generation == _platform_analytics_generation:
+            _platform_analytics_cache[period_days] = (time.monotonic() + settings.FEEDBACK_ANALYTICS_CACHE_SECONDS, report)
+    return report
+
+async def build_platform_feedback_analytics(period_days: int) -> Dict[str, Any]:
+    """Distribution, category averages and top-rated users in one $facet aggregation"""
     period_start = datetime.utcnow() - timedelta(days=period_days)
+    pipeline = [
+        {"$match": {"created_at": {"$gte": period_start}}},
+        {
+            "$facet": {
+                "overall": [
+                    {"$group": {"_id": None, "total_feedback": {"$sum": 1}, "average_rating": {"$avg": "$rating"}}}
+                ],
+                "rating_distribution": [
+                    {"$group": {"_id": "$rating", "count": {"$sum": 1}}}
+                ],
+                "category_breakdown": [
+                    {
+                        "$group": {
+                            "_id": {"$ifNull": ["$category", "general"]},
+                            "count": {"$sum": 1},
+                            "average_rating": {"$avg": "$rating"}
+                        }
+                    }
+                ],
+                "top_rated_users": [
+                    {
+                        "$group": {
+                            "_id": "$to_user_id",
+                            "total_feedback": {"$sum": 1},
+                            "average_rating": {"$avg": "$rating"}
+                        }
+                    },
+                    {"$match": {"total_feedback": {"$gte": 3}}},  # At least 3 feedback entries
+                    {"$sort": {"average_rating": -1}},
+                    {"$limit": 10}
+                ]
+            }
+        }
+    ]
+    result = (await feedback_collection.aggregate(pipeline).to_list(1))[0]
     
-    # Get all feedback in the period
-    feedback_list = await feedback_collection.find({
-        "created_at": {"$gte": period_start}
-    }).to_list(1000)
-    
-    if not feedback_list:
+    if not result["overall"]:
         return {
             "period_days": period_days,
             "total_feedback": 0,
@@ -305,94 +346,16 @@ async def get_platform_feedback_analytics(
             "top_rated_users": []
         }
     
-    # Calculate statistics
-    ratings = [f.get("rating", 0) for f in feedback_list]
-    average_rating = statistics.mean(ratings) if ratings else 0.0
-    
-    # Rating distribution
-    rating_distribution = {}
-    for rating in range(1, 6):
-        rating_distribution[rating] = ratings.count(rating)
-    
-    # Category breakdown
-    category_breakdown = {}
-    for feedback in feedback_list:
-        category = feedback.get("category", "general")
-        if category not in category_breakdown:
-            category_breakdown[category] = {"count": 0, "average_rating": 0.0}
-        
-        category_breakdown[category]["count"] += 1
-        category_breakdown[category]["average_rating"] += feedback.get("rating", 0)
-    
-    # Calculate average rating per category
-    for category in category_breakdown:
-        count = category_breakdown[category]["count"]
-        if count > 0:
-            category_breakdown[category]["average_rating"] /= count
-    
-    # Get top-rated users
-    pipeline = [
-        {
-            "$match": {
-                "created_at": {"$gte": period_start}
-            }
-        },
-        {
-            "$group": {
-                "_id": "$to_user_id",
-                "total_feedback": {"$sum": 1},
-                "average_rating": {"$avg": "$rating"}
-            }
-        },
-        {
-            "$match": {
-                "total_feedback": {"$gte": 3}  # At least 3 feedback entries
-            }
-        },
-        {
-            "$sort": {"average_rating": -1}
-        },
-        {
-            "$limit": 10
-        }
-    ]
-    
-    top_rated_users = await feedback_collection.aggregate(pipeline).to_list(10)
-    
+    overall = result["overall"][0]
+    stars = {row["_id"]: row["count"] for row in result["rating_distribution"]}
     return {
         "period_days": period_days,
-        "total_feedback": len(feedback_list),
-        "average_rating": round(average_rating, 2),
-        "rating_distribution": rating_distribution,
-        "category_breakdown": category_breakdown,
-        "top_rated_users": top_rated_users
+        "total_feedback": overall["total_feedback"],
+        "average_rating": round(overall["average_rating"] or 0.0, 2),
+        "rating_distribution": {rating: stars.get(rating, 0) for rating in range(1, 6)},
+        "category_breakdown": {
+            row["_id"]: {"count": row["count"], "average_rating": row["average_rating"] or 0.0}
+            for row in result["category_breakdown"]
+        },
+        "top_rated_users": result["top_rated_users"]
     }
-
-async def update_user_rating(user_id: PyObjectId):
-    """Update a user's average rating based on all feedback"""
-    try:
-        # Get all feedback for the user
-        feedback_list = await feedback_collection.find({
-            "to_user_id": user_id
-        }).to_list(1000)
-        
-        if not feedback_list:
-            return
-        
-        # Calculate average rating
-        ratings = [f.get("rating", 0) for f in feedback_list]
-        average_rating = statistics.mean(ratings) if ratings else 0.0
-        
-        # Update user profile
-        await user_profiles_collection.update_one(
-            {"user_id": user_id},
-            {
-                "$set": {
-                    "rating": round(average_rating, 2),
-                    "total_rides": len(feedback_list),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-    except Exception as e:
-        print(f"Failed to update user rating: {e}") 
\ No newline at end of file
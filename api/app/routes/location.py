@@ -2,10 +2,13 @@ from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisco
 from app.schemas import LocationUpdate, PyObjectId
 from app.database import locations_collection, rides_collection, drivers_collection
 from app.auth import User
+from app.responses import mongo_json_response
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
+from app.surge import surge_engine
 from fastapi_users import FastAPIUsers
 from app.auth import auth_backend, get_user_db
 import uuid
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
 import json
 from datetime import datetime, timedelta
@@ -35,6 +38,8 @@ async def update_location(
     
     location_dict = location.dict(by_alias=True, exclude_unset=True)
     result = await locations_collection.insert_one(location_dict)
+    if user.is_driver:
+        surge_engine.record_driver(user.id, location.coordinates)
     
     # Update driver's current location if they're online
     if location.ride_id:
@@ -80,6 +85,7 @@ async def store_location_for_analytics(location: LocationUpdate):
 async def get_user_recent_locations(
     user_id: str,
     limit: int = 10,
+    cursor: Optional[str] = None,
     user: User = Depends(fastapi_users.current_user)
 ):
     """Get recent location updates for a user"""
@@ -99,12 +105,13 @@ async def get_user_recent_locations(
         if not user_ride or str(user_ride["_id"]) != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to view this user's location")
     
-    locations = await locations_collection.find(
-        {"user_id": ObjectId(user_id)},
-        sort=[("timestamp", -1)]
-    ).limit(limit).to_list(limit)
-    
-    return locations
+    try:
+        locations, next_cursor = await fetch_page(
+            locations_collection, {"user_id": ObjectId(user_id)}, clamp_limit(limit, default=10), cursor, field="timestamp"
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(locations, headers={NEXT_CURSOR_HEADER: next_cursor}, model=LocationUpdate)
 
 @router.get("/ride/{ride_id}/participants", response_model=List[LocationUpdate])
 async def get_ride_participants_locations(
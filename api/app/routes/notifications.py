@@ -1,36 +1,53 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from app.schemas import Notification, PyObjectId
-from app.database import notifications_collection, rides_collection
+from app.database import notifications_collection, rides_collection, drivers_collection
 from app.auth import User, fastapi_users
+from app.responses import mongo_json_response
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
+from app.outbox import outbox_handler
+from app.push import WebSocketPush, get_push_transport, token_user_id
+from app.unread import unread_counter
+from app.notification_trim import notification_trimmer
+from app.notification_digest import DIGEST_TYPES, notification_digester
+from app.config import settings
 from bson import ObjectId
-from typing import List
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from typing import Iterable, List, Optional
 from datetime import datetime, timedelta
+import asyncio
 import uuid
 
 router = APIRouter()
 
+FANOUT_BATCH_SIZE = 1000  # notifications per insert_many
+MAX_ZONE_RADIUS_KM = 50
+DUPLICATE_KEY = 11000
+NEVER_COALESCE = {"safety_alert", "emergency_alert"}  # every one of these stands on its own
+COALESCE_ATTEMPTS = 3
+
 @router.get("/", response_model=List[Notification])
 async def get_user_notifications(
-    limit: int = 50,
+    limit: int = DEFAULT_PAGE_SIZE,
     unread_only: bool = False,
+    cursor: Optional[str] = None,
     user: User = Depends(fastapi_users.current_user)
 ):
-    """Get notifications for the current user"""
+    """Get notifications for the current user, newest first"""
     query = {"to_user_id": user.id}
     if unread_only:
         query["is_read"] = False
     
-    notifications = await notifications_collection.find(query).sort("created_at", -1).limit(limit).to_list(limit)
-    return notifications
+    try:
+        notifications, next_cursor = await fetch_page(notifications_collection, query, clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(notifications, headers={NEXT_CURSOR_HEADER: next_cursor}, model=Notification)
 
 @router.get("/unread-count", response_model=dict)
 async def get_unread_count(user: User = Depends(fastapi_users.current_user)):
     """Get count of unread notifications"""
-    count = await notifications_collection.count_documents({
-        "to_user_id": user.id,
-        "is_read": False
-    })
-    return {"unread_count": count}
+    return {"unread_count": await unread_counter.get(user.id)}
 
 @router.put("/{notification_id}/read", response_model=dict)
 async def mark_notification_read(notification_id: str, user: User = Depends(fastapi_users.current_user)):
@@ -39,11 +56,15 @@ async def mark_notification_read(notification_id: str, user: User = Depends(fast
         raise HTTPException(status_code=400, detail="Invalid notification ID")
     
     result = await notifications_collection.update_one(
-        {"_id": ObjectId(notification_id), "to_user_id": user.id},
+        {"_id": ObjectId(notification_id), "to_user_id": user.id, "is_read": False},
         {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
     )
     
-    if result.modified_count == 0:
+    if result.modified_count:
+        await unread_counter.add(user.id, -1)
+    elif not await notifications_collection.count_documents(
+        {"_id": ObjectId(notification_id), "to_user_id": user.id}, limit=1
+    ):
         raise HTTPException(status_code=404, detail="Notification not found")
     
     return {"message": "Notification marked as read"}
@@ -55,6 +76,7 @@ async def mark_all_notifications_read(user: User = Depends(fastapi_users.current
         {"to_user_id": user.id, "is_read": False},
         {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
     )
+    await unread_counter.add(user.id, -result.modified_count)
     
     return {"message": f"Marked {result.modified_count} notifications as read"}
 
@@ -64,13 +86,15 @@ async def delete_notification(notification_id: str, user: User = Depends(fastapi
     if not ObjectId.is_valid(notification_id):
         raise HTTPException(status_code=400, detail="Invalid notification ID")
     
-    result = await notifications_collection.delete_one({
-        "_id": ObjectId(notification_id),
-        "to_user_id": user.id
-    })
+    deleted = await notifications_collection.find_one_and_delete(
+        {"_id": ObjectId(notification_id), "to_user_id": user.id},
+        projection={"is_read": 1}
+    )
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Notification not found")
+    if not deleted.get("is_read"):
+        await unread_counter.add(user.id, -1)
     
     return {"message": "Notification deleted successfully"}
 
@@ -79,12 +103,19 @@ async def clear_old_notifications(days: int = 30, user: User = Depends(fastapi_u
     """Clear notifications older than specified days"""
     cutoff_date = datetime.utcnow() - timedelta(days=days)
     
+    # Unread ones separately, so the counter knows how many it lost
+    unread = await notifications_collection.delete_many({
+        "to_user_id": user.id,
+        "is_read": False,
+        "created_at": {"$lt": cutoff_date}
+    })
+    await unread_counter.add(user.id, -unread.deleted_count)
     result = await notifications_collection.delete_many({
         "to_user_id": user.id,
         "created_at": {"$lt": cutoff_date}
     })
     
-    return {"message": f"Cleared {result.deleted_count} old notifications"}
+    return {"message": f"Cleared {unread.deleted_count + result.deleted_count} old notifications"}
 
 @router.post("/send", response_model=dict)
 async def send_notification(
@@ -101,26 +132,98 @@ async def send_notification(
     if not ObjectId.is_valid(to_user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
     
-    notification_data = {
-        "to_user_id": ObjectId(to_user_id),
-        "from_user_id": user.id,
-        "notification_type": notification_type,
-        "title": title,
-        "message": message,
-        "priority": priority,
-        "is_read": False,
-        "created_at": datetime.utcnow()
-    }
+    ride_object_id = ObjectId(ride_id) if ride_id and ObjectId.is_valid(ride_id) else None
+    created = await fan_out(
+        [ObjectId(to_user_id)], notification_type, title, message,
+        priority=priority, ride_id=ride_object_id, from_user_id=user.id, data=data
+    )
     
-    if ride_id and ObjectId.is_valid(ride_id):
-        notification_data["ride_id"] = ObjectId(ride_id)
+    notification_id = str(created[0]["_id"]) if created else None  # None when queued for a digest
+    return {"message": "Notification sent successfully", "notification_id": notification_id}
+
+@router.post("/send/ride/{ride_id}", response_model=dict)
+async def send_ride_notification(
+    ride_id: str,
+    notification_type: str,
+    title: str,
+    message: str,
+    priority: str = "normal",
+    data: dict = None,
+    user: User = Depends(fastapi_users.current_user)
+):
+    """Notify everyone on a ride you're driving"""
+    if not ObjectId.is_valid(ride_id):
+        raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    if data:
-        notification_data["data"] = data
+    ride = await rides_collection.find_one(
+        {"_id": ObjectId(ride_id), "driver_id": user.id},
+        {"driver_id": 1, "passenger_id": 1, "passengers": 1}
+    )
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
     
-    result = await notifications_collection.insert_one(notification_data)
+    recipients = [user_id for user_id in ride_participants(ride) if user_id != user.id]
+    created = await fan_out(
+        recipients, notification_type, title, message,
+        priority=priority, ride_id=ride["_id"], from_user_id=user.id, data=data
+    )
     
-    return {"message": "Notification sent successfully", "notification_id": str(result.inserted_id)}
+    return {"message": f"Notified {len(created)} ride participants", "recipients": len(created)}
+
+@router.post("/send/zone", response_model=dict)
+async def send_zone_notification(
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    notification_type: str,
+    title: str,
+    message: str,
+    priority: str = "normal",
+    data: dict = None,
+    user: User = Depends(fastapi_users.current_user)
+):
+    """Notify every online driver within `radius_km` of a point (admins only)"""
+    if not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Only admins can notify a zone")
+    if not 0 < radius_km <= MAX_ZONE_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"radius_km must be between 0 and {MAX_ZONE_RADIUS_KM}")
+    
+    drivers = drivers_collection.find(
+        {
+            "is_online": True,
+            "current_location": {
+                "$geoWithin": {"$centerSphere": [[longitude, latitude], radius_km / 6371]}  # MongoDB uses [lng, lat]
+            }
+        },
+        {"driver_id": 1}
+    )
+    recipients = [driver["driver_id"] async for driver in drivers]
+    created = await fan_out(
+        recipients, notification_type, title, message,
+        priority=priority, from_user_id=user.id, data=data
+    )
+    
+    return {"message": f"Notified {len(created)} drivers", "recipients": len(created)}
+
+@router.websocket("/ws")
+async def notifications_websocket(websocket: WebSocket, token: str = None):
+    """Push channel: new notifications arrive as {"type": "notification", ...} frames"""
+    user_id = token_user_id(token)
+    transport = get_push_transport()
+    if user_id is None or not isinstance(transport, WebSocketPush):
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    transport.connect(user_id, websocket)
+    try:
+        while True:
+            # Nothing is expected from the client; this just notices the disconnect
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        transport.disconnect(user_id, websocket)
 
 @router.get("/types", response_model=dict)
 async def get_notification_types():
@@ -128,6 +231,7 @@ async def get_notification_types():
     return {
         "notification_types": [
             "ride_request",
+            "ride_matched",
             "ride_accepted",
             "ride_rejected",
             "ride_started",
@@ -144,39 +248,177 @@ async def get_notification_types():
             "earnings_update",
             "payout_processed",
             "system_update",
-            "promotion"
+            "promotion",
+            "digest"
         ]
     }
 
-# Helper function to create notifications
-async def create_notification(
-    to_user_id: ObjectId,
+def ride_participants(ride: dict) -> List:
+    """Driver and passengers of a ride, each once"""
+    participants = []
+    for user_id in [ride.get("driver_id"), ride.get("passenger_id"), *ride.get("passengers", [])]:
+        if user_id is not None and user_id not in participants:
+            participants.append(user_id)
+    return participants
+
+async def fan_out(
+    to_user_ids: Iterable,
     notification_type: str,
     title: str,
     message: str,
     priority: str = "normal",
     ride_id: ObjectId = None,
     from_user_id: ObjectId = None,
-    data: dict = None
-):
-    """Helper function to create notifications"""
-    notification_data = {
-        "to_user_id": to_user_id,
-        "notification_type": notification_type,
-        "title": title,
-        "message": message,
-        "priority": priority,
-        "is_read": False,
-        "created_at": datetime.utcnow()
-    }
-    
+    data: dict = None,
+    dedupe_key: str = None
+) -> List[dict]:
+    """Store one notification per recipient and push them out
+
+    Digest types are queued for the recipients' next digest instead. Ride
+    notifications coalesce: a recipient's unread notification of the same
+    type for the same ride from the last NOTIFICATION_COALESCE_SECONDS is
+    updated (latest title/message, `count` + 1) rather than joined by a new
+    one. With `dedupe_key` each recipient gets the notification at most once
+    per key, so retried outbox handlers don't notify twice. Returns the
+    notifications created or updated.
+    """
+    now = datetime.utcnow()
+    recipients = list(dict.fromkeys(user_id for user_id in to_user_ids if user_id is not None))
+    content = {"notification_type": notification_type, "title": title, "message": message}
     if from_user_id:
-        notification_data["from_user_id"] = from_user_id
+        content["from_user_id"] = from_user_id
+    if data:
+        content["data"] = data
     
-    if ride_id:
-        notification_data["ride_id"] = ride_id
+    if notification_type in DIGEST_TYPES:
+        await notification_digester.enqueue(recipients, content)
+        return []
     
-    if data:
-        notification_data["data"] = data
+    coalesce = (
+        ride_id is not None and not dedupe_key and settings.NOTIFICATION_COALESCE_SECONDS > 0
+        and notification_type not in NEVER_COALESCE
+    )
+    delivered = []
+    for start in range(0, len(recipients), FANOUT_BATCH_SIZE):
+        batch = []
+        for user_id in recipients[start:start + FANOUT_BATCH_SIZE]:
+            notification_data = {
+                "to_user_id": user_id,
+                **content,
+                "priority": priority,
+                "is_read": False,
+                "count": 1,
+                "created_at": now
+            }
+            if ride_id:
+                notification_data["ride_id"] = ride_id
+            if dedupe_key:
+                notification_data["dedupe_key"] = f"{dedupe_key}:{user_id}"
+            batch.append(notification_data)
+        
+        if coalesce:
+            delivered.extend(await coalesce_notifications(batch))
+        else:
+            delivered.extend(await store_notifications(batch))
+    return delivered
+
+async def store_notifications(batch: List[dict]) -> List[dict]:
+    """insert_many new notifications (skipping dedupe_key repeats), count and push them"""
+    try:
+        await notifications_collection.insert_many(batch, ordered=False)
+        created = batch
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != DUPLICATE_KEY for error in errors):
+            raise
+        duplicates = {error["index"] for error in errors}
+        created = [doc for index, doc in enumerate(batch) if index not in duplicates]
+    
+    await announce_notifications(created, [])
+    return created
+
+async def coalesce_notifications(batch: List[dict]) -> List[dict]:
+    """Merge each notification into its recipient's recent unread one, or insert it"""
+    window_start = datetime.utcnow() - timedelta(seconds=settings.NOTIFICATION_COALESCE_SECONDS)
     
-    await notifications_collection.insert_one(notification_data)
\ No newline at end of file
+    async def merge(notification: dict) -> dict:
+        # One open (unread) group per recipient, type and ride, enforced by a
+        # partial unique index on coalesce_key so concurrent upserts can't
+        # both insert; the loser retries and merges into the winner's group
+        key = f"{notification['to_user_id']}:{notification['notification_type']}:{notification['ride_id']}"
+        latest = {field: notification[field] for field in ("title", "message", "from_user_id", "data") if field in notification}
+        for attempt in range(COALESCE_ATTEMPTS):
+            try:
+                return await notifications_collection.find_one_and_update(
+                    {"coalesce_key": key, "is_read": False, "created_at": {"$gte": window_start}},
+                    {
+                        "$set": {**latest, "updated_at": notification["created_at"]},
+                        "$setOnInsert": {
+                            "to_user_id": notification["to_user_id"],
+                            "notification_type": notification["notification_type"],
+                            "ride_id": notification["ride_id"],
+                            "priority": notification["priority"],
+                            "created_at": notification["created_at"]
+                        },
+                        "$inc": {"count": 1}
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                if attempt == COALESCE_ATTEMPTS - 1:
+                    raise
+                # The open group may be older than the window: close it so a new one can start
+                await notifications_collection.update_many(
+                    {"coalesce_key": key, "is_read": False, "created_at": {"$lt": window_start}},
+                    {"$unset": {"coalesce_key": ""}}
+                )
+    
+    delivered = await asyncio.gather(*(merge(notification) for notification in batch))
+    created = [notification for notification in delivered if notification["count"] == 1]
+    merged = [notification for notification in delivered if notification["count"] > 1]
+    await announce_notifications(created, merged)
+    return delivered
+
+async def announce_notifications(created: List[dict], merged: List[dict]) -> None:
+    """Bump unread counters for new notifications and push new and merged ones"""
+    if created:
+        await unread_counter.adjust({notification["to_user_id"]: 1 for notification in created})
+        notification_trimmer.touch(notification["to_user_id"] for notification in created)
+    if created or merged:
+        await get_push_transport().push_notifications(created + merged)
+
+async def create_notification(
+    to_user_id: ObjectId,
+    notification_type: str,
+    title: str,
+    message: str,
+    priority: str = "normal",
+    ride_id: ObjectId = None,
+    from_user_id: ObjectId = None,
+    data: dict = None,
+    dedupe_key: str = None
+):
+    """Helper function to create a single notification (see fan_out)"""
+    await fan_out(
+        [to_user_id], notification_type, title, message,
+        priority=priority, ride_id=ride_id, from_user_id=from_user_id, data=data, dedupe_key=dedupe_key
+    )
+
+# Ride status changes the other people on the ride are told about
+TRANSITION_NOTIFICATIONS = {
+    "confirmed": ("ride_accepted", "Ride confirmed", "Your driver has confirmed the ride."),
+    "in_progress": ("ride_started", "Ride started", "Your ride is under way."),
+    "completed": ("ride_completed", "Ride completed", "Your ride has been completed."),
+    "cancelled": ("ride_cancelled", "Ride cancelled", "Your ride has been cancelled."),
+}
+
+@outbox_handler(*(f"ride.{status}" for status in TRANSITION_NOTIFICATIONS))
+async def notify_ride_transition(event: dict, key: str):
+    """Notify a ride's driver and passengers (except whoever made the change)"""
+    template = TRANSITION_NOTIFICATIONS[event["to_status"]]
+    recipients = [user_id for user_id in ride_participants(event) if user_id != event.get("actor_id")]
+    await fan_out(
+        recipients, template[0], template[1], template[2],
+        ride_id=event["ride_id"], from_user_id=event.get("actor_id"), dedupe_key=key
+    )
@@ -1,9 +1,18 @@
 from fastapi import APIRouter, HTTPException, Depends
-from app.schemas import PricingEstimate, DriverEarnings, PyObjectId
-from app.database import pricing_estimates_collection, driver_earnings_collection, rides_collection
+from app.schemas import PricingEstimate, BatchQuoteRequest, DriverEarnings, PyObjectId
+from app.database import driver_earnings_collection, driver_earnings_daily_collection, rides_collection
 from app.auth import User, fastapi_users
+from app.responses import mongo_json_response
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
+from app.outbox import outbox_handler, transaction
+from app.earnings import rollup_increment, rollup_summary_pipeline, summary_pipeline, summary_totals
+from app.surge import surge_engine
+from app.quotes import estimate_sampler, issue_quote
+from app.routing import RouteLeg, route_estimator
+from app.config import settings
 from bson import ObjectId
-from typing import List
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid
 
@@ -13,6 +22,13 @@ router = APIRouter()
 BASE_PRICE_PER_KM = 0.5  # £0.50 per km
 BASE_PRICE_PER_MINUTE = 0.1  # £0.10 per minute
 PLATFORM_FEE_PERCENTAGE = 0.15  # 15% platform fee
+RIDE_TYPE_MULTIPLIERS = {
+    "standard": 1.0,
+    "premium": 1.5,
+    "eco": 0.8,
+    "luxury": 2.0
+}
+MAX_BATCH_DROPOFFS = 20
 
 @router.post("/estimate", response_model=PricingEstimate)
 async def estimate_ride_price(
@@ -22,80 +38,107 @@ async def estimate_ride_price(
     user: User = Depends(fastapi_users.current_user)
 ):
     """Estimate ride price based on distance and time"""
-    # Calculate distance (simplified - in production, use proper routing service)
-    import math
+    # Road distance/duration: corridor cache, else OSRM within the latency budget, else the fallback model
+    route = (await route_estimator.routes(pickup_coords, [dropoff_coords]))[0]
     
-    def calculate_distance(lat1, lon1, lat2, lon2):
-        R = 6371  # Earth's radius in kilometers
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2) * math.sin(dlon/2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        return R * c
+    # Surge from live demand/supply around the pickup (precomputed grid, no DB access)
+    surge_multiplier, demand_ratio = surge_engine.quote(pickup_coords)
     
-    distance_km = calculate_distance(pickup_coords[0], pickup_coords[1], dropoff_coords[0], dropoff_coords[1])
+    estimate_data = price_estimate(route, ride_type, surge_multiplier, demand_ratio)
     
-    # Estimate duration (simplified - assume average speed of 30 km/h)
-    estimated_duration_minutes = int((distance_km / 30) * 60)
+    # Nothing is written here: the quote token carries the estimate until it is
+    # booked, and only a sample is kept for analytics (batched off the request)
+    estimate_sampler.offer(estimate_data)
+    estimate_data["quote_token"], estimate_data["quote_expires_at"] = issue_quote(user.id, estimate_data)
     
-    # Calculate base price
-    base_price = (distance_km * BASE_PRICE_PER_KM) + (estimated_duration_minutes * BASE_PRICE_PER_MINUTE)
+    return estimate_data
+
+@router.post("/estimate/batch", response_model=dict)
+async def estimate_ride_prices(
+    request: BatchQuoteRequest,
+    user: User = Depends(fastapi_users.current_user)
+):
+    """Quote every ride type to several destinations from one pickup"""
+    ride_types = request.ride_types or list(RIDE_TYPE_MULTIPLIERS)
+    unknown = [ride_type for ride_type in ride_types if ride_type not in RIDE_TYPE_MULTIPLIERS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown ride types: {', '.join(unknown)}")
+    if not request.dropoffs or len(request.dropoffs) > MAX_BATCH_DROPOFFS:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {MAX_BATCH_DROPOFFS} dropoffs")
+    
+    # One routing call for all destinations and one surge lookup for the pickup
+    routes = await route_estimator.routes(request.pickup_coords, request.dropoffs)
+    surge_multiplier, demand_ratio = surge_engine.quote(request.pickup_coords)
+    
+    quotes = []
+    for dropoff_coords, route in zip(request.dropoffs, routes):
+        prices = {}
+        for ride_type in ride_types:
+            estimate_data = price_estimate(route, ride_type, surge_multiplier, demand_ratio)
+            estimate_sampler.offer(estimate_data)
+            token, expires_at = issue_quote(user.id, estimate_data)
+            prices[ride_type] = {
+                "final_price": estimate_data["final_price"],
+                "base_price": estimate_data["base_price"],
+                "quote_token": token,
+                "quote_expires_at": expires_at
+            }
+        quotes.append({
+            "dropoff_coords": dropoff_coords,
+            "distance_km": route.distance_km,
+            "estimated_duration_minutes": int(route.duration_minutes),
+            "distance_source": route.source,
+            "prices": prices
+        })
     
-    # Apply multipliers based on ride type
-    multipliers = {
-        "standard": 1.0,
-        "premium": 1.5,
-        "eco": 0.8,
-        "luxury": 2.0
+    return {
+        "pickup_coords": request.pickup_coords,
+        "surge_multiplier": surge_multiplier,
+        "demand_supply_ratio": demand_ratio,
+        "quotes": quotes
     }
+
+def price_estimate(route: RouteLeg, ride_type: str, surge_multiplier: float, demand_ratio: float) -> dict:
+    """Priced estimate for one trip and ride type"""
+    distance_km = route.distance_km
+    duration_minutes = int(route.duration_minutes)
     
-    ride_multiplier = multipliers.get(ride_type, 1.0)
-    
-    # Calculate surge pricing (simplified)
-    current_hour = datetime.utcnow().hour
-    surge_multiplier = 1.0
-    
-    # Peak hours (7-9 AM, 5-7 PM)
-    if current_hour in [7, 8, 9, 17, 18, 19]:
-        surge_multiplier = 1.3
+    # Calculate base price
+    base_price = (distance_km * BASE_PRICE_PER_KM) + (duration_minutes * BASE_PRICE_PER_MINUTE)
     
-    # Weekend nights
-    if datetime.utcnow().weekday() >= 5 and current_hour >= 22:
-        surge_multiplier = 1.5
+    # Apply multipliers based on ride type
+    ride_multiplier = RIDE_TYPE_MULTIPLIERS.get(ride_type, 1.0)
     
     # Calculate final price
     final_price = base_price * ride_multiplier * surge_multiplier
     
-    # Create pricing estimate
-    estimate_data = {
-        "ride_id": ObjectId(),  # Temporary ID for estimate
+    return {
         "base_price": base_price,
         "distance_km": distance_km,
-        "estimated_duration_minutes": estimated_duration_minutes,
+        "estimated_duration_minutes": duration_minutes,
         "surge_multiplier": surge_multiplier,
         "time_multiplier": ride_multiplier,
-        "demand_multiplier": 1.0,  # Could be calculated based on demand
+        "demand_multiplier": surge_multiplier,
         "final_price": final_price,
         "breakdown": {
             "base_price": base_price,
             "distance_price": distance_km * BASE_PRICE_PER_KM,
-            "time_price": estimated_duration_minutes * BASE_PRICE_PER_MINUTE,
+            "time_price": duration_minutes * BASE_PRICE_PER_MINUTE,
             "ride_type_multiplier": ride_multiplier,
             "surge_multiplier": surge_multiplier,
+            "demand_supply_ratio": demand_ratio,
+            "distance_source": route.source,
             "final_price": final_price
         },
         "estimated_at": datetime.utcnow()
     }
-    
-    result = await pricing_estimates_collection.insert_one(estimate_data)
-    estimate_data["id"] = result.inserted_id
-    
-    return estimate_data
 
 @router.get("/earnings", response_model=List[DriverEarnings])
 async def get_driver_earnings(
     start_date: datetime = None,
     end_date: datetime = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
     user: User = Depends(fastapi_users.current_user)
 ):
     """Get driver earnings"""
@@ -111,8 +154,11 @@ async def get_driver_earnings(
     elif end_date:
         query["created_at"] = {"$lte": end_date}
     
-    earnings = await driver_earnings_collection.find(query).sort("created_at", -1).to_list(100)
-    return earnings
+    try:
+        earnings, next_cursor = await fetch_page(driver_earnings_collection, query, clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(earnings, headers={NEXT_CURSOR_HEADER: next_cursor}, model=DriverEarnings)
 
 @router.get("/earnings/summary", response_model=dict)
 async def get_earnings_summary(
@@ -134,22 +180,16 @@ async def get_earnings_summary(
     else:
         start_date = now - timedelta(days=30)
     
-    # Get earnings for the period
-    earnings = await driver_earnings_collection.find({
-        "driver_id": user.id,
-        "created_at": {"$gte": start_date}
-    }).to_list(1000)
-    
-    total_gross = sum(earning["gross_earnings"] for earning in earnings)
-    total_platform_fee = sum(earning["platform_fee"] for earning in earnings)
-    total_net = sum(earning["net_earnings"] for earning in earnings)
-    
-    # Get ride count
-    ride_count = await rides_collection.count_documents({
-        "driver_id": user.id,
-        "status": "completed",
-        "created_at": {"$gte": start_date}
-    })
+    # One server-side pass: earnings totals plus the completed-ride count
+    if settings.EARNINGS_SUMMARY_FROM_ROLLUP:
+        rows = await driver_earnings_daily_collection.aggregate(rollup_summary_pipeline(user.id, start_date)).to_list(1)
+    else:
+        rows = await driver_earnings_collection.aggregate(summary_pipeline(user.id, start_date)).to_list(1)
+    totals = summary_totals(rows[0] if rows else None)
+    total_gross = totals["gross_earnings"]
+    total_platform_fee = totals["platform_fees"]
+    total_net = totals["net_earnings"]
+    ride_count = totals["rides"]
     
     return {
         "period": period,
@@ -184,7 +224,20 @@ async def calculate_ride_earnings(
     if existing_earnings:
         raise HTTPException(status_code=400, detail="Earnings already calculated for this ride")
     
-    # Calculate earnings
+    earnings_id, earnings_data = await book_ride_earnings(ride)
+    if earnings_id is None:
+        raise HTTPException(status_code=400, detail="Earnings already calculated for this ride")
+    
+    return {
+        "message": "Earnings calculated successfully",
+        "earnings_id": str(earnings_id),
+        "gross_earnings": earnings_data["gross_earnings"],
+        "platform_fee": earnings_data["platform_fee"],
+        "net_earnings": earnings_data["net_earnings"]
+    }
+
+def ride_earnings(ride: dict) -> dict:
+    """Earnings record for a completed ride"""
     total_price = ride.get("total_price", 0)
     if total_price == 0:
         # Calculate from distance if total_price not set
@@ -192,28 +245,48 @@ async def calculate_ride_earnings(
         total_price = distance_km * BASE_PRICE_PER_KM
     
     platform_fee = total_price * PLATFORM_FEE_PERCENTAGE
-    net_earnings = total_price - platform_fee
-    
-    # Create earnings record
-    earnings_data = {
-        "driver_id": user.id,
-        "ride_id": ObjectId(ride_id),
+    return {
+        "driver_id": ride["driver_id"],
+        "ride_id": ride["_id"],
         "gross_earnings": total_price,
         "platform_fee": platform_fee,
-        "net_earnings": net_earnings,
+        "net_earnings": total_price - platform_fee,
         "payment_status": "pending",
         "created_at": datetime.utcnow()
     }
-    
-    result = await driver_earnings_collection.insert_one(earnings_data)
-    
-    return {
-        "message": "Earnings calculated successfully",
-        "earnings_id": str(result.inserted_id),
-        "gross_earnings": total_price,
-        "platform_fee": platform_fee,
-        "net_earnings": net_earnings
-    }
+
+@outbox_handler("ride.completed")
+async def record_ride_earnings(event: dict, key: str):
+    """Book the driver's earnings when a ride completes (once per ride)"""
+    ride = await rides_collection.find_one({"_id": event["ride_id"]})
+    if not ride or not ride.get("driver_id"):
+        return
+    await book_ride_earnings(ride)
+
+BOOKING_ATTEMPTS = 3
+
+async def book_ride_earnings(ride: dict):
+    """Insert the ride's earnings and add them to the daily rollup, unless already booked"""
+    earnings_data = ride_earnings(ride)
+    for attempt in range(BOOKING_ATTEMPTS):
+        try:
+            async with transaction() as session:
+                result = await driver_earnings_collection.update_one(
+                    {"ride_id": ride["_id"]}, {"$setOnInsert": earnings_data}, upsert=True, session=session
+                )
+                if result.upserted_id is None:
+                    return None, earnings_data
+                await driver_earnings_daily_collection.update_one(
+                    *rollup_increment(earnings_data), upsert=True, session=session
+                )
+            return result.upserted_id, earnings_data
+        except DuplicateKeyError:
+            # The unique ride_id index: a concurrent writer booked this ride first
+            return None, earnings_data
+        except OperationFailure as e:
+            # Concurrent upserts inside transactions conflict instead; the retry sees the winner's record
+            if not e.has_error_label("TransientTransactionError") or attempt == BOOKING_ATTEMPTS - 1:
+                raise
 
 @router.put("/earnings/{earnings_id}/payout", response_model=dict)
 async def process_payout(
@@ -265,21 +338,21 @@ async def get_pricing_rules():
             "price_per_km": BASE_PRICE_PER_KM,
             "price_per_minute": BASE_PRICE_PER_MINUTE
         },
-        "ride_type_multipliers": {
-            "standard": 1.0,
-            "premium": 1.5,
-            "eco": 0.8,
-            "luxury": 2.0
-        },
+        "ride_type_multipliers": RIDE_TYPE_MULTIPLIERS,
         "surge_pricing": {
-            "peak_hours": {
-                "hours": [7, 8, 9, 17, 18, 19],
-                "multiplier": 1.3
-            },
-            "weekend_nights": {
-                "hours": [22, 23, 0, 1, 2, 3, 4, 5, 6],
-                "multiplier": 1.5
-            }
+            "model": "demand_supply",
+            "window_seconds": settings.SURGE_WINDOW_SECONDS,
+            "max_multiplier": settings.SURGE_MAX_MULTIPLIER
+        },
+        "distance_model": {
+            "source": "osrm",
+            "latency_budget_ms": settings.ROUTE_LATENCY_BUDGET_MS,
+            "fallback": "haversine x calibrated detour factor"
         },
         "platform_fee_percentage": PLATFORM_FEE_PERCENTAGE * 100
     }
+
+@router.get("/pricing/routing-stats", response_model=dict)
+async def get_routing_stats(user: User = Depends(fastapi_users.current_user)):
+    """Route cache hit rate, OSRM latency and fallback accuracy for this process"""
+    return route_estimator.stats()
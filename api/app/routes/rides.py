@@ -1,121 +1,123 @@
 
 from fastapi import APIRouter, HTTPException, Depends
 from app.schemas import Ride, RideRequest, PyObjectId
-from app.database import rides_collection
+from app.database import rides_collection, user_profiles_collection
+from app.communities import doc_mask
 from app.auth import User, fastapi_users
+from app.responses import mongo_json_response, project
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
+from app.ride_queries import find_rides_for_user
+from app.ride_index import request_window, ride_match_index
+from app.batch_matcher import batch_matcher
+from app.routing import route_estimator
+from app.surge import surge_engine
+from app.quotes import InvalidQuote, persist_quote, read_quote
+from app.seats import confirm_hold, live_passenger_count, release_seat, reserve_seat
+from app.ride_states import STATUSES, explain_failure, transition
+from app.config import settings
 from bson import ObjectId
-from typing import List
-import requests
+from typing import List, Optional
 from datetime import datetime
 
 router = APIRouter()
 
-OSRM_URL = "http://router.project-osrm.org"
-
-async def get_detour(driver_route, passenger_pickup, passenger_dropoff):
-    """Calculate detour time when adding a passenger to an existing route"""
-    try:
-        # Route with passenger: driver_start -> passenger_pickup -> passenger_dropoff -> driver_end
-        url = f"{OSRM_URL}/route/v1/driving/{driver_route[0][0]},{driver_route[0][1]};{passenger_pickup[0]},{passenger_pickup[1]};{passenger_dropoff[0]},{passenger_dropoff[1]};{driver_route[1][0]},{driver_route[1][1]}?overview=false"
-        response = requests.get(url)
-        if response.status_code != 200:
-            return float('inf')  # Indicate an error or unreachable route
-
-        data = response.json()
-        detour_duration = data['routes'][0]['duration']
-
-        # Calculate original route duration: driver_start -> driver_end
-        url_original = f"{OSRM_URL}/route/v1/driving/{driver_route[0][0]},{driver_route[0][1]};{driver_route[1][0]},{driver_route[1][1]}?overview=false"
-        response_original = requests.get(url_original)
-        if response_original.status_code != 200:
-            return float('inf')
-        
-        data_original = response_original.json()
-        original_duration = data_original['routes'][0]['duration']
-
-        return detour_duration - original_duration
-    except Exception as e:
-        print(f"Error calculating detour: {e}")
-        return float('inf')
-
 @router.post("/", response_model=Ride)
-async def create_ride(ride: Ride, user: User = Depends(fastapi_users.current_user)):
+async def create_ride(ride: Ride, quote_token: Optional[str] = None, user: User = Depends(fastapi_users.current_user)):
     """Create a new ride"""
+    quote = load_quote(quote_token, user.id)
     ride.driver_id = user.id
     ride_dict = ride.dict(by_alias=True, exclude_unset=True)
+    if quote:
+        ride_dict["total_price"] = quote["est"]["final_price"]
+    profile = await user_profiles_collection.find_one({"user_id": user.id}, {"community_mask": 1, "communities": 1})
+    ride_dict["driver_community_mask"] = doc_mask(profile, "communities")
+    # Every ride carries a departure time so time-window matching can use the
+    # (status, scheduled_time, pickup_coords) index
+    if not ride_dict.get("scheduled_time"):
+        ride_dict["scheduled_time"] = ride_dict.get("pickup_time") or ride_dict.get("created_at") or datetime.utcnow()
     result = await rides_collection.insert_one(ride_dict)
     created_ride = await rides_collection.find_one({"_id": result.inserted_id})
     if created_ride is None:
         raise HTTPException(status_code=404, detail="Ride creation failed")
+    ride_match_index.add(created_ride)
+    if quote:
+        await persist_quote(quote, created_ride["_id"])
+    if ride_dict.get("pickup_coords"):
+        surge_engine.record_driver(user.id, ride_dict["pickup_coords"])
     return created_ride
 
 @router.get("/", response_model=List[Ride])
-async def get_all_rides():
-    """Get all rides"""
-    rides = await rides_collection.find().to_list(100)
-    return rides
-
-@router.get("/{ride_id}", response_model=Ride)
-async def get_ride_by_id(ride_id: str):
-    """Get a specific ride by ID"""
-    if not ObjectId.is_valid(ride_id):
-        raise HTTPException(status_code=400, detail="Invalid ride ID")
-    
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id)})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
-    
-    return ride
+async def get_all_rides(limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    """Get all rides, newest first (next page cursor in the X-Next-Cursor header)"""
+    try:
+        rides, next_cursor = await fetch_page(rides_collection, {}, clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(rides, headers={NEXT_CURSOR_HEADER: next_cursor}, model=Ride)
 
 @router.post("/find", response_model=List[Ride])
 async def find_rides(request: RideRequest, user: User = Depends(fastapi_users.current_user)):
     """Find available rides based on passenger request"""
-    # Find active rides within the specified radius of the passenger's pickup location
-    rides = await rides_collection.find({
-        "status": "active",
-        "passenger_id": None,  # Only find rides that don't have a passenger yet
-        "pickup_coords": {
-            "$near": {
-                "$geometry": {
-                    "type": "Point",
-                    "coordinates": request.pickup_coords
-                },
-                "$maxDistance": request.radius_km * 1000  # Convert km to meters
-            }
-        }
-    }).to_list(10)
+    surge_engine.record_demand(user.id, request.pickup_coords)
+    # Open rides whose pickup and dropoff cells neighbour the passenger's,
+    # best pickup + dropoff fit first
+    # (pruned to the departure window first when the request has a time)
+    await ride_match_index.ensure_fresh(rides_collection)
+    window = request_window(request.departure_time, request.time_window_minutes)
+    rides = ride_match_index.candidates(
+        request.pickup_coords, request.dropoff_coords, request.radius_km, window
+    )[:settings.MATCH_MAX_CANDIDATES]
 
-    # Filter rides based on detour
+    # Filter rides on the passenger's detour limit, with the same road-time
+    # detours the batch matcher uses
+    detours = await route_estimator.detours([
+        (ride["pickup_coords"], ride["dropoff_coords"], request.pickup_coords, request.dropoff_coords)
+        for ride in rides
+    ])
     matched_rides = []
-    for ride_data in rides:
-        ride = Ride(**ride_data)
-        driver_route = [ride.pickup_coords, ride.dropoff_coords]
-        detour = await get_detour(driver_route, request.pickup_coords, request.dropoff_coords)
-
-        # Set a threshold for the maximum acceptable detour (e.g., 600 seconds = 10 minutes)
-        if detour <= 600:
-            ride.detour_time_seconds = detour
+    for ride_data, (detour, _) in zip(rides, detours):
+        if detour <= request.max_detour_minutes * 60:
+            ride = Ride(**ride_data)
+            ride.detour_time_seconds = int(detour)
             matched_rides.append(ride)
 
     return matched_rides
 
+@router.post("/match-requests", response_model=dict, status_code=202)
+async def queue_match_request(request: RideRequest, user: User = Depends(fastapi_users.current_user)):
+    """Queue a ride request for the batch matcher; the result arrives as a notification"""
+    surge_engine.record_demand(user.id, request.pickup_coords)
+    request_id = await batch_matcher.submit(user.id, request)
+    return {"request_id": request_id, "status": "queued"}
+
+@router.delete("/match-requests/{request_id}", response_model=dict)
+async def cancel_match_request(request_id: str, user: User = Depends(fastapi_users.current_user)):
+    """Withdraw a queued ride request"""
+    if not await batch_matcher.cancel(request_id, user.id):
+        raise HTTPException(status_code=404, detail="Match request not found")
+    return {"message": "Match request cancelled"}
+
 @router.post("/{ride_id}/accept_passenger", response_model=dict)
-async def accept_ride_passenger(ride_id: str, user: User = Depends(fastapi_users.current_user)):
+async def accept_ride_passenger(ride_id: str, quote_token: Optional[str] = None,
+                                user: User = Depends(fastapi_users.current_user)):
     """Accept a ride as a passenger"""
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
-    
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "status": "active", "passenger_id": None})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or already accepted by a passenger")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"passenger_id": user.id, "status": "pending_driver_acceptance"}}
+    quote = load_quote(quote_token, user.id)
+    
+    # Claim and check in one conditional write, so concurrent accepts can't both win
+    set_fields = {"passenger_id": user.id}
+    if quote:
+        set_fields["total_price"] = quote["est"]["final_price"]
+    event = await transition(
+        rides_collection, ObjectId(ride_id), "pending_driver_acceptance",
+        scope={"passenger_id": None}, expected=["active"],
+        set_fields=set_fields, actor_id=user.id
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to accept ride as passenger")
+    if not event:
+        raise HTTPException(status_code=404, detail="Ride not found or already accepted by a passenger")
+    if quote:
+        await persist_quote(quote, ObjectId(ride_id))
     
     return {"message": "Ride accepted by passenger successfully"}
 
@@ -125,18 +127,11 @@ async def driver_accept_passenger(ride_id: str, user: User = Depends(fastapi_use
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "driver_id": user.id, "status": "pending_driver_acceptance"})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or not pending driver acceptance")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": "confirmed"}}
+    await apply_transition(
+        ride_id, "confirmed", user.id,
+        scope={"driver_id": user.id}, expected=["pending_driver_acceptance"]
     )
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to confirm ride")
-    
     return {"message": "Ride confirmed by driver successfully"}
 
 @router.put("/{ride_id}/start", response_model=dict)
@@ -145,22 +140,12 @@ async def start_ride(ride_id: str, user: User = Depends(fastapi_users.current_us
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "status": "confirmed"})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or not confirmed")
-    
-    # Check if user is driver or passenger
-    if ride.get("driver_id") != user.id and ride.get("passenger_id") != user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to start this ride")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": "in_progress", "pickup_time": datetime.utcnow()}}
+    await apply_transition(
+        ride_id, "in_progress", user.id,
+        scope=participant_scope(user.id), expected=["confirmed"],
+        set_fields={"pickup_time": datetime.utcnow()}
     )
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to start ride")
-    
     return {"message": "Ride started successfully"}
 
 @router.put("/{ride_id}/complete", response_model=dict)
@@ -169,102 +154,109 @@ async def complete_ride(ride_id: str, user: User = Depends(fastapi_users.current
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "status": "in_progress"})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or not in progress")
-    
-    # Check if user is driver or passenger
-    if ride.get("driver_id") != user.id and ride.get("passenger_id") != user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to complete this ride")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": "completed", "dropoff_time": datetime.utcnow()}}
+    await apply_transition(
+        ride_id, "completed", user.id,
+        scope=participant_scope(user.id),
+        set_fields={"dropoff_time": datetime.utcnow()}
     )
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to complete ride")
-    
     return {"message": "Ride completed successfully"}
 
 @router.get("/my_rides", response_model=List[Ride])
-async def get_my_rides(user: User = Depends(fastapi_users.current_user)):
-    """Get all rides for the current user (as driver or passenger)"""
-    print(f"Getting rides for user {user.id}")
-    
-    rides_as_passenger = await rides_collection.find({"passenger_id": user.id}).to_list(100)
-    rides_as_driver = await rides_collection.find({"driver_id": user.id}).to_list(100)
-    
-    print(f"Found {len(rides_as_passenger)} rides as passenger")
-    print(f"Found {len(rides_as_driver)} rides as driver")
-    
-    all_rides = rides_as_passenger + rides_as_driver
-    print(f"Total rides: {len(all_rides)}")
-    
-    # Log ride details for debugging
-    for ride in all_rides:
-        print(f"Ride {ride.get('_id')}: status={ride.get('status')}, driver={ride.get('driver_id')}, passenger={ride.get('passenger_id')}")
-    
-    return all_rides
+async def get_my_rides(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
+    """Get rides for the current user (as driver or passenger), newest first"""
+    try:
+        rides, next_cursor = await find_rides_for_user(rides_collection, user.id, clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(rides, headers={NEXT_CURSOR_HEADER: next_cursor}, model=Ride)
 
 @router.get("/active", response_model=List[Ride])
-async def get_active_rides(user: User = Depends(fastapi_users.current_user)):
+async def get_active_rides(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
     """Get active rides for the current user"""
-    active_rides = await rides_collection.find({
-        "$or": [
-            {"driver_id": user.id, "status": {"$in": ["active", "confirmed", "in_progress"]}},
-            {"passenger_id": user.id, "status": {"$in": ["confirmed", "in_progress"]}}
-        ]
-    }).to_list(100)
-    return active_rides
+    try:
+        active_rides, next_cursor = await find_rides_for_user(
+            rides_collection, user.id, clamp_limit(limit), cursor,
+            driver_statuses=["active", "confirmed", "in_progress"],
+            passenger_statuses=["confirmed", "in_progress"],
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(active_rides, headers={NEXT_CURSOR_HEADER: next_cursor}, model=Ride)
 
 @router.get("/user", response_model=dict)
-async def get_user_rides(user_id: str, user: User = Depends(fastapi_users.current_user)):
+async def get_user_rides(
+    user_id: str,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
     """Get rides for a specific user - Flutter compatibility endpoint"""
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
     
-    rides = await rides_collection.find({
-        "$or": [
-            {"driver_id": ObjectId(user_id)},
-            {"passenger_id": ObjectId(user_id)}
-        ]
-    }).to_list(100)
+    try:
+        rides, next_cursor = await find_rides_for_user(rides_collection, ObjectId(user_id), clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    return {"rides": rides}
+    return mongo_json_response({"rides": [project(ride, Ride) for ride in rides], "next_cursor": next_cursor})
 
 @router.get("/user/{user_id}", response_model=dict)
-async def get_user_rides_by_id(user_id: str, user: User = Depends(fastapi_users.current_user)):
+async def get_user_rides_by_id(
+    user_id: str,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
     """Get rides for a specific user by ID in URL - Flutter compatibility endpoint"""
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
     
-    rides = await rides_collection.find({
-        "$or": [
-            {"driver_id": ObjectId(user_id)},
-            {"passenger_id": ObjectId(user_id)}
-        ]
-    }).to_list(100)
+    try:
+        rides, next_cursor = await find_rides_for_user(rides_collection, ObjectId(user_id), clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    return mongo_json_response({"rides": [project(ride, Ride) for ride in rides], "next_cursor": next_cursor})
+
+# Declared after the static GET routes (/my_rides, /active, /user) so they match first
+@router.get("/{ride_id}", response_model=Ride)
+async def get_ride_by_id(ride_id: str):
+    """Get a specific ride by ID"""
+    if not ObjectId.is_valid(ride_id):
+        raise HTTPException(status_code=400, detail="Invalid ride ID")
+    
+    ride = await rides_collection.find_one({"_id": ObjectId(ride_id)})
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    ride["current_passengers"] = live_passenger_count(ride)
     
-    return {"rides": rides}
+    return ride
 
 @router.post("/{ride_id}/accept", response_model=dict)
 async def accept_ride_passenger_endpoint(ride_id: str, passenger_id: str, user: User = Depends(fastapi_users.current_user)):
     """Accept a ride as a passenger - Flutter compatibility endpoint"""
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
+    if not ObjectId.is_valid(passenger_id):
+        raise HTTPException(status_code=400, detail="Invalid passenger ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "status": "active", "passenger_id": None})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or already accepted by a passenger")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"passenger_id": ObjectId(passenger_id), "status": "pending_driver_acceptance"}}
+    event = await transition(
+        rides_collection, ObjectId(ride_id), "pending_driver_acceptance",
+        scope={"passenger_id": None}, expected=["active"],
+        set_fields={"passenger_id": ObjectId(passenger_id)}, actor_id=user.id
     )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to accept ride as passenger")
+    if not event:
+        raise HTTPException(status_code=404, detail="Ride not found or already accepted by a passenger")
     
     return {"message": "Ride accepted by passenger successfully"}
 
@@ -274,25 +266,10 @@ async def update_ride_status_endpoint(ride_id: str, status: str, user: User = De
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    valid_statuses = ["picked_up", "dropped_off", "completed", "cancelled", "in_progress", "accepted", "pending"]
-    if status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
+    if status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {', '.join(STATUSES)}")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id)})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
-    
-    # Check if user is authorized to update this ride
-    if ride.get("driver_id") != user.id and ride.get("passenger_id") != user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this ride")
-    
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {"$set": {"status": status, "updated_at": datetime.utcnow()}}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to update ride status")
+    await apply_transition(ride_id, status, user.id, scope=participant_scope(user.id))
     
     return {"message": "Ride status updated successfully"}
 
@@ -314,6 +291,7 @@ async def delete_ride(ride_id: str, user: User = Depends(fastapi_users.current_u
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=400, detail="Failed to delete ride")
+    ride_match_index.remove(ride["_id"])
     
 @router.post("/{ride_id}/add-passenger", response_model=dict)
 async def add_passenger_to_ride(ride_id: str, passenger_id: str, user: User = Depends(fastapi_users.current_user)):
@@ -321,33 +299,12 @@ async def add_passenger_to_ride(ride_id: str, passenger_id: str, user: User = De
     if not ObjectId.is_valid(ride_id) or not ObjectId.is_valid(passenger_id):
         raise HTTPException(status_code=400, detail="Invalid ride or passenger ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "driver_id": user.id})
+    ride = await reserve_seat(rides_collection, ObjectId(ride_id), ObjectId(passenger_id), driver_id=user.id)
     if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or not authorized")
+        await raise_seat_conflict(ride_id, {"driver_id": user.id})
+    ride_match_index.add(ride)  # Drops it once the last seat is taken
     
-    if ride.get("current_passengers", 0) >= ride.get("max_passengers", 1):
-        raise HTTPException(status_code=400, detail="Ride is full")
-    
-    # Add passenger to the passengers list
-    passengers = ride.get("passengers", [])
-    if ObjectId(passenger_id) not in passengers:
-        passengers.append(ObjectId(passenger_id))
-        
-        result = await rides_collection.update_one(
-            {"_id": ObjectId(ride_id)},
-            {
-                "$set": {
-                    "passengers": passengers,
-                    "current_passengers": len(passengers),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(status_code=400, detail="Failed to add passenger")
-    
-    return {"message": "Passenger added successfully", "current_passengers": len(passengers)}
+    return {"message": "Passenger added successfully", "current_passengers": live_passenger_count(ride)}
 
 @router.post("/{ride_id}/remove-passenger", response_model=dict)
 async def remove_passenger_from_ride(ride_id: str, passenger_id: str, user: User = Depends(fastapi_users.current_user)):
@@ -355,29 +312,76 @@ async def remove_passenger_from_ride(ride_id: str, passenger_id: str, user: User
     if not ObjectId.is_valid(ride_id) or not ObjectId.is_valid(passenger_id):
         raise HTTPException(status_code=400, detail="Invalid ride or passenger ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), "driver_id": user.id})
+    ride = await release_seat(rides_collection, ObjectId(ride_id), ObjectId(passenger_id), driver_id=user.id)
+    if ride:
+        ride_match_index.add(ride)
+    else:
+        ride = await rides_collection.find_one(
+            {"_id": ObjectId(ride_id), "driver_id": user.id}, {"current_passengers": 1, "passengers": 1, "seat_holds": 1}
+        )
+        if not ride:
+            raise HTTPException(status_code=404, detail="Ride not found or not authorized")
+    
+    return {"message": "Passenger removed successfully", "current_passengers": live_passenger_count(ride)}
+
+@router.post("/{ride_id}/seats/hold", response_model=dict)
+async def hold_seat(ride_id: str, hold_seconds: int = settings.SEAT_HOLD_SECONDS,
+                    user: User = Depends(fastapi_users.current_user)):
+    """Hold a seat for the current user; it is released unless confirmed before it expires"""
+    if not ObjectId.is_valid(ride_id):
+        raise HTTPException(status_code=400, detail="Invalid ride ID")
+    hold_seconds = max(1, min(hold_seconds, settings.SEAT_HOLD_SECONDS))
+    
+    ride = await reserve_seat(rides_collection, ObjectId(ride_id), user.id, hold_seconds=hold_seconds)
     if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found or not authorized")
+        await raise_seat_conflict(ride_id)
+    ride_match_index.add(ride)
     
-    passengers = ride.get("passengers", [])
-    if ObjectId(passenger_id) in passengers:
-        passengers.remove(ObjectId(passenger_id))
-        
-        result = await rides_collection.update_one(
-            {"_id": ObjectId(ride_id)},
-            {
-                "$set": {
-                    "passengers": passengers,
-                    "current_passengers": len(passengers),
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(status_code=400, detail="Failed to remove passenger")
+    return {"message": "Seat held", "hold_seconds": hold_seconds, "current_passengers": live_passenger_count(ride)}
+
+@router.post("/{ride_id}/seats/confirm", response_model=dict)
+async def confirm_seat(ride_id: str, user: User = Depends(fastapi_users.current_user)):
+    """Confirm a held seat"""
+    if not ObjectId.is_valid(ride_id):
+        raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    return {"message": "Passenger removed successfully", "current_passengers": len(passengers)}
+    ride = await confirm_hold(rides_collection, ObjectId(ride_id), user.id)
+    if not ride:
+        raise HTTPException(status_code=409, detail="No active seat hold for this ride")
+    
+    return {"message": "Seat confirmed", "current_passengers": live_passenger_count(ride)}
+
+async def raise_seat_conflict(ride_id: str, scope: Optional[dict] = None):
+    """Explain why a seat reservation was refused (only runs on the failure path)"""
+    ride = await rides_collection.find_one({"_id": ObjectId(ride_id), **(scope or {})}, {"_id": 1})
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found or not authorized")
+    raise HTTPException(status_code=409, detail="Ride is full, closed, or already has this passenger")
+
+def load_quote(quote_token: Optional[str], user_id) -> Optional[dict]:
+    """Verified quote claims for a booking, None without a token"""
+    if not quote_token:
+        return None
+    try:
+        return read_quote(quote_token, user_id)
+    except InvalidQuote as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def participant_scope(user_id) -> dict:
+    """Filter terms limiting a ride update to its driver or passenger"""
+    return {"$or": [{"driver_id": user_id}, {"passenger_id": user_id}]}
+
+async def apply_transition(ride_id: str, status: str, user_id, scope: Optional[dict] = None,
+                           expected: Optional[List[str]] = None, set_fields: Optional[dict] = None):
+    """Run a ride state transition, turning a refusal into the matching HTTP error"""
+    event = await transition(
+        rides_collection, ObjectId(ride_id), status,
+        scope=scope, expected=expected, set_fields=set_fields, actor_id=user_id
+    )
+    if not event:
+        status_code, detail = await explain_failure(rides_collection, ObjectId(ride_id), status, scope)
+        raise HTTPException(status_code=status_code, detail=detail)
+    return event
 
 @router.post("/{ride_id}/cancel", response_model=dict)
 async def cancel_ride(ride_id: str, cancellation_reason: str, user: User = Depends(fastapi_users.current_user)):
@@ -385,31 +389,16 @@ async def cancel_ride(ride_id: str, cancellation_reason: str, user: User = Depen
     if not ObjectId.is_valid(ride_id):
         raise HTTPException(status_code=400, detail="Invalid ride ID")
     
-    ride = await rides_collection.find_one({"_id": ObjectId(ride_id)})
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
-    
-    # Check if user is authorized to cancel
-    if ride.get("driver_id") != user.id and ride.get("passenger_id") != user.id and user.id not in ride.get("passengers", []):
-        raise HTTPException(status_code=403, detail="Not authorized to cancel this ride")
-    
-    # Update ride status
-    result = await rides_collection.update_one(
-        {"_id": ObjectId(ride_id)},
-        {
-            "$set": {
-                "status": "cancelled",
-                "cancellation_reason": cancellation_reason,
-                "cancelled_by": user.id,
-                "cancelled_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
+    await apply_transition(
+        ride_id, "cancelled", user.id,
+        scope={"$or": [{"driver_id": user.id}, {"passenger_id": user.id}, {"passengers": user.id}]},
+        set_fields={
+            "cancellation_reason": cancellation_reason,
+            "cancelled_by": user.id,
+            "cancelled_at": datetime.utcnow()
         }
     )
     
-    if result.modified_count == 0:
-        raise HTTPException(status_code=400, detail="Failed to cancel ride")
-    
     return {"message": "Ride cancelled successfully"}
 
 @router.get("/{ride_id}/passengers", response_model=dict)
@@ -433,6 +422,6 @@ async def get_ride_passengers(ride_id: str, user: User = Depends(fastapi_users.c
     return {
         "ride_id": ride_id,
         "max_passengers": ride.get("max_passengers", 1),
-        "current_passengers": ride.get("current_passengers", 0),
+        "current_passengers": live_passenger_count(ride),
         "passenger_ids": [str(p) for p in passengers]
     }
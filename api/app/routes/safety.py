@@ -2,10 +2,13 @@ from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from app.schemas import EmergencyAlert, EmergencyType, PyObjectId
 from app.database import emergency_alerts_collection, rides_collection, user_profiles_collection
 from app.auth import User
+from app.loaders import Loaders, get_loaders
+from app.responses import mongo_json_response
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
 from fastapi_users import FastAPIUsers
 from app.auth import auth_backend, get_user_db
 import uuid
-from typing import List
+from typing import List, Optional
 from bson import ObjectId
 from datetime import datetime
 import smtplib
@@ -123,26 +126,31 @@ async def resolve_emergency_alert(
 
 @router.get("/emergency/active", response_model=List[EmergencyAlert])
 async def get_active_emergency_alerts(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
     user: User = Depends(fastapi_users.current_user)
 ):
-    """Get all active emergency alerts for rides the user is part of"""
+    """Get active emergency alerts for rides the user is part of"""
     # Find rides where the user is a participant
-    user_rides = await rides_collection.find({
+    ride_ids = await rides_collection.distinct("_id", {
         "$or": [
             {"driver_id": user.id},
             {"passenger_id": user.id}
         ]
-    }).to_list(100)
-    
-    ride_ids = [ride["_id"] for ride in user_rides]
+    })
     
     # Get active emergency alerts for these rides
-    active_alerts = await emergency_alerts_collection.find({
-        "ride_id": {"$in": ride_ids},
-        "status": "active"
-    }).to_list(100)
-    
-    return active_alerts
+    try:
+        active_alerts, next_cursor = await fetch_page(
+            emergency_alerts_collection,
+            {"ride_id": {"$in": ride_ids}, "status": "active"},
+            clamp_limit(limit),
+            cursor,
+            field="timestamp",
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(active_alerts, headers={NEXT_CURSOR_HEADER: next_cursor}, model=EmergencyAlert)
 
 @router.post("/panic-button", response_model=EmergencyAlert)
 async def trigger_panic_button(
@@ -191,7 +199,8 @@ async def trigger_panic_button(
 @router.get("/safety-check/{ride_id}", response_model=dict)
 async def perform_safety_check(
     ride_id: str,
-    user: User = Depends(fastapi_users.current_user)
+    user: User = Depends(fastapi_users.current_user),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """Perform a safety check for a ride"""
     if not ObjectId.is_valid(ride_id):
@@ -216,10 +225,9 @@ async def perform_safety_check(
     })
     
     # Get user profiles for safety verification
-    driver_profile = await user_profiles_collection.find_one({"user_id": ride["driver_id"]})
-    passenger_profile = None
-    if ride.get("passenger_id"):
-        passenger_profile = await user_profiles_collection.find_one({"user_id": ride["passenger_id"]})
+    driver_profile, passenger_profile = await loaders.user_profiles.load_many(
+        [ride["driver_id"], ride.get("passenger_id")]
+    )
     
     safety_status = {
         "ride_id": ride_id,
@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.schemas import ScheduledRide, PyObjectId
-from app.database import scheduled_rides_collection, rides_collection
+from app.database import scheduled_rides_collection, rides_collection, user_profiles_collection
+from app.communities import doc_mask
 from app.auth import User, fastapi_users
+from app.responses import mongo_json_response
+from app.ride_index import ride_match_index
+from app.pagination import DEFAULT_PAGE_SIZE, NEXT_CURSOR_HEADER, InvalidCursor, clamp_limit, fetch_page
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta
 import uuid
 
@@ -24,10 +28,17 @@ async def create_scheduled_ride(scheduled_ride: ScheduledRide, user: User = Depe
     return created_ride
 
 @router.get("/", response_model=List[ScheduledRide])
-async def get_scheduled_rides(user: User = Depends(fastapi_users.current_user)):
+async def get_scheduled_rides(
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    user: User = Depends(fastapi_users.current_user)
+):
     """Get scheduled rides for the current user"""
-    rides = await scheduled_rides_collection.find({"driver_id": user.id}).to_list(100)
-    return rides
+    try:
+        rides, next_cursor = await fetch_page(scheduled_rides_collection, {"driver_id": user.id}, clamp_limit(limit), cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return mongo_json_response(rides, headers={NEXT_CURSOR_HEADER: next_cursor}, model=ScheduledRide)
 
 @router.get("/{ride_id}", response_model=ScheduledRide)
 async def get_scheduled_ride_by_id(ride_id: str, user: User = Depends(fastapi_users.current_user)):
@@ -90,7 +101,8 @@ async def activate_scheduled_ride(ride_id: str, user: User = Depends(fastapi_use
     if not scheduled_ride:
         raise HTTPException(status_code=404, detail="Scheduled ride not found")
     
-    # Create an active ride from the scheduled ride
+    # Create an active ride from the scheduled ride, matchable like any other
+    profile = await user_profiles_collection.find_one({"user_id": user.id}, {"community_mask": 1, "communities": 1})
     active_ride_data = {
         "driver_id": scheduled_ride["driver_id"],
         "pickup": scheduled_ride["pickup"],
@@ -103,11 +115,14 @@ async def activate_scheduled_ride(ride_id: str, user: User = Depends(fastapi_use
         "vehicle_type": scheduled_ride.get("vehicle_type"),
         "amenities": scheduled_ride.get("amenities", []),
         "status": "active",
+        "passenger_id": None,
         "scheduled_time": scheduled_ride["scheduled_time"],
+        "driver_community_mask": doc_mask(profile, "communities"),
         "created_at": datetime.utcnow()
     }
     
     result = await rides_collection.insert_one(active_ride_data)
+    ride_match_index.add(active_ride_data)
     
     # Update scheduled ride status
     await scheduled_rides_collection.update_one(
@@ -0,0 +1,202 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from app.config import settings
+
+# Road distance and duration for pricing. Routes are cached per "corridor":
+# the pair of ROUTE_CACHE_CELL_DEG grid cells holding pickup and dropoff, so
+# nearby trips share one OSRM answer. Misses for all of a request's dropoffs
+# go to OSRM's table service in one call, bounded by ROUTE_LATENCY_BUDGET_MS;
+# past the budget the quote falls back to haversine x detour factor at an
+# average speed, both calibrated continuously against real OSRM answers, and
+# the late OSRM response still lands in the cache for the next quote.
+# `stats()` reports hit rates, latency percentiles and the fallback's error.
+#
+# Ride matching (/rides/find and the batch matcher) prices detours with the
+# same legs through `detours`, so both accept the same pairings.
+
+Corridor = Tuple[int, int, int, int]
+Point = Tuple[float, float]
+
+
+class RouteLeg(NamedTuple):
+    distance_km: float
+    duration_minutes: float
+    source: str  # "road" (OSRM, possibly cached) or "estimate" (fallback model)
+
+
+def haversine_km(a: List[float], b: List[float]) -> float:
+    """Great-circle distance between two [lat, lng] pairs"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+class RouteEstimator:
+    def __init__(self, osrm_url: str = settings.OSRM_URL,
+                 budget_ms: float = settings.ROUTE_LATENCY_BUDGET_MS,
+                 cell_deg: float = settings.ROUTE_CACHE_CELL_DEG,
+                 ttl_seconds: int = settings.ROUTE_CACHE_TTL_SECONDS,
+                 max_entries: int = settings.ROUTE_CACHE_MAX_ENTRIES):
+        self.osrm_url = osrm_url.rstrip("/")
+        self.budget_seconds = budget_ms / 1000
+        self.cell_deg = cell_deg
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Corridor, Tuple[float, float, float]]" = OrderedDict()  # -> (expires, km, min)
+        self._session = requests.Session()
+        # Fallback model, calibrated as OSRM answers arrive
+        self.detour_factor = settings.ROUTE_DETOUR_FACTOR
+        self.speed_kmh = settings.ROUTE_FALLBACK_SPEED_KMH
+        self._counts: Dict[str, int] = {"hits": 0, "misses": 0, "osrm_calls": 0, "osrm_failures": 0, "fallbacks": 0}
+        self._latencies_ms: Deque[float] = deque(maxlen=1000)
+        self._fallback_errors: Deque[float] = deque(maxlen=1000)
+
+    def corridor(self, pickup: List[float], dropoff: List[float]) -> Corridor:
+        c = self.cell_deg
+        return (math.floor(pickup[0] / c), math.floor(pickup[1] / c), math.floor(dropoff[0] / c), math.floor(dropoff[1] / c))
+
+    def fallback(self, pickup: List[float], dropoff: List[float]) -> RouteLeg:
+        distance_km = haversine_km(pickup, dropoff) * self.detour_factor
+        return RouteLeg(distance_km, distance_km / self.speed_kmh * 60, "estimate")
+
+    def _cached(self, key: Corridor) -> Optional[RouteLeg]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return RouteLeg(entry[1], entry[2], "road")
+
+    def _store(self, key: Corridor, distance_km: float, duration_minutes: float) -> None:
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, distance_km, duration_minutes)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _calibrate(self, pickup: List[float], dropoff: List[float], distance_km: float, duration_minutes: float) -> None:
+        """Score the fallback against a real answer, then nudge it toward it"""
+        straight = haversine_km(pickup, dropoff)
+        if straight < 0.5 or duration_minutes <= 0:
+            return  # Too short to say anything about detours or speed
+        estimate = self.fallback(pickup, dropoff)
+        self._fallback_errors.append(abs(estimate.distance_km - distance_km) / distance_km)
+        alpha = 0.05
+        self.detour_factor += alpha * (distance_km / straight - self.detour_factor)
+        self.speed_kmh += alpha * (distance_km / (duration_minutes / 60) - self.speed_kmh)
+
+    def _fetch(self, pickup: List[float], dropoffs: List[List[float]]) -> dict:
+        """Blocking OSRM table call: pickup as the only source, dropoffs as destinations"""
+        coords = ";".join(f"{lng},{lat}" for lat, lng in [pickup, *dropoffs])  # OSRM uses lng,lat
+        destinations = ";".join(str(i) for i in range(1, len(dropoffs) + 1))
+        url = f"{self.osrm_url}/table/v1/driving/{coords}?sources=0&destinations={destinations}&annotations=distance,duration"
+        response = self._session.get(url, timeout=settings.ROUTE_OSRM_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
+
+    async def _osrm(self, pickup: List[float], dropoffs: List[List[float]]) -> Dict[int, RouteLeg]:
+        """Fetch, cache and calibrate; keys are indexes into `dropoffs`"""
+        self._counts["osrm_calls"] += 1
+        started = time.perf_counter()
+        try:
+            data = await asyncio.to_thread(self._fetch, pickup, dropoffs)
+        except Exception:
+            self._counts["osrm_failures"] += 1
+            raise
+        self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        if data.get("code") != "Ok":
+            self._counts["osrm_failures"] += 1
+            raise ValueError(f"OSRM table failed: {data.get('code')}")
+
+        legs = {}
+        for i, (meters, seconds) in enumerate(zip(data["distances"][0], data["durations"][0])):
+            if meters is None or seconds is None:
+                continue  # Unroutable; the caller falls back
+            leg = RouteLeg(meters / 1000, seconds / 60, "road")
+            self._store(self.corridor(pickup, dropoffs[i]), leg.distance_km, leg.duration_minutes)
+            self._calibrate(pickup, dropoffs[i], leg.distance_km, leg.duration_minutes)
+            legs[i] = leg
+        return legs
+
+    async def routes(self, pickup: List[float], dropoffs: List[List[float]]) -> List[RouteLeg]:
+        """Road distance/duration from `pickup` to each dropoff, within the latency budget"""
+        legs: List[Optional[RouteLeg]] = [self._cached(self.corridor(pickup, d)) for d in dropoffs]
+        missing = [i for i, leg in enumerate(legs) if leg is None]
+        self._counts["hits"] += len(dropoffs) - len(missing)
+        self._counts["misses"] += len(missing)
+
+        if missing and self.budget_seconds > 0:
+            # Shielded so a fetch that overruns the budget still fills the cache
+            fetch = asyncio.ensure_future(self._osrm(pickup, [dropoffs[i] for i in missing]))
+            fetch.add_done_callback(lambda f: f.cancelled() or f.exception())  # Don't warn on late failures
+            try:
+                fetched = await asyncio.wait_for(asyncio.shield(fetch), self.budget_seconds)
+            except Exception:
+                fetched = {}
+            for j, leg in fetched.items():
+                legs[missing[j]] = leg
+
+        result = []
+        for i, leg in enumerate(legs):
+            if leg is None:
+                self._counts["fallbacks"] += 1
+                leg = self.fallback(pickup, dropoffs[i])
+            result.append(leg)
+        return result
+
+    async def detours(self, trips: List[Tuple[List[float], List[float], List[float], List[float]]]) -> List[Tuple[float, str]]:
+        """Extra driving seconds for each (ride start, ride end, pickup, dropoff) and the legs' source
+
+        start -> pickup -> dropoff -> end is compared with start -> end. Legs
+        sharing an origin go out as one `routes` call, so a batch of trips
+        costs one OSRM table call per distinct origin on a cache miss. The
+        source is "estimate" if any leg came from the fallback model.
+        """
+        wanted: Dict[Point, Dict[Point, None]] = {}
+        for start, end, pickup, dropoff in trips:
+            for a, b in ((start, pickup), (pickup, dropoff), (dropoff, end), (start, end)):
+                wanted.setdefault(tuple(a), {})[tuple(b)] = None
+        origins = list(wanted)
+        answers = await asyncio.gather(*(self.routes(list(o), [list(d) for d in wanted[o]]) for o in origins))
+        legs = {(o, d): leg for o, found in zip(origins, answers) for d, leg in zip(wanted[o], found)}
+
+        result = []
+        for start, end, pickup, dropoff in trips:
+            via = [legs[tuple(a), tuple(b)] for a, b in ((start, pickup), (pickup, dropoff), (dropoff, end))]
+            direct = legs[tuple(start), tuple(end)]
+            seconds = max(0.0, sum(leg.duration_minutes for leg in via) - direct.duration_minutes) * 60
+            source = "road" if all(leg.source == "road" for leg in (*via, direct)) else "estimate"
+            result.append((seconds, source))
+        return result
+
+    def stats(self) -> dict:
+        """Cache effectiveness, OSRM latency and how far off the fallback model runs"""
+        latencies = sorted(self._latencies_ms)
+        errors = self._fallback_errors
+
+        def percentile(p: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
+
+        lookups = self._counts["hits"] + self._counts["misses"]
+        return {
+            **self._counts,
+            "cache_entries": len(self._cache),
+            "cache_hit_rate": round(self._counts["hits"] / lookups, 3) if lookups else None,
+            "osrm_latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+            "latency_budget_ms": self.budget_seconds * 1000,
+            "fallback_model": {
+                "detour_factor": round(self.detour_factor, 3),
+                "speed_kmh": round(self.speed_kmh, 1),
+                "mean_abs_distance_error": round(sum(errors) / len(errors), 3) if errors else None,
+            },
+        }
+
+
+route_estimator = RouteEstimator()
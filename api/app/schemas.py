@@ -73,6 +73,8 @@ class UserProfile(BaseModel):
     rating: float = 0.0
     total_rides: int = 0
     is_verified: bool = False
+    communities: List[str] = []
+    community_mask: int = 0  # bitmask of communities, see app.communities
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime]
 
@@ -129,6 +131,8 @@ class RideRequest(BaseModel):
     max_detour_minutes: int = 10
     community_filter: bool = False  # For community-based matching
     preferred_driver_id: Optional[PyObjectId] = None
+    departure_time: Optional[datetime] = None  # Enables time-window matching
+    time_window_minutes: int = 30  # +/- around departure_time
 
 
 ### Driver Route Schema ###
@@ -252,6 +256,7 @@ class RideAnalytics(BaseModel):
 class CommunityFilter(BaseModel):
     user_id: PyObjectId
     preferred_communities: List[str]  # e.g., ["university", "workplace", "neighborhood"]
+    community_mask: int = 0  # bitmask of preferred_communities, see app.communities
     max_distance_km: float = 10.0
     trust_score_threshold: float = 3.0
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -306,7 +311,7 @@ class RidePreferences(BaseModel):
 
 ### Pricing and Cost Estimation ###
 class PricingEstimate(BaseModel):
-    ride_id: PyObjectId
+    ride_id: Optional[PyObjectId] = None  # Set once the quote is booked
     base_price: float
     distance_km: float
     estimated_duration_minutes: int
@@ -316,6 +321,13 @@ class PricingEstimate(BaseModel):
     final_price: float
     breakdown: dict  # Detailed price breakdown
     estimated_at: datetime = Field(default_factory=datetime.utcnow)
+    quote_token: Optional[str] = None  # Signed quote to pass when booking
+    quote_expires_at: Optional[datetime] = None
+
+class BatchQuoteRequest(BaseModel):
+    pickup_coords: List[float]  # [latitude, longitude]
+    dropoffs: List[List[float]]  # one [latitude, longitude] per destination
+    ride_types: Optional[List[str]] = None  # defaults to every ride type
 
 ### Driver Earnings ###
 class DriverEarnings(BaseModel):
@@ -364,7 +376,9 @@ class Notification(BaseModel):
     is_read: bool = False
     priority: str = "normal"  # low, normal, high, urgent
     ride_id: Optional[PyObjectId] = None
+    count: int = 1  # events coalesced into this notification
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = None  # latest coalesced event
     read_at: Optional[datetime] = None
 
     class Config:
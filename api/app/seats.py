@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+# Seat reservation for multi-passenger rides. Each reservation is a single
+# conditional find_one_and_update: the filter is the capacity guard and the
+# update adds the passenger, so concurrent accepts can never overbook a ride.
+#
+# A seat can be taken as a short-lived hold (`seat_holds` entry with an
+# expiry) that the passenger later confirms. Expired holds still sit in
+# `passengers`; every reservation discounts them in its capacity check and
+# drops them in the same write (an update pipeline, since $addToSet/$inc alone
+# can't prune by expiry), so no sweeper is needed. The stored
+# current_passengers is only as fresh as the last write, so readers go through
+# `live_passenger_count`.
+
+# Rides that still take passengers
+OPEN_STATUSES = ["active", "pending_driver_acceptance", "confirmed"]
+
+
+def _holds():
+    return {"$ifNull": ["$seat_holds", []]}
+
+
+def _expired_ids(now: datetime):
+    return {"$map": {
+        "input": {"$filter": {"input": _holds(), "cond": {"$lte": ["$$this.expires_at", now]}}},
+        "in": "$$this.passenger_id",
+    }}
+
+
+def _live_passengers(now: datetime):
+    """`passengers` minus those whose hold has expired"""
+    return {"$setDifference": [{"$ifNull": ["$passengers", []]}, _expired_ids(now)]}
+
+
+def live_passenger_count(ride: dict, now: Optional[datetime] = None) -> int:
+    """Seats taken right now: `passengers` minus those whose hold has expired"""
+    if "passengers" not in ride:
+        return ride.get("current_passengers", 0)
+    now = now or datetime.utcnow()
+    expired = [hold["passenger_id"] for hold in ride.get("seat_holds") or [] if hold["expires_at"] <= now]
+    return sum(1 for passenger_id in ride["passengers"] if passenger_id not in expired)
+
+
+async def reserve_seat(collection, ride_id, passenger_id, hold_seconds: Optional[int] = None,
+                       driver_id=None) -> Optional[dict]:
+    """Atomically take a seat for `passenger_id`.
+
+    With `hold_seconds` the seat is held until confirmed or expired. Pass
+    `driver_id` to also require the ride to belong to that driver. Returns the
+    updated ride, or None if it is missing, closed, full or already has them.
+    """
+    now = datetime.utcnow()
+    live = _live_passengers(now)
+    query = {
+        "_id": ride_id,
+        "status": {"$in": OPEN_STATUSES},
+        "$expr": {"$and": [
+            {"$lt": [{"$size": live}, {"$ifNull": ["$max_passengers", 1]}]},
+            {"$not": [{"$in": [passenger_id, live]}]},
+            {"$ne": [{"$ifNull": ["$passenger_id", None]}, passenger_id]},
+        ]},
+    }
+    if driver_id is not None:
+        query["driver_id"] = driver_id
+
+    new_holds = []
+    if hold_seconds:
+        new_holds = [{"passenger_id": passenger_id, "expires_at": now + timedelta(seconds=hold_seconds)}]
+    update = [
+        {"$set": {
+            "passengers": {"$concatArrays": [live, [passenger_id]]},
+            "seat_holds": {"$concatArrays": [
+                {"$filter": {"input": _holds(), "cond": {"$gt": ["$$this.expires_at", now]}}},
+                new_holds,
+            ]},
+            "updated_at": now,
+        }},
+        {"$set": {"current_passengers": {"$size": "$passengers"}}},
+    ]
+    return await collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+
+async def confirm_hold(collection, ride_id, passenger_id) -> Optional[dict]:
+    """Turn an unexpired hold into a booked seat"""
+    now = datetime.utcnow()
+    return await collection.find_one_and_update(
+        {"_id": ride_id, "seat_holds": {"$elemMatch": {"passenger_id": passenger_id, "expires_at": {"$gt": now}}}},
+        {"$pull": {"seat_holds": {"passenger_id": passenger_id}}, "$set": {"updated_at": now}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def release_seat(collection, ride_id, passenger_id, driver_id=None) -> Optional[dict]:
+    """Give a passenger's seat (booked or unexpired hold) back; None if they don't have one"""
+    now = datetime.utcnow()
+    live = _live_passengers(now)
+    query = {"_id": ride_id, "passengers": passenger_id, "$expr": {"$in": [passenger_id, live]}}
+    if driver_id is not None:
+        query["driver_id"] = driver_id
+    update = [
+        {"$set": {
+            "passengers": {"$setDifference": [live, [passenger_id]]},
+            "seat_holds": {"$filter": {
+                "input": _holds(),
+                "cond": {"$and": [
+                    {"$gt": ["$$this.expires_at", now]},
+                    {"$ne": ["$$this.passenger_id", passenger_id]},
+                ]},
+            }},
+            "updated_at": now,
+        }},
+        # Recounted rather than decremented, so the counter can't drift
+        {"$set": {"current_passengers": {"$size": "$passengers"}}},
+    ]
+    return await collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import orjson
+from bson import Decimal128, ObjectId
+
+# Fast JSON encoding for Mongo documents, shared by the FastAPI and Flask
+# stacks. orjson walks dicts/lists and encodes datetime, UUID and GeoJSON
+# (plain dicts/lists of floats) natively in C; only BSON-specific types fall
+# back to `_default`, so there is no Python-level recursive copy per document.
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value) -> bytes:
+    """Encode `value` (documents, lists of documents, ...) to JSON bytes"""
+    return orjson.dumps(value, default=_default, option=_OPTIONS)
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+def rename_id(doc: dict) -> dict:
+    """Shallow copy of `doc` with `_id` exposed as a string `id`"""
+    if not doc:
+        return {}
+    doc = dict(doc)
+    if doc.get("_id") is not None:
+        doc["id"] = str(doc.pop("_id"))
+    return doc
@@ -0,0 +1,104 @@
+import asyncio
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+
+# Demand/supply surge pricing. Passengers looking for a ride (demand) and
+# drivers that are online, i.e. pinging locations or offering rides (supply),
+# are counted per grid cell over a sliding window of SURGE_WINDOW_SECONDS.
+# Each user counts once, in the cell they were last seen in, so repeated
+# searches don't inflate demand. Every SURGE_TICK_SECONDS the engine turns
+# each cell's demand/supply ratio into a multiplier, exponentially smoothed so
+# prices don't jump between ticks, and publishes the whole grid at once. Quotes read
+# the published grid: a dict lookup, no database access.
+#
+# Counters are per process; each API process prices from the traffic it sees.
+
+Cell = Tuple[int, int]
+
+
+class SurgeEngine:
+    def __init__(self, cell_deg: float = settings.SURGE_CELL_DEG,
+                 window_seconds: int = settings.SURGE_WINDOW_SECONDS,
+                 tick_seconds: float = settings.SURGE_TICK_SECONDS,
+                 smoothing: float = settings.SURGE_SMOOTHING,
+                 sensitivity: float = settings.SURGE_SENSITIVITY,
+                 max_multiplier: float = settings.SURGE_MAX_MULTIPLIER):
+        self.cell_deg = cell_deg
+        self.window_seconds = window_seconds
+        self.tick_seconds = tick_seconds
+        self.smoothing = smoothing
+        self.sensitivity = sensitivity
+        self.max_multiplier = max_multiplier
+        # user -> (last cell, last seen)
+        self._riders: Dict[object, Tuple[Cell, float]] = {}
+        self._drivers: Dict[object, Tuple[Cell, float]] = {}
+        # Published on each tick: cell -> (multiplier, demand/supply ratio)
+        self._grid: Dict[Cell, Tuple[float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def cell(self, coords: List[float]) -> Cell:
+        return (math.floor(coords[0] / self.cell_deg), math.floor(coords[1] / self.cell_deg))
+
+    def record_demand(self, user_id, coords: List[float]) -> None:
+        """Note a passenger looking for a ride from `coords` ([lat, lng])"""
+        self._riders[user_id] = (self.cell(coords), time.monotonic())
+
+    def record_driver(self, driver_id, coords: List[float]) -> None:
+        """Note an online driver's latest position"""
+        self._drivers[driver_id] = (self.cell(coords), time.monotonic())
+
+    @staticmethod
+    def _count(seen: Dict[object, Tuple[Cell, float]], cutoff: float) -> Dict[Cell, int]:
+        """Users per cell seen since `cutoff`; older entries leave the window"""
+        counts: Dict[Cell, int] = {}
+        for user_id, (cell, last_seen) in list(seen.items()):
+            if last_seen < cutoff:
+                del seen[user_id]
+            else:
+                counts[cell] = counts.get(cell, 0) + 1
+        return counts
+
+    def quote(self, coords: List[float]) -> Tuple[float, float]:
+        """(surge multiplier, demand/supply ratio) for the cell containing `coords`"""
+        return self._grid.get(self.cell(coords), (1.0, 0.0))
+
+    def tick(self) -> None:
+        """Slide the window and publish a freshly smoothed multiplier grid"""
+        cutoff = time.monotonic() - self.window_seconds
+        demand = self._count(self._riders, cutoff)
+        supply = self._count(self._drivers, cutoff)
+
+        grid: Dict[Cell, Tuple[float, float]] = {}
+        for cell in set(demand) | set(supply) | set(self._grid):
+            ratio = demand.get(cell, 0) / max(supply.get(cell, 0), 1)
+            target = min(self.max_multiplier, max(1.0, 1.0 + self.sensitivity * (ratio - 1.0)))
+            previous = self._grid.get(cell, (1.0, 0.0))[0]
+            multiplier = previous + self.smoothing * (target - previous)
+            # Snap once within a cent of the target so rounding can't stall the decay
+            multiplier = target if abs(multiplier - target) < 0.01 else round(multiplier, 2)
+            if multiplier > 1.0 or cell in demand or cell in supply:
+                grid[cell] = (multiplier, ratio)
+        self._grid = grid
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"Surge engine tick failed: {e}")
+
+
+surge_engine = SurgeEngine()
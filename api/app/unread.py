@@ -0,0 +1,151 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from app.config import settings
+from app.database import notification_state_collection, notifications_collection
+
+# Unread notification counters. Each user's count lives on a
+# notification_state document ({"user_id", "unread"}) and is moved by the
+# notification writes themselves (create, mark read, mark all read, delete),
+# so /notifications/unread-count is a point read, and within
+# NOTIFICATION_UNREAD_CACHE_SECONDS not even that: counts are cached per
+# process and dropped whenever this process changes them.
+#
+# Counter updates are not in the same write as the notification, so a crash
+# in between can leave a counter off by a few, and the retention TTL index
+# expires unread notifications without touching counters at all. The
+# reconciler recounts from the notifications themselves at startup and every
+# NOTIFICATION_RECONCILE_SECONDS.
+
+CACHE_MAX_ENTRIES = 100_000
+
+
+def _adjust_pipeline(delta: int) -> list:
+    """Add `delta` to the counter without letting it go below zero"""
+    return [{"$set": {
+        "unread": {"$max": [0, {"$add": [{"$ifNull": ["$unread", 0]}, delta]}]},
+        "updated_at": datetime.utcnow(),
+    }}]
+
+
+class UnreadCounter:
+    def __init__(self, ttl_seconds: float = settings.NOTIFICATION_UNREAD_CACHE_SECONDS,
+                 reconcile_seconds: float = settings.NOTIFICATION_RECONCILE_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self._cache: Dict[str, Tuple[float, int]] = {}  # user id -> (expires, count)
+        self._task: Optional[asyncio.Task] = None
+
+    async def get(self, user_id) -> int:
+        key = str(user_id)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        state = await notification_state_collection.find_one({"user_id": user_id}, {"unread": 1})
+        if state is None:
+            # First read for this user: seed the counter from their notifications
+            count = await notifications_collection.count_documents({"to_user_id": user_id, "is_read": False})
+            await notification_state_collection.update_one(
+                {"user_id": user_id}, {"$setOnInsert": {"unread": count, "updated_at": datetime.utcnow()}}, upsert=True
+            )
+        else:
+            count = state.get("unread", 0)
+        if len(self._cache) >= CACHE_MAX_ENTRIES:
+            self._cache.clear()
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, count)
+        return count
+
+    async def adjust(self, deltas: Dict[object, int]) -> None:
+        """Apply per-user unread deltas in one bulk write"""
+        ops = [
+            UpdateOne({"user_id": user_id}, _adjust_pipeline(delta), upsert=True)
+            for user_id, delta in deltas.items() if delta
+        ]
+        if not ops:
+            return
+        await notification_state_collection.bulk_write(ops, ordered=False)
+        for user_id in deltas:
+            self._cache.pop(str(user_id), None)
+
+    async def add(self, user_id, delta: int) -> None:
+        await self.adjust({user_id: delta})
+
+    async def recount(self, user_ids) -> None:
+        """Reset the given users' counters from their notifications (after bulk deletes)"""
+        user_ids = list(user_ids)
+        actual = {
+            row["_id"]: row["unread"]
+            async for row in notifications_collection.aggregate([
+                {"$match": {"to_user_id": {"$in": user_ids}, "is_read": False}},
+                {"$group": {"_id": "$to_user_id", "unread": {"$sum": 1}}},
+            ])
+        }
+        await notification_state_collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id},
+                {"$set": {"unread": actual.get(user_id, 0), "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            for user_id in user_ids
+        ], ordered=False)
+        for user_id in user_ids:
+            self._cache.pop(str(user_id), None)
+
+    async def reconcile(self) -> int:
+        """Recount every counter from the notifications; returns how many were fixed
+
+        Counters adjusted while the recount runs are left alone until the next pass.
+        """
+        started = datetime.utcnow()
+        actual = {
+            row["_id"]: row["unread"]
+            async for row in notifications_collection.aggregate([
+                {"$match": {"is_read": False}},
+                {"$group": {"_id": "$to_user_id", "unread": {"$sum": 1}}},
+            ], allowDiskUse=True)
+        }
+        ops = []
+        async for state in notification_state_collection.find({}, {"user_id": 1, "unread": 1}):
+            count = actual.pop(state["user_id"], 0)
+            if state.get("unread", 0) != count:
+                ops.append(UpdateOne(
+                    {"_id": state["_id"], "updated_at": {"$lt": started}},
+                    {"$set": {"unread": count, "updated_at": datetime.utcnow()}}
+                ))
+        for user_id, count in actual.items():
+            ops.append(UpdateOne(
+                {"user_id": user_id},
+                {"$setOnInsert": {"unread": count, "updated_at": datetime.utcnow()}},
+                upsert=True
+            ))
+        for start in range(0, len(ops), 1000):
+            await notification_state_collection.bulk_write(ops[start:start + 1000], ordered=False)
+        self._cache.clear()
+        return len(ops)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                fixed = await self.reconcile()
+                if fixed:
+                    print(f"Unread counters reconciled: {fixed} corrected")
+            except Exception as e:
+                print(f"Unread counter reconciliation failed: {e}")
+            await asyncio.sleep(self.reconcile_seconds)
+
+
+unread_counter = UnreadCounter()
@@ -1,6 +1,8 @@
 from datetime import datetime
 from bson import ObjectId
 
+from app.serialization import rename_id
+
 
 def to_serializable(value):
     if isinstance(value, ObjectId):
@@ -14,14 +16,13 @@ def to_serializable(value):
     return value
 
 
+# The Flask JSON provider (app.flask_app.MongoJSONProvider) encodes ObjectId
+# and datetime values itself, so the helpers below only copy the top level
+# instead of rebuilding every nested dict/list with `to_serializable`.
+
 def serialize_doc(doc: dict) -> dict:
-    return to_serializable(doc or {})
+    return dict(doc or {})
 
 
 def serialize_with_renamed_id(doc: dict) -> dict:
-    if not doc:
-        return {}
-    doc = dict(doc)
-    if doc.get("_id") is not None:
-        doc["id"] = str(doc.pop("_id"))
-    return to_serializable(doc)
+    return rename_id(doc)
@@ -0,0 +1,67 @@
+import os
+import sys
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateMany, UpdateOne
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.communities import community_mask, doc_mask
+
+load_dotenv()
+
+BATCH_SIZE = 1000
+
+
+def _flush(collection, ops):
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return []
+
+
+def backfill_masks(collection, names_field):
+    """Set community_mask from the stored name list on every document"""
+    ops, updated = [], 0
+    for doc in collection.find({}, {names_field: 1}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"community_mask": community_mask(doc.get(names_field))}}))
+        updated += 1
+        if len(ops) >= BATCH_SIZE:
+            ops = _flush(collection, ops)
+    _flush(collection, ops)
+    return updated
+
+
+def backfill_ride_masks(db):
+    """Copy each driver's mask onto their open rides"""
+    ops, updated = [], 0
+    for profile in db.user_profiles.find({}, {"user_id": 1, "community_mask": 1, "communities": 1}):
+        ops.append(UpdateMany(
+            {"driver_id": profile["user_id"], "status": {"$in": ["active", "scheduled"]}},
+            {"$set": {"driver_community_mask": doc_mask(profile, "communities")}},
+        ))
+        updated += 1
+        if len(ops) >= BATCH_SIZE:
+            ops = _flush(db.rides, ops)
+    _flush(db.rides, ops)
+    # Rides whose driver has no profile still need the field to be matchable by $bitsAnySet
+    db.rides.update_many({"driver_community_mask": {"$exists": False}}, {"$set": {"driver_community_mask": 0}})
+    return updated
+
+
+def run_backfill():
+    mongodb_url = os.getenv("MONGODB_URL")
+    mongodb_db = os.getenv("MONGODB_DB")
+
+    if not mongodb_url or not mongodb_db:
+        print("MONGODB_URL and MONGODB_DB environment variables must be set.")
+        return
+
+    db = MongoClient(mongodb_url)[mongodb_db]
+    print(f"user_profiles: {backfill_masks(db.user_profiles, 'communities')} updated")
+    print(f"community_filters: {backfill_masks(db.community_filters, 'preferred_communities')} updated")
+    print(f"rides: masks copied from {backfill_ride_masks(db)} driver profiles")
+
+
+if __name__ == "__main__":
+    run_backfill()
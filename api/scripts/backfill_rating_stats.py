@@ -0,0 +1,78 @@
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ratings import category_key
+
+load_dotenv()
+
+BATCH_SIZE = 1000
+
+
+def _flush(collection, ops):
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return []
+
+
+def build_rating_stats(feedback):
+    """rating_stats per user from one server-side pass over all feedback"""
+    stats = {}
+    pipeline = [{"$group": {
+        "_id": {"user_id": "$to_user_id", "category": {"$ifNull": ["$category", "general"]}, "rating": "$rating"},
+        "count": {"$sum": 1},
+    }}]
+    for row in feedback.aggregate(pipeline, allowDiskUse=True):
+        key, count = row["_id"], row["count"]
+        rating, category = key["rating"], category_key(key["category"])
+        user = stats.setdefault(key["user_id"], {"count": 0, "sum": 0, "stars": {}, "categories": {}})
+        user["count"] += count
+        user["sum"] += rating * count
+        user["stars"][str(rating)] = user["stars"].get(str(rating), 0) + count
+        cat = user["categories"].setdefault(category, {"count": 0, "sum": 0})
+        cat["count"] += count
+        cat["sum"] += rating * count
+    return stats
+
+
+def backfill_rating_stats(db):
+    """Rebuild rating_stats, rating and total_rides on every rated profile"""
+    ops, updated = [], 0
+    for user_id, stats in build_rating_stats(db.feedback).items():
+        ops.append(UpdateOne(
+            {"user_id": user_id},
+            {"$set": {
+                "rating_stats": stats,
+                "rating": round(stats["sum"] / stats["count"], 2),
+                "total_rides": stats["count"],
+                "updated_at": datetime.utcnow(),
+            }},
+            upsert=True,
+        ))
+        updated += 1
+        if len(ops) >= BATCH_SIZE:
+            ops = _flush(db.user_profiles, ops)
+    _flush(db.user_profiles, ops)
+    return updated
+
+
+def run_backfill():
+    mongodb_url = os.getenv("MONGODB_URL")
+    mongodb_db = os.getenv("MONGODB_DB")
+
+    if not mongodb_url or not mongodb_db:
+        print("MONGODB_URL and MONGODB_DB environment variables must be set.")
+        return
+
+    db = MongoClient(mongodb_url)[mongodb_db]
+    print(f"user_profiles: rating_stats rebuilt for {backfill_rating_stats(db)} users")
+
+
+if __name__ == "__main__":
+    run_backfill()
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.routing import RouteEstimator, haversine_km
+
+# Route lookups behind price quotes (/pricing/estimate, /pricing/quotes), with
+# and without the corridor cache. Both estimators get a budget long enough to
+# always wait for OSRM, so every uncached quote pays a table call and the
+# fallback model never kicks in. By default OSRM is a local stub answering
+# after --osrm-latency-ms; pass --osrm-url to measure a real server instead.
+
+QUOTE_COUNT = 200
+REPEAT = 5
+CENTER = (51.5074, -0.1278)  # London
+
+
+class StubOSRM(BaseHTTPRequestHandler):
+    """Table service answering with haversine x 1.3 at 30 km/h after a fixed delay"""
+    latency_seconds = 0.025
+
+    def do_GET(self):
+        time.sleep(self.latency_seconds)
+        coords = self.path.split("/")[4].split("?")[0]
+        points = [[float(lat), float(lng)] for lng, lat in (pair.split(",") for pair in coords.split(";"))]
+        km = [haversine_km(points[0], p) * 1.3 for p in points[1:]]
+        body = json.dumps({
+            "code": "Ok",
+            "distances": [[d * 1000 for d in km]],
+            "durations": [[d / 30 * 3600 for d in km]],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_trips(count, seed=42):
+    rng = random.Random(seed)
+    trips = []
+    for _ in range(count):
+        pickup = [CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.15, 0.15)]
+        dropoff = [CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.15, 0.15)]
+        trips.append((pickup, dropoff))
+    return trips
+
+
+async def quote_all(estimator, trips):
+    """One route lookup per quote, as estimate_ride_price does; returns per-quote latencies in ms"""
+    latencies = []
+    for pickup, dropoff in trips:
+        started = time.perf_counter()
+        await estimator.routes(pickup, [dropoff])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def summarize(name, latencies):
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print(f"{name:>8}: {mean:8.3f} ms mean, {p95:8.3f} ms p95 per quote")
+    return mean
+
+
+async def run_benchmark(osrm_url):
+    trips = make_trips(QUOTE_COUNT)
+    uncached = RouteEstimator(osrm_url, budget_ms=60_000, max_entries=0)
+    cached = RouteEstimator(osrm_url, budget_ms=60_000)
+    await quote_all(cached, trips)  # Warm the corridors
+
+    results = {}
+    for name, estimator in (("uncached", uncached), ("cached", cached)):
+        latencies = []
+        for _ in range(REPEAT):
+            latencies.extend(await quote_all(estimator, trips))
+        results[name] = summarize(name, latencies)
+        stats = estimator.stats()
+        print(f"{'':>8}  hit rate {stats['cache_hit_rate']}, {stats['osrm_calls']} OSRM calls, {stats['fallbacks']} fallbacks")
+    print(f"speedup: {results['uncached'] / results['cached']:.0f}x over {QUOTE_COUNT * REPEAT} quotes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cached vs uncached route lookups for price quotes")
+    parser.add_argument("--osrm-url", help="Real OSRM server to query (default: local stub)")
+    parser.add_argument("--osrm-latency-ms", type=float, default=25.0, help="Stub OSRM response delay")
+    args = parser.parse_args()
+
+    server = None
+    osrm_url = args.osrm_url
+    if osrm_url is None:
+        StubOSRM.latency_seconds = args.osrm_latency_ms / 1000
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubOSRM)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        osrm_url = f"http://127.0.0.1:{server.server_port}"
+        print(f"stub OSRM at {osrm_url}, {args.osrm_latency_ms:g} ms per table call")
+    try:
+        asyncio.run(run_benchmark(osrm_url))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
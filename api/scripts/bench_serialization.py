@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.serialization import dumps, rename_id
+from app.utils import to_serializable
+
+DOC_COUNT = 1000
+REPEAT = 20
+
+
+def make_rides(count):
+    now = datetime.utcnow()
+    rides = []
+    for i in range(count):
+        rides.append({
+            "_id": ObjectId(),
+            "driver_id": ObjectId(),
+            "passenger_id": ObjectId(),
+            "passenger_ids": [ObjectId() for _ in range(3)],
+            "status": "active",
+            "pickup": "King's Cross",
+            "dropoff": "Canary Wharf",
+            "pickup_location": {"type": "Point", "coordinates": [-0.1246, 51.5308]},
+            "dropoff_location": {"type": "Point", "coordinates": [-0.0235, 51.5054]},
+            "pickup_time": now + timedelta(minutes=i),
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now,
+            "max_passengers": 4,
+            "current_passengers": 1,
+            "price_per_seat": 7.5,
+            "co2_saved": 1.2,
+        })
+    return rides
+
+
+def legacy(rides):
+    """The old path: recursive to_serializable copy, then stdlib json"""
+    docs = []
+    for ride in rides:
+        doc = dict(ride)
+        doc["id"] = str(doc.pop("_id"))
+        docs.append(to_serializable(doc))
+    return json.dumps(docs).encode()
+
+
+def fast(rides):
+    """Shallow _id rename, then orjson with BSON fallbacks"""
+    return dumps([rename_id(ride) for ride in rides])
+
+
+def run_benchmark():
+    rides = make_rides(DOC_COUNT)
+    assert json.loads(legacy(rides)) == json.loads(fast(rides))
+
+    results = {}
+    for name, fn in (("legacy", legacy), ("fast", fast)):
+        best = min(timeit.repeat(lambda: fn(rides), number=1, repeat=REPEAT))
+        results[name] = best
+        print(f"{name:>6}: {best * 1000:8.2f} ms per {DOC_COUNT} rides")
+    print(f"speedup: {results['legacy'] / results['fast']:.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
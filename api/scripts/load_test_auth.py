@@ -0,0 +1,98 @@
+import os
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Login-storm load test against a running Flask API (e.g. `make docker-up`).
+#
+# Samples POST /location/update latency on its own, then again while
+# LOGIN_CONCURRENCY threads hammer POST /auth/login. With bcrypt offloaded to
+# the bounded hashing pool the location percentiles should stay close to the
+# baseline, and excess logins should come back as fast 503s instead of queueing.
+
+BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
+LOGIN_CONCURRENCY = int(os.getenv("LOGIN_CONCURRENCY", "32"))
+PHASE_SECONDS = float(os.getenv("PHASE_SECONDS", "15"))
+LOCATION_INTERVAL = float(os.getenv("LOCATION_INTERVAL", "0.05"))  # seconds between location updates
+
+
+def register_user():
+    email = f"loadtest-{uuid.uuid4().hex[:12]}@example.com"
+    password = "load-test-password"
+    res = requests.post(f"{BASE_URL}/auth/register", json={"name": "Load Test", "email": email, "password": password})
+    res.raise_for_status()
+    body = res.json()
+    return email, password, body["access_token"], body["user"]["id"]
+
+
+def sample_location_latency(token, user_id, stop):
+    """Send location updates until `stop` is set; return latencies in ms"""
+    latencies = []
+    headers = {"Authorization": f"Bearer {token}"}
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        session.post(
+            f"{BASE_URL}/location/update",
+            json={"user_id": user_id, "coordinates": [-0.1246, 51.5308]},
+            headers=headers,
+            timeout=30,
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(LOCATION_INTERVAL)
+    return latencies
+
+
+def login_storm(email, password, stop, counts, lock):
+    session = requests.Session()
+    while not stop.is_set():
+        try:
+            status = session.post(f"{BASE_URL}/auth/login", json={"email": email, "password": password}, timeout=30).status_code
+        except requests.RequestException:
+            status = "error"
+        with lock:
+            counts[status] = counts.get(status, 0) + 1
+
+
+def run_phase(token, user_id, email=None, password=None):
+    stop = threading.Event()
+    counts = {}
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=LOGIN_CONCURRENCY + 1) as pool:
+        sampler = pool.submit(sample_location_latency, token, user_id, stop)
+        if email:
+            for _ in range(LOGIN_CONCURRENCY):
+                pool.submit(login_storm, email, password, stop, counts, lock)
+        time.sleep(PHASE_SECONDS)
+        stop.set()
+        latencies = sampler.result()
+    return latencies, counts
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        print(f"{label:>12}: no samples")
+        return
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) >= 20 else latencies[-1]
+    print(f"{label:>12}: n={len(latencies)} p50={statistics.median(latencies):.1f}ms p95={p95:.1f}ms max={latencies[-1]:.1f}ms")
+
+
+def run_load_test():
+    email, password, token, user_id = register_user()
+    print(f"Testing {BASE_URL} with {LOGIN_CONCURRENCY} login threads, {PHASE_SECONDS:.0f}s per phase")
+
+    baseline, _ = run_phase(token, user_id)
+    storm, counts = run_phase(token, user_id, email, password)
+
+    report("baseline", baseline)
+    report("login storm", storm)
+    print(f"login responses: {dict(sorted(counts.items(), key=lambda kv: str(kv[0])))}")
+
+
+if __name__ == "__main__":
+    run_load_test()
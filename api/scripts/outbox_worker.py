@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import os
+import sys
+
+from dotenv import load_dotenv
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+load_dotenv()
+
+# Importing the routers registers their outbox handlers
+from app.routes import environmental, feedback, notifications, pricing  # noqa: E402,F401
+from app.outbox import OutboxWorker  # noqa: E402
+
+
+async def run(concurrency: int, poll_seconds: float):
+    """Process the outbox until interrupted"""
+    worker = OutboxWorker(concurrency, poll_seconds)
+    worker.start()
+    print(f"Outbox worker running with {concurrency} tasks")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await worker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run outbox side-effect workers outside the API process")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--poll-seconds", type=float, default=1.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.concurrency, args.poll_seconds))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+from pymongo import InsertOne, MongoClient, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.earnings import rollup_increment
+from app.routes.pricing import ride_earnings
+
+load_dotenv()
+
+# Nightly driver payout batch.
+#
+# 1. Accrue: completed rides that have no earnings record yet (rides closed
+#    before the ride.completed outbox handler existed, or whose event failed)
+#    get one, bulk inserted; the unique ride_id index turns a ride booked
+#    meanwhile (e.g. by the outbox handler) into a duplicate key error.
+# 2. Pay out: pending earnings created up to the run's cutoff are grouped per
+#    driver server-side; each chunk of drivers gets a payout record and its
+#    earnings marked paid with bulk_write.
+#
+# Progress is checkpointed in `payout_runs` (one document per run id, by
+# default the date) after every chunk, so a crashed run resumes after the
+# last settled driver with the same cutoff. Payout records are upserted per
+# (run, driver) and only pending earnings are marked, so replaying a chunk
+# is harmless. --dry-run reports what would happen without writing anything.
+
+CHUNK_SIZE = 500  # drivers per bulk_write
+PAYMENT_METHOD = "bank_transfer"
+
+
+def accrue_missing_earnings(db, dry_run=False):
+    """Create earnings for completed rides that don't have any"""
+    pipeline = [
+        {"$match": {"status": "completed", "driver_id": {"$ne": None}}},
+        {"$lookup": {
+            "from": "driver_earnings",
+            "localField": "_id",
+            "foreignField": "ride_id",
+            "as": "earnings",
+        }},
+        {"$match": {"earnings": {"$size": 0}}},
+        {"$project": {"driver_id": 1, "total_price": 1, "total_distance_km": 1}},
+    ]
+    batch, accrued = [], 0
+    for ride in db.rides.aggregate(pipeline, allowDiskUse=True):
+        accrued += 1
+        if dry_run:
+            continue
+        batch.append(ride_earnings(ride))
+        if len(batch) >= CHUNK_SIZE:
+            _book(db, batch)
+            batch = []
+    if batch:
+        _book(db, batch)
+    return accrued
+
+
+def _book(db, batch):
+    """Insert earnings; rides already booked are skipped and only new ones go into the daily rollup"""
+    try:
+        db.driver_earnings.bulk_write([InsertOne(earnings) for earnings in batch], ordered=False)
+        booked = batch
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        duplicates = {error["index"] for error in errors}
+        booked = [earnings for index, earnings in enumerate(batch) if index not in duplicates]
+    rollup = [UpdateOne(*rollup_increment(earnings), upsert=True) for earnings in booked]
+    if rollup:
+        db.driver_earnings_daily.bulk_write(rollup, ordered=False)
+
+
+def pending_by_driver(db, cutoff, after_driver_id=None):
+    """Pending earnings up to `cutoff` per driver, in driver order"""
+    match = {"payment_status": "pending", "created_at": {"$lte": cutoff}}
+    if after_driver_id is not None:
+        match["driver_id"] = {"$gt": after_driver_id}
+    return db.driver_earnings.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": "$driver_id",
+            "amount": {"$sum": "$net_earnings"},
+            "earnings_ids": {"$push": "$_id"},
+        }},
+        {"$sort": {"_id": 1}},
+    ], allowDiskUse=True)
+
+
+def settle_chunk(db, run_id, drivers, now):
+    """Record payouts for a chunk of drivers and mark their earnings paid"""
+    db.driver_payouts.bulk_write([
+        UpdateOne(
+            {"run_id": run_id, "driver_id": driver["_id"]},
+            {"$setOnInsert": {
+                "amount": driver["amount"],
+                "earnings_count": len(driver["earnings_ids"]),
+                "payment_method": PAYMENT_METHOD,
+                "status": "pending",
+                "created_at": now,
+            }},
+            upsert=True,
+        )
+        for driver in drivers
+    ], ordered=False)
+    db.driver_earnings.bulk_write([
+        UpdateMany(
+            {"_id": {"$in": driver["earnings_ids"]}, "payment_status": "pending"},
+            {"$set": {
+                "payment_status": "paid",
+                "payout_date": now,
+                "payment_method": PAYMENT_METHOD,
+                "payout_run": run_id,
+            }},
+        )
+        for driver in drivers
+    ], ordered=False)
+
+
+def run_payouts(db, run_id, dry_run=False):
+    """Pay every driver with pending earnings, resuming a checkpointed run"""
+    now = datetime.utcnow()
+    run = db.payout_runs.find_one({"_id": run_id})
+    if run and run["status"] == "completed":
+        print(f"Payout run {run_id} already completed")
+        return run
+    if run is None:
+        run = {"_id": run_id, "status": "running", "cutoff": now, "last_driver_id": None,
+               "drivers_paid": 0, "amount_paid": 0.0, "started_at": now}
+        if not dry_run:
+            db.payout_runs.insert_one(run)
+    elif not dry_run:
+        print(f"Resuming payout run {run_id} after driver {run['last_driver_id']}")
+
+    chunk = []
+
+    def flush():
+        last_driver_id = chunk[-1]["_id"]
+        run["drivers_paid"] += len(chunk)
+        run["amount_paid"] += sum(driver["amount"] for driver in chunk)
+        run["last_driver_id"] = last_driver_id
+        if not dry_run:
+            settle_chunk(db, run_id, chunk, now)
+            db.payout_runs.update_one({"_id": run_id}, {"$set": {
+                "last_driver_id": last_driver_id,
+                "drivers_paid": run["drivers_paid"],
+                "amount_paid": run["amount_paid"],
+                "updated_at": datetime.utcnow(),
+            }})
+        chunk.clear()
+
+    for driver in pending_by_driver(db, run["cutoff"], run["last_driver_id"]):
+        chunk.append(driver)
+        if len(chunk) >= CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+
+    run["status"] = "completed"
+    if not dry_run:
+        db.payout_runs.update_one({"_id": run_id}, {"$set": {"status": "completed", "finished_at": datetime.utcnow()}})
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accrue missing earnings and pay out pending driver earnings")
+    parser.add_argument("--run-id", default=datetime.utcnow().strftime("%Y-%m-%d"),
+                        help="Checkpoint key; rerunning the same id resumes it (default: today's date)")
+    parser.add_argument("--dry-run", action="store_true", help="Report totals without writing")
+    parser.add_argument("--skip-accrual", action="store_true", help="Only pay out existing earnings")
+    args = parser.parse_args()
+
+    mongodb_url = os.getenv("MONGODB_URL")
+    mongodb_db = os.getenv("MONGODB_DB")
+
+    if not mongodb_url or not mongodb_db:
+        print("MONGODB_URL and MONGODB_DB environment variables must be set.")
+        return
+
+    db = MongoClient(mongodb_url)[mongodb_db]
+    mode = " (dry run)" if args.dry_run else ""
+    if not args.skip_accrual:
+        print(f"driver_earnings: {accrue_missing_earnings(db, args.dry_run)} completed rides accrued{mode}")
+    run = run_payouts(db, args.run_id, args.dry_run)
+    print(f"payout run {args.run_id}: {run['drivers_paid']} drivers, {run['amount_paid']:.2f} paid{mode}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import sys
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.earnings import rebuild_rollup_pipeline
+
+load_dotenv()
+
+
+def run_rebuild():
+    mongodb_url = os.getenv("MONGODB_URL")
+    mongodb_db = os.getenv("MONGODB_DB")
+
+    if not mongodb_url or not mongodb_db:
+        print("MONGODB_URL and MONGODB_DB environment variables must be set.")
+        return
+
+    db = MongoClient(mongodb_url)[mongodb_db]
+    # $merge needs the unique (driver_id, day) index the API creates on startup
+    db.driver_earnings_daily.create_index([("driver_id", 1), ("day", 1)], unique=True)
+    db.driver_earnings.aggregate(rebuild_rollup_pipeline(), allowDiskUse=True)
+    print(f"driver_earnings_daily: {db.driver_earnings_daily.count_documents({})} driver/day buckets")
+
+
+if __name__ == "__main__":
+    run_rebuild()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Add the parent directory to the path to allow imports from the `api` module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.seats import reserve_seat
+
+load_dotenv()
+
+# Concurrency check for seat reservation: fires CONCURRENT_ACCEPTS
+# simultaneous reserve_seat calls at one ride and verifies it is never
+# overbooked, then checks that expired holds free their seats.
+
+CONCURRENT_ACCEPTS = int(os.getenv("CONCURRENT_ACCEPTS", "500"))
+SEATS = int(os.getenv("SEATS", "4"))
+
+
+async def hammer(rides, ride_id, hold_seconds=None):
+    results = await asyncio.gather(*(
+        reserve_seat(rides, ride_id, ObjectId(), hold_seconds=hold_seconds)
+        for _ in range(CONCURRENT_ACCEPTS)
+    ))
+    return sum(1 for r in results if r is not None)
+
+
+async def run_contention_test():
+    mongodb_url = os.getenv("MONGODB_URL")
+    mongodb_db = os.getenv("MONGODB_DB")
+
+    if not mongodb_url or not mongodb_db:
+        print("MONGODB_URL and MONGODB_DB environment variables must be set.")
+        return False
+
+    client = AsyncIOMotorClient(mongodb_url, maxPoolSize=100)
+    rides = client[mongodb_db].rides
+    ride_id = (await rides.insert_one({
+        "driver_id": ObjectId(),
+        "pickup": "seat-contention-test",
+        "dropoff": "seat-contention-test",
+        "status": "active",
+        "max_passengers": SEATS,
+        "current_passengers": 0,
+        "passengers": [],
+        "created_at": datetime.utcnow(),
+    })).inserted_id
+
+    try:
+        won = await hammer(rides, ride_id)
+        ride = await rides.find_one({"_id": ride_id})
+        booked = len(ride["passengers"])
+        print(f"{CONCURRENT_ACCEPTS} concurrent accepts for {SEATS} seats: {won} succeeded, "
+              f"{booked} passengers stored, current_passengers={ride['current_passengers']}")
+        ok = won == booked == ride["current_passengers"] == SEATS
+
+        # Replace every seat with a 1s hold, let them lapse, and book again
+        await rides.update_one({"_id": ride_id}, {"$set": {"passengers": [], "current_passengers": 0}})
+        held = await hammer(rides, ride_id, hold_seconds=1)
+        await asyncio.sleep(1.5)
+        rebooked = await hammer(rides, ride_id)
+        ride = await rides.find_one({"_id": ride_id})
+        print(f"holds: {held} taken, {rebooked} rebooked after expiry, "
+              f"{len(ride['passengers'])} passengers stored, {len(ride.get('seat_holds', []))} holds left")
+        ok = ok and held == rebooked == len(ride["passengers"]) == SEATS and not ride.get("seat_holds")
+    finally:
+        await rides.delete_one({"_id": ride_id})
+
+    print("PASS" if ok else "FAIL: ride was overbooked or seats leaked")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(run_contention_test()) else 1)